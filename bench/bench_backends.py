@@ -0,0 +1,96 @@
+"""
+比較各推理後端的準確度與速度。
+
+準確度以 eager 後端為基準，在固定圖片集（img/apple*.jpg 加上固定亂數種子產生的合成圖）上
+比較 top-1 一致率與機率的最大絕對誤差；速度量測批次 1 的延遲與批次 8 的吞吐量。
+
+用法：
+    python bench/bench_backends.py [--backends eager,int8,torchscript,compile,onnx] [--threads 4] [--json]
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from image_recognition import get_model  # noqa: E402
+from inference_backends import BACKENDS, create_backend  # noqa: E402
+
+
+def fixed_image_set(synthetic_count=16, seed=0):
+    """img/ 內的範例圖片加上固定種子的合成圖片，確保每次比較的輸入相同。"""
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob(os.path.join(ROOT, "img", "apple*.jpg")))]
+    generator = torch.Generator().manual_seed(seed)
+    for _ in range(synthetic_count):
+        pixels = (torch.rand(224, 224, 3, generator=generator) * 255).to(torch.uint8).numpy()
+        images.append(Image.fromarray(pixels))
+    return images
+
+
+def time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    model, processor = get_model()
+    pixel_values = processor(images=fixed_image_set(), return_tensors="pt")["pixel_values"]
+    single, batch = pixel_values[:1], pixel_values[:8]
+
+    reference = None
+    results = {}
+    for name in ["eager"] + [n for n in args.backends.split(",") if n != "eager"]:
+        try:
+            backend = create_backend(model, name, num_threads=args.threads)
+        except Exception as e:
+            print(f"略過 {name}：{e}", file=sys.stderr)
+            continue
+        # 預熱（compile 後端會在此編譯）
+        backend.predict(single)
+        backend.predict(batch)
+
+        probs = backend.predict(pixel_values).softmax(dim=1)
+        if reference is None:
+            reference = probs
+        latency = time_calls(lambda: backend.predict(single), args.repeat)
+        batch_times = time_calls(lambda: backend.predict(batch), max(1, args.repeat // 4))
+        results[name] = {
+            "top1_agreement": (probs.argmax(dim=1) == reference.argmax(dim=1)).float().mean().item(),
+            "max_abs_prob_diff": (probs - reference).abs().max().item(),
+            "latency_p50_ms": statistics.median(latency) * 1000,
+            "latency_p95_ms": sorted(latency)[int(len(latency) * 0.95) - 1] * 1000,
+            "throughput_img_s": len(batch) / statistics.median(batch_times),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'backend':<12}{'top1 一致':>10}{'最大誤差':>10}{'p50 ms':>10}{'p95 ms':>10}{'img/s (b=8)':>14}")
+    for name, row in results.items():
+        print(
+            f"{name:<12}{row['top1_agreement']:>10.1%}{row['max_abs_prob_diff']:>10.4f}"
+            f"{row['latency_p50_ms']:>10.1f}{row['latency_p95_ms']:>10.1f}{row['throughput_img_s']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+比較圖片前處理兩種路徑的延遲與峰值記憶體（RSS）：
+
+- tempfile：舊流程，附件寫入暫存檔 → 重新開檔全尺寸解碼 → 轉 RGB → 刪檔
+- bytes：新流程，直接從記憶體位元組解碼，JPEG 使用 draft 模式縮小解碼
+
+只量測解碼到 224x224 的部分，不需要載入模型。
+
+用法：
+    python bench/bench_decode.py [--repeat 20] [--width 4000 --height 3000]
+"""
+import argparse
+import glob
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+from PIL import Image  # noqa: E402
+
+
+def make_samples(width, height):
+    """產生測試圖片：img/ 內的範例加上一張模擬手機拍攝的大圖。"""
+    samples = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "img", "*.jpg"))):
+        with open(path, "rb") as f:
+            samples[os.path.basename(path)] = f.read()
+    # 雜訊圖壓縮率差，檔案大小接近真實照片
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    samples[f"synthetic_{width}x{height}.jpg"] = buffer.getvalue()
+    return samples
+
+
+def decode_tempfile(data):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+        temp_file.write(data)
+        temp_file_path = temp_file.name
+    try:
+        image = Image.open(temp_file_path).convert("RGB")
+    finally:
+        os.unlink(temp_file_path)
+    return image.resize((224, 224))
+
+
+def decode_bytes(data):
+    from image_recognition import load_image_bytes
+
+    return load_image_bytes(data).resize((224, 224))
+
+
+def run_mode(mode, samples, repeat, out):
+    decode = decode_tempfile if mode == "tempfile" else decode_bytes
+    result = {}
+    for name, data in samples.items():
+        decode(data)  # 預熱
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decode(data)
+        result[name] = (time.perf_counter() - start) / repeat * 1000
+    # Linux 上 ru_maxrss 單位為 KB
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    out.put(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    samples = make_samples(args.width, args.height)
+    results = {}
+    # 每種路徑各自在獨立行程執行，峰值 RSS 才不會互相影響
+    ctx = multiprocessing.get_context("spawn")
+    for mode in ("tempfile", "bytes"):
+        out = ctx.Queue()
+        proc = ctx.Process(target=run_mode, args=(mode, samples, args.repeat, out))
+        proc.start()
+        results[mode] = out.get()
+        proc.join()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'圖片':<32}{'tempfile (ms)':>16}{'bytes (ms)':>14}{'加速':>8}")
+    for name in samples:
+        old, new = results["tempfile"][name], results["bytes"][name]
+        print(f"{name:<32}{old:>16.2f}{new:>14.2f}{old / new:>7.1f}x")
+    print(f"{'peak RSS (MB)':<32}{results['tempfile']['peak_rss_mb']:>16.1f}{results['bytes']['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
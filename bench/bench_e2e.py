@@ -0,0 +1,324 @@
+"""
+離線端對端壓測：不需要 Discord Token 與 Gemini API Key。
+
+- 以假的 commands.Context / 附件 / Interaction 驅動 analyze_main、handle_ask 與下拉選單流程
+- Gemini 換成可設定延遲的本地假模型（仍經過 llm_client 的限流、並行上限與快取）
+- 圖片使用 img/ 範例加上隨機變形的變體（變體不會命中辨識快取）
+- 依序以多個並行度重播負載，回報吞吐量、延遲百分位數（含第一個 embed 出現的時間）、各階段耗時、最高 RSS 與事件迴圈延遲
+
+用法：
+    python bench/bench_e2e.py [--concurrency 1,4,16] [--requests 64] [--mix analyze=0.6,ask=0.3,onboard=0.1]
+                              [--llm-ms 800] [--llm-jitter-ms 200] [--stub-model-ms 0] [--no-stream] [--json]
+
+--stub-model-ms 大於 0 時圖像模型也換成固定延遲的假模型，只量測機器人本身的流程開銷。
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))  # 與測試共用假的 Discord 物件（discord_fakes.py）
+
+# 所有寫入都導向暫存目錄，不影響正式的使用者紀錄與快取
+WORK_DIR = tempfile.mkdtemp(prefix="bench_e2e_")
+os.environ.setdefault("USER_DB_FILE", os.path.join(WORK_DIR, "user_log.db"))
+os.environ.setdefault("USER_LEGACY_LOG_FILE", "")
+os.environ.setdefault("LLM_CACHE_FILE", os.path.join(WORK_DIR, "llm_cache.db"))
+os.environ.setdefault("FOOD_RECOGNITION_CACHE_PERSIST", "0")
+os.environ.setdefault("ONBOARDING_SESSION_PERSIST", "0")
+
+from PIL import Image  # noqa: E402
+
+import discord_handler  # noqa: E402
+import image_recognition  # noqa: E402
+import llm_client  # noqa: E402
+from discord_fakes import FakeAttachment, FakeContext, FakeInteraction, failed, monitor_loop_lag  # noqa: E402
+from metrics import metrics  # noqa: E402
+from nutrition import _load  # noqa: E402
+
+IMG_DIR = os.path.join(ROOT, "img")
+QUESTIONS = ["香蕉熱量多少?", "吃宵夜會變胖嗎", "一天要喝多少水", "減肥可以吃白飯嗎", "雞胸肉的蛋白質有多少", "珍珠奶茶熱量高嗎"]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 0.5) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+    }
+
+
+# ---- 假的模型 ----
+
+STUB_REPLY = "多吃蔬菜、少喝含糖飲料，晚餐份量減半。"
+STUB_CHUNKS = 8  # 串流時把回應切成幾段
+
+
+class StubGeminiModel:
+    """
+    取代 GenerativeModel：等待設定的延遲後回傳固定文字。
+
+    stream=True 時第一段在延遲的 1/4 後送出，其餘各段平均分散在剩下的時間。
+    """
+
+    def __init__(self, latency, jitter):
+        self.latency = latency
+        self.jitter = jitter
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        latency = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if not stream:
+            await asyncio.sleep(latency)
+            return SimpleNamespace(text=STUB_REPLY)
+        return self._stream(latency)
+
+    async def _stream(self, latency):
+        size = -(-len(STUB_REPLY) // STUB_CHUNKS)
+        await asyncio.sleep(latency / 4)
+        for i in range(0, len(STUB_REPLY), size):
+            if i:
+                await asyncio.sleep(latency * 3 / 4 / (STUB_CHUNKS - 1))
+            yield SimpleNamespace(text=STUB_REPLY[i:i + size])
+
+
+def install_stub_gemini(latency, jitter):
+    llm_client.gemini_client = llm_client.GeminiClient(
+        model_factory=lambda name: StubGeminiModel(latency, jitter),
+        rate_per_minute=1e9,
+        burst=1_000_000,
+        max_pending=1_000_000,
+    )
+
+
+def install_stub_model(latency):
+    """圖像模型換成固定延遲的假模型，每張圖隨機給一個類別 0.8 的機率（標籤取自營養資料）。"""
+    labels, _ = _load()
+    rest = 0.2 / (len(labels) - 1)
+
+    def predict(images):
+        time.sleep(latency)
+        results = []
+        for _ in images:
+            probs = [rest] * len(labels)
+            probs[random.randrange(len(labels))] = 0.8
+            results.append(probs)
+        return results
+
+    image_recognition.batcher.predict_fn = predict
+    discord_handler.get_labels = lambda: labels
+
+
+# ---- 測試圖片 ----
+
+def load_images(generated, seed=0):
+    """img/ 範例圖片，加上由範例隨機裁切、翻轉、旋轉產生的變體（沒有範例時用雜訊圖）。"""
+    images = []
+    if os.path.isdir(IMG_DIR):
+        for name in sorted(os.listdir(IMG_DIR)):
+            if name.lower().endswith(("png", "jpg", "jpeg")):
+                with open(os.path.join(IMG_DIR, name), "rb") as f:
+                    images.append((name, f.read()))
+    rng = random.Random(seed)
+    sources = [Image.open(io.BytesIO(data)).convert("RGB") for _, data in images]
+    for i in range(generated):
+        if sources:
+            image = rng.choice(sources)
+            width, height = image.size
+            scale = rng.uniform(0.7, 0.95)
+            left, top = rng.randrange(int(width * (1 - scale)) + 1), rng.randrange(int(height * (1 - scale)) + 1)
+            image = image.crop((left, top, left + int(width * scale), top + int(height * scale))).rotate(rng.uniform(-15, 15))
+            if rng.random() < 0.5:
+                image = image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        else:
+            image = Image.effect_noise((640, 480), rng.uniform(20, 80)).convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        images.append((f"generated{i}.jpg", buffer.getvalue()))
+    return images
+
+
+# ---- 使用流程 ----
+
+async def flow_analyze(user_id, images, rng):
+    """!analyze → 選擇目標（GoalSelect）→ analyze_main。"""
+    name, data = rng.choice(images)
+    ctx = FakeContext(user_id, [FakeAttachment(name, data)])
+    await discord_handler.handle_analyze(ctx)
+    view = discord_handler.GoalSelect(ctx)
+    await discord_handler.GoalSelect.select_callback(view, SimpleNamespace(values=[rng.choice(["healthy", "weight_loss"])]), FakeInteraction(ctx.author))
+    return ctx.channel
+
+
+async def flow_ask(user_id, images, rng):
+    ctx = FakeContext(user_id)
+    question = rng.choice(QUESTIONS)
+    # 約一半是新問題，避免全部命中快取
+    if rng.random() < 0.5:
+        question += f"（{rng.randrange(1_000_000)}）"
+    await discord_handler.handle_ask(ctx, question)
+    return ctx.channel
+
+
+async def flow_onboard(user_id, images, rng):
+    """身高、體重下拉選單（HeightSelect → WeightSelect）。"""
+    ctx = FakeContext(user_id)
+    interaction = FakeInteraction(ctx.author)
+    height = rng.choice(discord_handler.HEIGHT_OPTIONS)
+    weight = rng.choice(discord_handler.WEIGHT_OPTIONS)
+    view = discord_handler.HeightSelect(str(user_id), ctx.author.name)
+    await discord_handler.HeightSelect.select_callback(view, SimpleNamespace(values=[height]), interaction)
+    view = discord_handler.WeightSelect(str(user_id), ctx.author.name, int(height))
+    await discord_handler.WeightSelect.select_callback(view, SimpleNamespace(values=[weight]), interaction)
+    return ctx.channel
+
+
+FLOWS = {"analyze": flow_analyze, "ask": flow_ask, "onboard": flow_onboard}
+
+
+async def run_level(concurrency, requests, mix, images, users, seed):
+    rng = random.Random(seed)
+    plan = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    latencies = {name: [] for name in mix}
+    first_embed = {name: [] for name in mix}  # 使用者看到第一個 embed 的時間（串流模式的體感延遲）
+    errors = {name: 0 for name in mix}
+    lag = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+    metrics.timings.clear()
+    metrics.counters.clear()
+
+    cursor = iter(enumerate(plan))
+
+    async def worker():
+        for i, name in cursor:
+            user_id = 100000 + i % users
+            start = time.perf_counter()
+            try:
+                channel = await FLOWS[name](user_id, images, rng)
+                if failed(channel):
+                    errors[name] += 1
+                shown = [message.created for message in channel.sent if message.embed is not None]
+                if shown:
+                    first_embed[name].append(shown[0] - start)
+            except Exception:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    snapshot = metrics.snapshot()
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed,
+        "latency": {name: summarize(samples) for name, samples in latencies.items()},
+        "first_embed": {name: summarize(samples) for name, samples in first_embed.items() if samples},
+        "errors": errors,
+        "loop_lag": {"max_ms": max(lag, default=0.0) * 1000, **summarize(lag)},
+        "stages": snapshot["stages"],
+        "counters": snapshot["counters"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+async def run(args):
+    mix = {}
+    for part in args.mix.split(","):
+        name, weight = part.split("=")
+        if name not in FLOWS:
+            raise SystemExit(f"未知的流程：{name}（可用：{', '.join(FLOWS)}）")
+        mix[name] = float(weight)
+
+    install_stub_gemini(args.llm_ms / 1000, args.llm_jitter_ms / 1000)
+    discord_handler.LLM_STREAM = not args.no_stream
+    if args.stub_model_ms > 0:
+        install_stub_model(args.stub_model_ms / 1000)
+    images = load_images(args.generated_images)
+
+    # 先讓所有虛擬使用者有身高體重，analyze 流程才會直接進入選擇目標
+    for u in range(args.users):
+        discord_handler.set_user_basic(str(100000 + u), f"bench{100000 + u}", 170, 65)
+
+    # 預熱：模型載入不計入第一個並行度的結果
+    start = time.perf_counter()
+    await flow_analyze(100000, images, random.Random(args.seed))
+    warm_up_seconds = time.perf_counter() - start
+
+    # 每個並行度使用不同的亂數種子，問題與圖片順序不會完全重複前一輪（快取仍保持溫熱，與線上一致）
+    levels = []
+    for i, concurrency in enumerate(int(c) for c in args.concurrency.split(",")):
+        levels.append(await run_level(concurrency, args.requests, mix, images, args.users, args.seed + i + 1))
+    return {
+        "config": {
+            "mix": mix,
+            "llm_ms": args.llm_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "stub_model_ms": args.stub_model_ms,
+            "stream": not args.no_stream,
+            "images": len(images),
+            "users": args.users,
+        },
+        "warm_up_seconds": warm_up_seconds,
+        "levels": levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16", help="依序執行的並行度")
+    parser.add_argument("--requests", type=int, default=64, help="每個並行度的請求數")
+    parser.add_argument("--mix", default="analyze=0.6,ask=0.3,onboard=0.1")
+    parser.add_argument("--users", type=int, default=50, help="虛擬使用者數")
+    parser.add_argument("--generated-images", type=int, default=16)
+    parser.add_argument("--llm-ms", type=float, default=800, help="假 Gemini 的平均延遲")
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--stub-model-ms", type=float, default=0, help="> 0 時圖像模型改用固定延遲的假模型")
+    parser.add_argument("--no-stream", action="store_true", help="關閉串流回覆（等完整回應才送出）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    print(f"預熱（含模型載入）：{results['warm_up_seconds']:.2f}s")
+    print(f"{'並行度':>6}{'吞吐量 (req/s)':>16}{'analyze p95 (ms)':>18}{'首個 embed p95':>16}{'ask p95 (ms)':>14}{'迴圈延遲 max (ms)':>18}{'RSS (MB)':>10}")
+    for level in results["levels"]:
+        latency = level["latency"]
+        analyze_p95 = latency.get("analyze", {}).get("p95_ms", 0.0)
+        first_p95 = level["first_embed"].get("analyze", {}).get("p95_ms", 0.0)
+        ask_p95 = latency.get("ask", {}).get("p95_ms", 0.0)
+        print(
+            f"{level['concurrency']:>6}{level['throughput_rps']:>16.2f}{analyze_p95:>18.0f}{first_p95:>16.0f}{ask_p95:>14.0f}"
+            f"{level['loop_lag']['max_ms']:>18.1f}{level['peak_rss_mb']:>10.0f}"
+        )
+        failed = {name: count for name, count in level["errors"].items() if count}
+        if failed:
+            print(f"{'':>6}錯誤：{failed}")
+
+
+if __name__ == "__main__":
+    main()
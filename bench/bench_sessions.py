@@ -0,0 +1,142 @@
+"""
+以模擬時鐘量測引導流程暫存（session_store.SessionStore）在大量使用者進出時的項目數。
+
+每個模擬秒有 --rate 位使用者開始填寫身高，其中 --complete 比例會在期限內選完體重，
+其餘中途放棄；同時每秒有 --messages 則一般訊息觸發 on_message 的查詢。背景清除每
+--sweep-interval 秒執行一次。比較：
+
+- 舊做法（普通 dict，只有完成時才刪除）最後留下的項目數
+- SessionStore 的最大項目數，應不超過 min(上限, rate ×（TTL + 清除間隔）)
+
+另外以實際時間、開啟存檔的情況量測大量項目下 get / set 的單次延遲（set 只標記待存檔），
+對照舊做法「每次寫入都同步存檔」與一次背景存檔的耗時。
+
+過期、上限與重新載入的正確性由 tests/test_session_store.py 檢查。
+
+用法：
+    python bench/bench_sessions.py [--seconds 3600] [--rate 20] [--complete 0.3] [--max-entries 10000] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+# 只影響模組層級的 onboarding_sessions（避免寫入專案的 cache/）；以下量測自行建立的 SessionStore 都會存檔
+os.environ.setdefault("ONBOARDING_SESSION_PERSIST", "0")
+
+from session_store import SESSION_TTL, SessionStore  # noqa: E402
+
+
+class SimulatedClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def churn(args):
+    rng = random.Random(args.seed)
+    clock = SimulatedClock()
+    store = SessionStore(ttl=args.ttl, max_entries=args.max_entries, clock=clock)
+    legacy = {}
+    finishing = []  # (完成時間, user_id)
+    peak = 0
+    next_user = 0
+    for second in range(args.seconds):
+        clock.now += 1
+        for _ in range(args.rate):
+            user_id = str(next_user)
+            next_user += 1
+            data = {"step": "height", "user_name": f"user{user_id}"}
+            store.set(user_id, data)
+            legacy[user_id] = data
+            if rng.random() < args.complete:
+                finishing.append((clock.now + rng.uniform(1, args.ttl * 0.9), user_id))
+        # 在期限內完成的流程：選完體重後刪除
+        still = []
+        for done_at, user_id in finishing:
+            if done_at > clock.now:
+                still.append((done_at, user_id))
+            else:
+                # 舊做法完成時一定會刪除；SessionStore 中的流程可能已因上限被淘汰
+                legacy.pop(user_id, None)
+                if store.get(user_id) is not None:
+                    store.pop(user_id)
+        finishing = still
+        for _ in range(args.messages):
+            store.get(str(rng.randrange(max(1, next_user * 2))))
+        if second % args.sweep_interval == 0:
+            store.sweep()
+        peak = max(peak, len(store))
+    bound = min(args.max_entries, args.rate * (args.ttl + args.sweep_interval))
+    return {"users": next_user, "legacy_entries": len(legacy), "peak_entries": peak, "final_entries": len(store), "bound": bound}
+
+
+def measure_latency(size, repeat=100_000, sync_repeat=200):
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_sessions_"), "sessions.json")
+
+    async def run():
+        store = SessionStore(ttl=SESSION_TTL, max_entries=size, path=path)
+        for i in range(size):
+            store.set(str(i), {"step": "height", "user_name": "bench"})
+        keys = [str(random.randrange(size * 2)) for _ in range(repeat)]
+        start = time.perf_counter()
+        for key in keys:
+            store.get(key)
+        get_us = (time.perf_counter() - start) / repeat * 1e6
+        start = time.perf_counter()
+        for key in keys:
+            store.set(key, {"step": "weight", "user_name": "bench", "height": 170})
+        set_us = (time.perf_counter() - start) / repeat * 1e6
+        # 舊做法：每次寫入後在事件迴圈上同步存檔
+        start = time.perf_counter()
+        for key in keys[:sync_repeat]:
+            store.set(key, {"step": "weight", "user_name": "bench", "height": 170})
+            store.save()
+        sync_set_ms = (time.perf_counter() - start) / sync_repeat * 1000
+        # 延遲存檔：上面大量寫入只會在背景執行緒合併寫入一次
+        store.set("last", {"step": "height", "user_name": "bench"})
+        start = time.perf_counter()
+        await asyncio.to_thread(store.flush)
+        save_ms = (time.perf_counter() - start) * 1000
+        return {"entries": len(store), "get_us": get_us, "set_us": set_us, "sync_set_ms": sync_set_ms, "background_save_ms": save_ms}
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=3600, help="模擬的時間長度（秒）")
+    parser.add_argument("--rate", type=int, default=20, help="每秒開始引導流程的使用者數")
+    parser.add_argument("--complete", type=float, default=0.3, help="在期限內完成的比例")
+    parser.add_argument("--messages", type=int, default=50, help="每秒一般訊息數（只查詢）")
+    parser.add_argument("--ttl", type=float, default=SESSION_TTL)
+    parser.add_argument("--sweep-interval", type=int, default=30)
+    parser.add_argument("--max-entries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    results = {"churn": churn(args), "latency": measure_latency(args.max_entries)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        row = results["churn"]
+        print(f"模擬 {args.seconds} 秒、{row['users']} 位使用者開始引導流程（完成比例 {args.complete:.0%}）")
+        print(f"舊做法（dict）最後留下 {row['legacy_entries']} 筆")
+        print(f"SessionStore 最多 {row['peak_entries']} 筆（上界 {row['bound']:.0f}），結束時 {row['final_entries']} 筆")
+        latency = results["latency"]
+        print(f"{latency['entries']} 筆（開啟存檔）時 get {latency['get_us']:.2f} µs、set {latency['set_us']:.2f} µs")
+        print(f"舊做法每次 set 同步存檔 {latency['sync_set_ms']:.2f} ms；改為背景合併存檔，一次 {latency['background_save_ms']:.2f} ms（不在事件迴圈上）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+網址圖片下載（image_fetch.py）的本地壓測，不需要連外網路。
+
+啟動本機 HTTP 伺服器提供各種情境，分別以非同步（ImageFetcher，!analyze <網址> 使用）與
+同步（fetch_image_sync，analyze_food 使用，內部同樣使用 ImageFetcher）兩種路徑下載，
+回報每個情境的耗時與伺服器實際送出的位元組（提早中止時應遠小於宣告大小）：
+
+- valid：正常圖片
+- declared_huge：Content-Length 超過上限（應在讀取內容前拒絕）
+- chunked_huge：沒有 Content-Length、持續送資料超過上限（應在超過時中止）
+- huge_resolution：檔案很小但解析度過高（收到檔頭就拒絕）
+- wrong_type：Content-Type 不是圖片
+- not_found：HTTP 404
+- stall：送出一半後停住（讀取逾時）
+- trickle：每次只送一點、間隔低於讀取逾時（總時間逾時）
+
+轉址、內網位址（SSRF）、大小上限與 Content-Type 的正確性由 tests/test_image_fetch.py 檢查。
+
+最後以 --concurrency 個並行請求下載正常圖片，回報吞吐量與伺服器實際收到的連線數（連線池重複使用）。
+
+用法：
+    python bench/bench_url_fetch.py [--requests 200] [--concurrency 16] [--json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+# 縮短逾時讓壓測快速結束；本機伺服器需要允許內網位址
+os.environ.setdefault("FOOD_FETCH_READ_TIMEOUT", "0.5")
+os.environ.setdefault("FOOD_FETCH_TOTAL_TIMEOUT", "2")
+os.environ.setdefault("FOOD_FETCH_ALLOW_PRIVATE", "1")
+os.environ.setdefault("FOOD_MAX_IMAGE_BYTES", str(2 * 1024 * 1024))
+
+from PIL import Image  # noqa: E402
+
+from image_fetch import ImageFetchError, ImageFetcher, fetch_image_sync  # noqa: E402
+from image_recognition import MAX_IMAGE_BYTES  # noqa: E402
+
+CHUNK = 16 * 1024
+
+
+def make_jpeg(width, height):
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def patch_jpeg_size(data, width, height):
+    """把 baseline JPEG 的 SOF0 尺寸改大：檔案很小，但檔頭宣告的解析度超過上限。"""
+    offset = data.index(b"\xff\xc0")
+    return data[:offset + 5] + height.to_bytes(2, "big") + width.to_bytes(2, "big") + data[offset + 9:]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 允許 keep-alive，才能觀察連線池是否重複使用連線
+    valid = b""
+    huge_resolution = b""
+    stats = {"connections": 0, "sent": {}}
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            self.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, size):
+        with self.lock:
+            self.stats["sent"][self.path] = self.stats["sent"].get(self.path, 0) + size
+
+    def _headers(self, status=200, content_type="image/jpeg", length=None, chunked=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(length or 0))
+        self.end_headers()
+
+    def _write(self, data, chunked=False):
+        if chunked:
+            data = f"{len(data):x}\r\n".encode() + data + b"\r\n"
+        self.wfile.write(data)
+        self.wfile.flush()
+        self._count(len(data))
+
+    def do_GET(self):
+        try:
+            self._serve()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _serve(self):
+        path = urlparse(self.path).path
+        if path == "/valid.jpg":
+            self._headers(length=len(self.valid))
+            self._write(self.valid)
+        elif path == "/declared_huge.jpg":
+            self._headers(length=MAX_IMAGE_BYTES * 10)
+            for _ in range(MAX_IMAGE_BYTES * 10 // CHUNK):
+                self._write(b"\0" * CHUNK)
+        elif path == "/chunked_huge.jpg":
+            self._headers(chunked=True)
+            self._write(self.valid[:CHUNK], chunked=True)
+            for _ in range(MAX_IMAGE_BYTES * 10 // CHUNK):
+                self._write(b"\0" * CHUNK, chunked=True)
+            self._write(b"", chunked=True)
+        elif path == "/huge_resolution.jpg":
+            self._headers(length=len(self.huge_resolution))
+            for offset in range(0, len(self.huge_resolution), CHUNK):
+                self._write(self.huge_resolution[offset:offset + CHUNK])
+                time.sleep(0.05)
+        elif path == "/wrong_type.jpg":
+            body = b"<html>not an image</html>"
+            self._headers(content_type="text/html; charset=utf-8", length=len(body))
+            self._write(body)
+        elif path == "/stall.jpg":
+            self._headers(length=len(self.valid))
+            self._write(self.valid[:len(self.valid) // 2])
+            time.sleep(3)
+            self.close_connection = True
+        elif path == "/trickle.jpg":
+            self._headers(length=len(self.valid))
+            for offset in range(0, len(self.valid), 256):
+                self._write(self.valid[offset:offset + 256])
+                time.sleep(0.2)
+        else:
+            self._headers(status=404, content_type="text/plain", length=0)
+
+
+CASES = [
+    # (名稱, 路徑, 預期成功)
+    ("valid", "/valid.jpg", True),
+    ("declared_huge", "/declared_huge.jpg", False),
+    ("chunked_huge", "/chunked_huge.jpg", False),
+    ("huge_resolution", "/huge_resolution.jpg", False),
+    ("wrong_type", "/wrong_type.jpg", False),
+    ("not_found", "/missing.jpg", False),
+    ("stall", "/stall.jpg", False),
+    ("trickle", "/trickle.jpg", False),
+]
+
+
+async def run_case_async(fetcher, url):
+    start = time.perf_counter()
+    try:
+        data = await fetcher.fetch(url)
+        return True, f"{len(data)} bytes", time.perf_counter() - start
+    except ImageFetchError as e:
+        return False, str(e), time.perf_counter() - start
+
+
+def run_case_sync(url):
+    start = time.perf_counter()
+    try:
+        data = fetch_image_sync(url)
+        return True, f"{len(data)} bytes", time.perf_counter() - start
+    except ImageFetchError as e:
+        return False, str(e), time.perf_counter() - start
+
+
+async def run_cases(base):
+    rows = []
+
+    def record(mode, case, expected, result):
+        ok, detail, elapsed = result
+        rows.append({"mode": mode, "case": case, "expected": expected, "ok": ok, "detail": detail, "elapsed": elapsed})
+
+    fetcher = ImageFetcher()
+    try:
+        for name, path, expected in CASES:
+            record("async", name, expected, await run_case_async(fetcher, base + path))
+    finally:
+        await fetcher.close()
+    for name, path, expected in CASES:
+        record("sync", name, expected, await asyncio.to_thread(run_case_sync, base + path))
+    return rows
+
+
+async def run_load(base, requests, concurrency):
+    fetcher = ImageFetcher(max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    before = Handler.stats["connections"]
+
+    async def one():
+        async with semaphore:
+            await fetcher.fetch(base + "/valid.jpg")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one() for _ in range(requests)))
+    finally:
+        await fetcher.close()
+    elapsed = time.perf_counter() - start
+    return {"requests": requests, "concurrency": concurrency, "elapsed": elapsed, "rps": requests / elapsed, "connections": Handler.stats["connections"] - before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args()
+
+    Handler.valid = make_jpeg(800, 600)
+    Handler.huge_resolution = patch_jpeg_size(make_jpeg(1600, 1200), 9000, 9000)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    async def run():
+        return await run_cases(base), await run_load(base, args.requests, args.concurrency)
+
+    try:
+        rows, load = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps({"cases": rows, "sent": Handler.stats["sent"], "load": load}, ensure_ascii=False, indent=2))
+    else:
+        print(f"上限 {MAX_IMAGE_BYTES // 1024} KB，正常圖片 {len(Handler.valid) // 1024} KB")
+        print(f"{'模式':<6}{'情境':<18}{'耗時(ms)':>10}  結果")
+        for row in rows:
+            print(f"{row['mode']:<6}{row['case']:<18}{row['elapsed'] * 1000:>10.1f}  {row['detail']}")
+        print("伺服器送出的位元組（兩種模式合計，提早中止時遠小於宣告大小）：")
+        for path, size in sorted(Handler.stats["sent"].items()):
+            print(f"  {path:<24}{size // 1024:>8} KB")
+        print(f"並行 {load['concurrency']} 下載 {load['requests']} 次：{load['rps']:.0f} 次/秒，伺服器收到 {load['connections']} 個連線")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+量測單筆飲食紀錄寫入成本隨歷史筆數成長的變化，比較舊的 JSON 整檔重寫與 SQLite 儲存層。
+
+用法：
+    python bench/bench_user_store.py [--users 200] [--checkpoints 1000,10000,50000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+os.environ.setdefault("USER_DB_FILE", os.path.join(tempfile.gettempdir(), "bench_user_store_unused.db"))
+
+from user_store import UserStore  # noqa: E402
+
+SAMPLES = 50  # 每個檢查點量測幾次寫入
+
+
+def legacy_add_food(path, user_id, food, calories):
+    """舊版 add_food_feedback：整檔讀入、附加一筆、整檔以 indent=2 寫回。"""
+    with open(path, "r", encoding="utf-8") as f:
+        logs = json.load(f)
+    logs[user_id]["foods"].append({"food": food, "calories": calories, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(logs, f, indent=2, ensure_ascii=False)
+
+
+def bench_legacy(directory, users, checkpoints):
+    path = os.path.join(directory, "user_log.json")
+    logs = {str(u): {"user_name": f"user{u}", "height": 170, "weight": 65, "foods": []} for u in range(users)}
+    results = {}
+    total = 0
+    for checkpoint in checkpoints:
+        # 直接在記憶體中補到檢查點筆數，再量測實際寫入
+        while total < checkpoint:
+            logs[str(total % users)]["foods"].append({"food": "ramen", "calories": 500, "timestamp": "2026-01-01 12:00:00"})
+            total += 1
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(logs, f, indent=2, ensure_ascii=False)
+        start = time.perf_counter()
+        for i in range(SAMPLES):
+            legacy_add_food(path, str(i % users), "pizza", 800)
+        results[checkpoint] = (time.perf_counter() - start) / SAMPLES * 1000
+        with open(path, "r", encoding="utf-8") as f:
+            logs = json.load(f)
+        total += SAMPLES
+    return results
+
+
+def bench_sqlite(directory, users, checkpoints):
+    store = UserStore(os.path.join(directory, "user_log.db"), legacy_path=None)
+    for u in range(users):
+        store.ensure_user(str(u), f"user{u}")
+    results = {}
+    total = 0
+    for checkpoint in checkpoints:
+        while total < checkpoint:
+            batch = min(5000, checkpoint - total)
+            for u in range(users):
+                share = batch // users + (1 if u < batch % users else 0)
+                if share:
+                    store.add_foods(str(u), [{"food": "ramen", "calories": 500}] * share, timestamp="2026-01-01 12:00:00")
+            total += batch
+        start = time.perf_counter()
+        for i in range(SAMPLES):
+            store.add_foods(str(i % users), [{"food": "pizza", "calories": 800}])
+        results[checkpoint] = (time.perf_counter() - start) / SAMPLES * 1000
+        total += SAMPLES
+    store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--checkpoints", default="1000,10000,50000")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+    checkpoints = [int(c) for c in args.checkpoints.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "json_ms_per_write": bench_legacy(directory, args.users, checkpoints),
+            "sqlite_ms_per_write": bench_sqlite(directory, args.users, checkpoints),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'歷史筆數':>10}{'JSON (ms)':>14}{'SQLite (ms)':>14}")
+    for checkpoint in checkpoints:
+        print(f"{checkpoint:>10}{results['json_ms_per_write'][checkpoint]:>14.2f}{results['sqlite_ms_per_write'][checkpoint]:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+離線評估信心分流（FOOD_CASCADE）：掃描門檻，比較準確度與平均延遲。
+
+對圖片集中每張圖片各量一次第一階段與完整模型的機率與單張延遲（批次 1，取 --repeat 次中位數），
+再依每個門檻模擬：第一階段有信心的圖片只付第一階段的成本，其餘再加上完整模型的成本。
+最後以實際的 predict_cascade 在目前設定的門檻跑一次，對照模擬的平均延遲。
+
+標準答案：
+- 圖片放在 <目錄>/<標籤>/*.jpg 時以子目錄名稱為標籤
+- 否則以檔名去掉結尾數字（例如 pizza3.jpg → pizza）比對模型標籤
+- 找不到對應標籤的圖片只計算與完整模型的一致率
+
+用法：
+    python bench/eval_cascade.py [--images img] [--thresholds 0.3,0.5,0.6,0.7,0.8,0.9,0.95] [--margin 0]
+                                 [--size 128] [--repeat 5] [--plot cascade.png] [--json]
+
+--plot 需要另外安裝 matplotlib。
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+import image_recognition  # noqa: E402
+from image_recognition import get_labels, is_confident, load_image_bytes, predict_batch, predict_cascade, predict_fast  # noqa: E402
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def load_image_set(directory, labels):
+    """回傳 [(路徑, RGB 圖片, 標準答案索引或 None), ...]。"""
+    index = {label: i for i, label in enumerate(labels)}
+    paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    samples = []
+    for path in paths:
+        parent = os.path.basename(os.path.dirname(path))
+        if os.path.abspath(os.path.dirname(path)) != os.path.abspath(directory):
+            name = parent
+        else:
+            name = re.sub(r"[\d_\-]+$", "", os.path.splitext(os.path.basename(path))[0])
+        with open(path, "rb") as f:
+            samples.append((path, load_image_bytes(f.read()), index.get(name)))
+    return samples
+
+
+def median_latency(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def measure(samples, repeat):
+    """每張圖片的第一階段／完整模型機率與延遲。"""
+    rows = []
+    for path, image, truth in samples:
+        fast_seconds, fast_probs = median_latency(lambda: predict_fast([image]), repeat)
+        full_seconds, full_probs = median_latency(lambda: predict_batch([image]), repeat)
+        rows.append({
+            "path": path,
+            "truth": truth,
+            "fast_probs": fast_probs,
+            "fast_top1": int(fast_probs[0].argmax()),
+            "full_top1": max(range(len(full_probs[0])), key=full_probs[0].__getitem__),
+            "fast_seconds": fast_seconds,
+            "full_seconds": full_seconds,
+        })
+    return rows
+
+
+def simulate(rows, threshold, margin):
+    confident = [is_confident(row["fast_probs"], threshold, margin)[0] for row in rows]
+    answered = [row["fast_top1"] if ok else row["full_top1"] for row, ok in zip(rows, confident)]
+    latency = sum(row["fast_seconds"] + (0.0 if ok else row["full_seconds"]) for row, ok in zip(rows, confident))
+    labeled = [(answer, row["truth"]) for answer, row in zip(answered, rows) if row["truth"] is not None]
+    return {
+        "threshold": threshold,
+        "fast_ratio": sum(confident) / len(rows),
+        "accuracy": sum(answer == truth for answer, truth in labeled) / len(labeled) if labeled else None,
+        "agreement": sum(answer == row["full_top1"] for answer, row in zip(answered, rows)) / len(rows),
+        "mean_latency_ms": latency / len(rows) * 1000,
+    }
+
+
+def measure_cascade(samples, threshold, margin, repeat):
+    """以實際的 predict_cascade 逐張執行，取得平均延遲（對照模擬結果）。"""
+    total = 0.0
+    for _, image, _ in samples:
+        seconds, _ = median_latency(lambda: predict_cascade([image], threshold, margin), repeat)
+        total += seconds
+    return total / len(samples) * 1000
+
+
+def plot(results, full_ms, path):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    use_accuracy = results[0]["accuracy"] is not None
+    key, label = ("accuracy", "Accuracy") if use_accuracy else ("agreement", "Top-1 agreement with full model")
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.plot([row["mean_latency_ms"] for row in results], [row[key] for row in results], marker="o")
+    for row in results:
+        ax.annotate(f"{row['threshold']:g}", (row["mean_latency_ms"], row[key]), textcoords="offset points", xytext=(4, 4), fontsize=8)
+    ax.axvline(full_ms, color="grey", linestyle="--", label="full model only")
+    ax.set_xlabel("Mean latency per image (ms)")
+    ax.set_ylabel(label)
+    ax.set_title("Confidence-gated cascade: threshold sweep")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=os.path.join(ROOT, "img"))
+    parser.add_argument("--thresholds", default="0.3,0.5,0.6,0.7,0.8,0.9,0.95")
+    parser.add_argument("--margin", type=float, default=image_recognition.CASCADE_MARGIN)
+    parser.add_argument("--size", type=int, help="低解析度第一階段的輸入邊長（覆寫 FOOD_CASCADE_SIZE）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--plot", help="輸出準確度對平均延遲的圖（PNG）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    if args.size:
+        image_recognition.CASCADE_SIZE = args.size
+    labels = get_labels()
+    samples = load_image_set(args.images, labels)
+    if not samples:
+        sys.exit(f"{args.images} 內沒有圖片")
+
+    # 預熱兩個階段
+    predict_batch([samples[0][1]])
+    predict_fast([samples[0][1]])
+
+    rows = measure(samples, args.repeat)
+    results = [simulate(rows, float(t), args.margin) for t in args.thresholds.split(",")]
+    full_ms = statistics.mean(row["full_seconds"] for row in rows) * 1000
+    fast_ms = statistics.mean(row["fast_seconds"] for row in rows) * 1000
+    labeled = [row for row in rows if row["truth"] is not None]
+    full_accuracy = sum(row["full_top1"] == row["truth"] for row in labeled) / len(labeled) if labeled else None
+    measured_ms = measure_cascade(samples, image_recognition.CASCADE_THRESHOLD, args.margin, args.repeat)
+    simulated_ms = simulate(rows, image_recognition.CASCADE_THRESHOLD, args.margin)["mean_latency_ms"]
+
+    if args.plot:
+        plot(results, full_ms, args.plot)
+
+    if args.json:
+        print(json.dumps({
+            "images": len(samples),
+            "labeled": len(labeled),
+            "full_ms": full_ms,
+            "fast_ms": fast_ms,
+            "full_accuracy": full_accuracy,
+            "sweep": results,
+            "check": {"threshold": image_recognition.CASCADE_THRESHOLD, "measured_ms": measured_ms, "simulated_ms": simulated_ms},
+        }, indent=2))
+        return
+
+    print(f"{len(samples)} 張圖片（{len(labeled)} 張有標準答案），第一階段 {image_recognition.CASCADE_MODEL or f'{image_recognition.CASCADE_SIZE}px'}")
+    print(f"完整模型：平均 {full_ms:.1f} ms" + (f"，準確度 {full_accuracy:.1%}" if full_accuracy is not None else ""))
+    print(f"第一階段：平均 {fast_ms:.1f} ms")
+    print(f"{'門檻':>6}{'免跑完整模型':>14}{'準確度':>10}{'一致率':>10}{'平均延遲(ms)':>14}")
+    for row in results:
+        accuracy = f"{row['accuracy']:.1%}" if row["accuracy"] is not None else "-"
+        print(f"{row['threshold']:>6g}{row['fast_ratio']:>14.1%}{accuracy:>10}{row['agreement']:>10.1%}{row['mean_latency_ms']:>14.1f}")
+    print(f"\n門檻 {image_recognition.CASCADE_THRESHOLD:g} 實測 predict_cascade 平均 {measured_ms:.1f} ms（模擬 {simulated_ms:.1f} ms）")
+    if args.plot:
+        print(f"圖表已輸出：{args.plot}")
+
+
+if __name__ == "__main__":
+    main()
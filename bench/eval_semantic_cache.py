@@ -0,0 +1,184 @@
+"""
+離線評估相似問題快取：
+
+1. 以標註好的問題對計算命中率（換句話說的問題有找到對應的快取）與誤判率（不同問題卻被當成相同）
+2. 以食物 × 問句樣板 × 前綴組合出的擬真問題（--size 筆，預設 10 萬筆，不重複）建立索引，量測單次查詢延遲；
+   查詢是換了前綴的同一個問題，另外回報命中數（確認量到的是真的有找到候選的查詢，而不是全部被略過）
+
+用法：
+    python bench/eval_semantic_cache.py [--thresholds 0.5,0.6,0.7,0.8,0.9] [--size 100000] [--json]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+from semantic_cache import QuestionIndex  # noqa: E402
+
+# 已快取的問題
+CACHED = [
+    "香蕉熱量多少?",
+    "吃宵夜會變胖嗎",
+    "一天要喝多少水",
+    "減肥可以吃白飯嗎",
+    "雞胸肉的蛋白質有多少",
+    "珍珠奶茶熱量高嗎",
+    "早餐吃什麼比較健康",
+    "運動後要吃什麼",
+    "生酮飲食是什麼",
+    "蘋果的熱量是多少",
+    "牛奶可以每天喝嗎",
+    "地瓜適合減肥嗎",
+    "糖尿病可以吃香蕉嗎",
+    "牛奶有多少蛋白質",
+]
+
+# (查詢, 應命中的快取問題；None 表示不應命中任何快取)
+LABELED = [
+    ("香蕉的熱量是多少", "香蕉熱量多少?"),
+    ("請問香蕉熱量多少？", "香蕉熱量多少?"),
+    ("一根香蕉熱量多少", "香蕉熱量多少?"),
+    ("宵夜吃了會變胖嗎？", "吃宵夜會變胖嗎"),
+    ("吃宵夜容易變胖嗎", "吃宵夜會變胖嗎"),
+    ("每天要喝多少水", "一天要喝多少水"),
+    ("一天應該喝多少水？", "一天要喝多少水"),
+    ("減肥能吃白飯嗎", "減肥可以吃白飯嗎"),
+    ("減肥期間可以吃白飯嗎？", "減肥可以吃白飯嗎"),
+    ("雞胸肉蛋白質有多少", "雞胸肉的蛋白質有多少"),
+    ("珍奶熱量高嗎", "珍珠奶茶熱量高嗎"),
+    ("珍珠奶茶的熱量很高嗎？", "珍珠奶茶熱量高嗎"),
+    ("早餐吃什麼最健康", "早餐吃什麼比較健康"),
+    ("運動完要吃什麼", "運動後要吃什麼"),
+    ("什麼是生酮飲食", "生酮飲食是什麼"),
+    ("蘋果熱量多少", "蘋果的熱量是多少"),
+    ("每天喝牛奶可以嗎", "牛奶可以每天喝嗎"),
+    ("地瓜適合減重嗎", "地瓜適合減肥嗎"),
+    ("糖尿病能吃香蕉嗎", "糖尿病可以吃香蕉嗎"),
+    ("牛奶的蛋白質有多少", "牛奶有多少蛋白質"),
+    # 不應命中
+    ("芭樂熱量多少", None),
+    ("香蕉的鉀含量多少", None),
+    ("宵夜吃什麼好", None),
+    ("一天要走多少步", None),
+    ("減肥可以吃麵包嗎", None),
+    ("雞腿的蛋白質有多少", None),
+    ("紅茶熱量高嗎", None),
+    ("晚餐吃什麼比較健康", None),
+    ("運動前要吃什麼", None),
+    ("蘋果的維生素有哪些", None),
+    ("豆漿可以每天喝嗎", None),
+    ("馬鈴薯適合減肥嗎", None),
+    ("一天要喝多少咖啡", None),
+    ("雞腿肉蛋白質多少", None),
+    ("香蕉和芭樂哪個熱量高", None),
+    # 否定或相反方向：主題字相同但問的是相反的事
+    ("糖尿病不可以吃香蕉嗎", None),
+    ("糖尿病不能吃香蕉嗎", None),
+    ("牛奶沒有多少蛋白質嗎", None),
+    ("減肥不能吃白飯嗎", None),
+    ("牛奶不可以每天喝嗎", None),
+    ("珍珠奶茶熱量低嗎", None),
+    ("吃宵夜會變瘦嗎", None),
+    ("地瓜不適合減肥嗎", None),
+]
+
+FOODS = [
+    "香蕉", "蘋果", "芭樂", "雞胸肉", "雞腿肉", "白飯", "糙米", "地瓜", "牛奶", "豆漿", "拉麵", "滷肉飯", "雞排", "珍珠奶茶",
+    "沙拉", "水餃", "便當", "燙青菜", "鮭魚", "豆腐", "雞蛋", "燕麥", "優格", "咖啡", "紅茶", "綠茶", "麵包", "饅頭",
+    "蛋餅", "牛肉麵", "義大利麵", "披薩", "漢堡", "薯條", "鹹酥雞", "火鍋", "壽司", "咖哩飯", "炒飯", "粥",
+    "芒果", "鳳梨", "西瓜", "葡萄", "奇異果", "草莓", "木瓜", "柳橙", "酪梨", "藍莓", "玉米", "南瓜", "花椰菜", "菠菜",
+    "高麗菜", "毛豆", "豬排", "牛排", "鯖魚", "蝦仁", "貢丸", "米粉", "冬粉", "烏龍麵", "蘿蔔糕", "飯糰", "三明治", "鍋貼",
+    "臭豆腐", "蚵仔煎",
+]
+TEMPLATES = [
+    "{a}熱量多少", "{a}的蛋白質有多少", "減肥可以吃{a}嗎", "每天吃{a}會怎樣", "{a}的營養成分", "晚上吃{a}會胖嗎",
+    "{a}和{b}哪個比較健康", "{a}配{b}適合當早餐嗎", "吃{a}之後可以吃{b}嗎",
+]
+PREFIXES = ["", "想問一下", "一份", "早餐", "午餐", "晚餐", "宵夜", "下午茶", "運動後"]
+
+
+def realistic_questions(seed=0):
+    """食物 × 樣板 × 前綴的所有組合（打亂順序），與實際快取中的問題一樣有大量共同的 n-gram。"""
+    questions = []
+    for template, prefix in itertools.product(TEMPLATES, PREFIXES):
+        pairs = itertools.permutations(FOODS, 2) if "{b}" in template else ((a, a) for a in FOODS)
+        questions.extend(prefix + template.format(a=a, b=b) for a, b in pairs)
+    random.Random(seed).shuffle(questions)
+    return questions
+
+
+def evaluate(threshold):
+    index = QuestionIndex(threshold=threshold)
+    for question in CACHED:
+        index.add(question, question)
+    hits = false_matches = positives = negatives = 0
+    for query, expected in LABELED:
+        match = index.search(query)
+        got = match[0] if match else None
+        if expected is None:
+            negatives += 1
+            false_matches += got is not None
+        else:
+            positives += 1
+            hits += got == expected
+            false_matches += got is not None and got != expected
+    return {"hit_rate": hits / positives, "false_match_rate": false_matches / (positives + negatives)}
+
+
+def measure_latency(size, queries=1000, seed=0):
+    rng = random.Random(seed)
+    cached = realistic_questions(seed)[:size]
+    index = QuestionIndex()
+    start = time.perf_counter()
+    for question in cached:
+        index.add(question, question)
+    build_seconds = time.perf_counter() - start
+    # 查詢：已快取問題換一個前綴（同一個問題的不同問法）
+    samples = []
+    for question in rng.sample(cached, min(queries, len(cached))):
+        prefix = next((p for p in PREFIXES[1:] if question.startswith(p)), "")
+        samples.append(rng.choice(["", "請問", "想問一下"]) + question[len(prefix):])
+    hits, timings = 0, []
+    for question in samples:
+        start = time.perf_counter()
+        hits += index.search(question) is not None
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "entries": len(index),
+        "build_seconds": build_seconds,
+        "queries": len(samples),
+        "hits": hits,
+        "query_ms": sum(timings) / len(timings) * 1000,
+        "p99_ms": timings[int(len(timings) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    results = {"accuracy": {t: evaluate(float(t)) for t in args.thresholds.split(",")}, "latency": measure_latency(args.size)}
+    if results["latency"]["entries"] < args.size:
+        sys.exit(f"擬真問題只有 {results['latency']['entries']} 筆，不足 --size {args.size}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'門檻':>6}{'命中率':>10}{'誤判率':>10}")
+    for threshold, row in results["accuracy"].items():
+        print(f"{threshold:>6}{row['hit_rate']:>10.1%}{row['false_match_rate']:>10.1%}")
+    latency = results["latency"]
+    print(f"\n{latency['entries']} 筆索引：建立 {latency['build_seconds']:.1f}s，平均查詢 {latency['query_ms']:.3f} ms、p99 {latency['p99_ms']:.3f} ms（{latency['queries']} 次查詢命中 {latency['hits']} 次）")
+
+
+if __name__ == "__main__":
+    main()
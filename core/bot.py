@@ -1,16 +1,37 @@
-import discord
+import time
+
+BOOT_START = time.perf_counter()
+
 import discord
 import os
 from discord.ext import commands
 from discord_handler import register_commands
 
+IMPORT_SECONDS = time.perf_counter() - BOOT_START
+
+# 分片設定：DISCORD_SHARDS=auto 由 Discord 建議分片數，填數字則固定分片數；未設定時使用單一連線
+SHARDS = os.getenv("DISCORD_SHARDS", "")
+SHARD_IDS = os.getenv("DISCORD_SHARD_IDS", "")  # 例如 "0,1"：本行程只負責部分分片，其餘由其他行程執行
+
+
+def create_bot(intents):
+    if not SHARDS:
+        return commands.Bot(command_prefix='!', intents=intents)
+    options = {}
+    if SHARDS != "auto":
+        options["shard_count"] = int(SHARDS)
+    if SHARD_IDS:
+        options["shard_ids"] = [int(i) for i in SHARD_IDS.split(",")]
+    return commands.AutoShardedBot(command_prefix='!', intents=intents, **options)
+
 
 def main():
     intents = discord.Intents.default()
     intents.message_content = True
-    bot = commands.Bot(command_prefix='!', intents=intents)
+    bot = create_bot(intents)
 
     register_commands(bot)
+    print(f"模組匯入耗時 {IMPORT_SECONDS:.2f}s（圖像辨識模型延遲到第一次使用或預熱時才載入）")
 
     # 運行 Bot
     TOKEN = os.getenv("DISCORD_BOT_API_KEY")
@@ -1,69 +1,164 @@
+import asyncio
+import functools
 import os
-import tempfile
-import json
+import time
 from datetime import datetime
+from urllib.parse import urlparse
 
 import discord
 from discord.ext import commands
 from discord.ui import View
 
-from image_recognition import analyze_food
-from llm_gemini import generate_diet_recommendation, answer_question
+from executors import inference_executor, storage_executor
+from image_fetch import ImageFetchError, image_fetcher
+from image_recognition import CASCADE, MAX_IMAGE_BYTES, MAX_MEAL_IMAGES, start_warm_up
+from inference_client import get_labels, inference_client, recognize_food_batch, uses_server
+from llm_gemini import answer_question, generate_diet_recommendation, start_question_index, stream_answer, stream_diet_recommendation
+from metrics import METRICS_PORT, metrics
+from nutrition import NUTRIENTS, TOP_K, get_nutrition_table
+from session_store import SESSION_TTL, onboarding_sessions
+from user_store import user_store, week_start
 
-# 模擬營養數據（image_recognition 只回傳標籤，這裡用模擬營養資料）
-MOCK_NUTRITION = {
-    "pizza": {"calories": 800, "carbs": 100, "protein": 30, "fat": 35},
-    "burger": {"calories": 600, "carbs": 50, "protein": 25, "fat": 30},
-    "salad": {"calories": 200, "carbs": 20, "protein": 10, "fat": 15},
-    "default": {"calories": 500, "carbs": 60, "protein": 20, "fat": 25},
-}
+# 辨識結果機率低於多少不列出
+RECOGNITION_THRESHOLD = 0.05
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg")
 
-# 全域狀態
-PENDING = {}  # user_id -> {step, user_name, height}
+# 串流回覆：辨識結果先送出，再隨 Gemini 輸出逐步編輯同一則訊息（LLM_STREAM=0 改回等完整回應才送出）
+LLM_STREAM = os.getenv("LLM_STREAM", "1").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("LLM_STREAM_EDIT_INTERVAL", "1.0"))  # 兩次編輯的最短間隔（秒），避免觸發 Discord 限流
+STREAM_PLACEHOLDER = "✍️ 生成中..."
+EMBED_FIELD_LIMIT = 1024
+EMBED_DESCRIPTION_LIMIT = 4096
 
-# 檔案路徑
-ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-USER_LOG_FILE = os.path.join(ROOT, "user_log.json")
+# 設定 FOOD_WARMUP=1 時，上線後在背景預先載入圖像辨識模型
+WARMUP_ON_READY = os.getenv("FOOD_WARMUP", "0").lower() in ("1", "true", "yes")
 
 
-def load_user_logs():
-    if os.path.exists(USER_LOG_FILE):
-        with open(USER_LOG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
+def ensure_user_record(user_id, user_name):
+    return user_store.ensure_user(user_id, user_name)
 
-def save_user_logs(logs):
-    with open(USER_LOG_FILE, "w", encoding="utf-8") as f:
-        json.dump(logs, f, indent=2, ensure_ascii=False)
 
-
-def ensure_user_record(user_id, user_name):
-    logs = load_user_logs()
-    if user_id not in logs:
-        logs[user_id] = {"user_name": user_name, "height": None, "weight": None, "foods": []}
-        save_user_logs(logs)
-        return True
-    return False
+def ensure_user_and_get(user_id, user_name):
+    """建立使用者（若不存在）並回傳其資料，兩步在同一次執行緒池呼叫中完成。"""
+    ensure_user_record(user_id, user_name)
+    return user_store.get_user(user_id) or {}
 
 
 def set_user_basic(user_id, user_name, height, weight):
-    logs = load_user_logs()
-    logs[user_id] = {"user_name": user_name, "height": height, "weight": weight, "foods": logs.get(user_id, {}).get("foods", [])}
-    save_user_logs(logs)
+    user_store.set_basic(user_id, user_name, height, weight)
 
 
 def add_food_feedback(user_id, food_name, calories):
-    logs = load_user_logs()
-    if user_id not in logs:
-        return
-    logs[user_id].setdefault("foods", [])
-    logs[user_id]["foods"].append({
-        "food": food_name,
-        "calories": calories,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    })
-    save_user_logs(logs)
+    add_food_feedbacks(user_id, [{"food": food_name, "calories": calories}])
+
+
+def add_food_feedbacks(user_id, items):
+    """同一次分析的多筆食物（nutrition_summary 格式）一次寫入。"""
+    user_store.add_foods(user_id, items)
+
+
+def recognize_meal(images):
+    """
+    辨識同一餐的多張圖片並查詢營養（在推理執行緒池中執行），所有圖片在同一個批次推理。
+
+    Args:
+        images (list): 每張圖片的原始位元組。
+
+    Returns:
+        list: 每張圖片一個 dict：{"top": [(food, prob)], "summary": nutrition_summary, "expected": 機率加權的期望營養}，
+            辨識失敗的圖片為 {"error": 錯誤訊息}。
+    """
+    results = recognize_food_batch(images)
+    table = get_nutrition_table(get_labels())
+    meal = []
+    for probs in results:
+        if isinstance(probs, Exception):
+            meal.append({"error": str(probs)})
+            continue
+        top = table.top_k(probs, k=TOP_K, threshold=RECOGNITION_THRESHOLD)
+        meal.append({"top": top, "summary": [{"food": food, **table.lookup(food)} for food, _ in top], "expected": table.expected(probs)})
+    return meal
+
+
+def sum_nutrients(rows):
+    return {name: sum(row[name] for row in rows) for name in NUTRIENTS}
+
+
+def format_nutrition(item):
+    return f"熱量: {item['calories']} kcal\n碳水化合物: {item['carbs']}g\n蛋白質: {item['protein']}g\n脂肪: {item['fat']}g"
+
+
+def build_analysis_embed(goal, filenames, meal, recommendation):
+    """單張圖片維持原本的版面；多張圖片時每張一個欄位，再加上整餐合計。"""
+    embed = discord.Embed(title="🍱 食物辨識與飲食建議", description="以下是圖片的食物辨識結果與飲食建議：", color=0xFFA07A)
+    if len(meal) == 1:
+        image = meal[0]
+        embed.add_field(name="🔍 辨識結果", value="\n".join(f"{food}: {prob:.2%}" for food, prob in image["top"]), inline=False)
+        for item in image["summary"]:
+            embed.add_field(name=f"📊 {item['food']} 營養", value=format_nutrition(item), inline=True)
+        embed.add_field(name="🧮 機率加權估計", value=format_nutrition(image["expected"]), inline=True)
+    else:
+        for i, (filename, image) in enumerate(zip(filenames, meal), start=1):
+            if "error" in image:
+                value = f"⚠️ {image['error']}"
+            elif not image["top"]:
+                value = "未辨識到任何食物"
+            else:
+                value = "\n".join(
+                    f"{item['food']}（{prob:.0%}）：{format_totals(item)}" for (_, prob), item in zip(image["top"], image["summary"])
+                )
+            embed.add_field(name=f"🔍 第 {i} 張：{filename}", value=value, inline=False)
+        recognized = [image for image in meal if image.get("top")]
+        embed.add_field(name="🍽️ 整餐合計", value=format_totals(sum_nutrients([item for image in recognized for item in image["summary"]])), inline=False)
+        embed.add_field(name="🧮 機率加權估計（整餐）", value=format_totals(sum_nutrients([image["expected"] for image in recognized])), inline=False)
+    embed.add_field(name=f"{'健康' if goal == 'healthy' else '瘦身'}建議", value=recommendation, inline=False)
+    embed.set_footer(text="由食物營養師為您分析 ✨")
+    return embed
+
+
+async def stream_to_message(message, embed, render, chunks, error_prefix, interval=None, clock=time.monotonic):
+    """
+    把串流文字逐步寫入已送出訊息的 embed 並編輯訊息。
+
+    兩次編輯至少間隔 interval 秒，期間收到的文字併入下一次編輯；串流結束後一定再以完整文字編輯一次，
+    失敗時改顯示 error_prefix 加上錯誤訊息。
+
+    Args:
+        message (discord.Message): 已送出、含有 embed 的訊息。
+        embed (discord.Embed): 該訊息的 embed，render 會直接修改它。
+        render (callable): render(embed, text)，把文字寫到 embed 中對應的位置。
+        chunks: 逐步 yield 累積文字的 async iterator（stream_diet_recommendation / stream_answer）。
+        error_prefix (str): 失敗時顯示在錯誤訊息前的文字。
+
+    Returns:
+        tuple: (最後顯示的文字, 是否成功)
+    """
+    interval = STREAM_EDIT_INTERVAL if interval is None else interval
+    text, ok, last_edit = "", True, clock()
+    try:
+        async for text in chunks:
+            if clock() - last_edit >= interval:
+                render(embed, text + " ▌")
+                await message.edit(embed=embed)
+                last_edit = clock()
+    except Exception as e:
+        text, ok = f"{error_prefix}{str(e)}", False
+    render(embed, text)
+    await message.edit(embed=embed)
+    return text, ok
+
+
+def render_field(index):
+    """回傳把文字寫入第 index 個欄位（保留原欄位名稱）的 render 函式。"""
+
+    def render(embed, text):
+        embed.set_field_at(index, name=embed.fields[index].name, value=(text or STREAM_PLACEHOLDER)[:EMBED_FIELD_LIMIT], inline=False)
+
+    return render
+
+
+def render_description(embed, text):
+    embed.description = (text or STREAM_PLACEHOLDER)[:EMBED_DESCRIPTION_LIMIT]
 
 
 HEIGHT_OPTIONS = [str(h) for h in range(150, 201, 5)]
@@ -72,7 +167,7 @@ WEIGHT_OPTIONS = [str(w) for w in range(40, 121, 5)]
 
 class HeightSelect(View):
     def __init__(self, user_id: str, user_name: str):
-        super().__init__(timeout=120)
+        super().__init__(timeout=SESSION_TTL)
         self.user_id = user_id
         self.user_name = user_name
         options = [discord.SelectOption(label=h, value=h) for h in HEIGHT_OPTIONS]
@@ -84,13 +179,13 @@ class HeightSelect(View):
     @discord.ui.select(custom_id="height_select")
     async def select_callback(self, select: discord.ui.Select, interaction: discord.Interaction):
         height = int(select.values[0])
-        PENDING[self.user_id] = {"step": "weight", "user_name": self.user_name, "height": height}
+        onboarding_sessions.set(self.user_id, {"step": "weight", "user_name": self.user_name, "height": height})
         await interaction.response.send_message(f"已選擇身高 {height}cm，請接著選擇體重。", view=WeightSelect(self.user_id, self.user_name, height), ephemeral=True)
 
 
 class WeightSelect(View):
     def __init__(self, user_id: str, user_name: str, height: int):
-        super().__init__(timeout=120)
+        super().__init__(timeout=SESSION_TTL)
         self.user_id = user_id
         self.user_name = user_name
         self.height = height
@@ -103,15 +198,16 @@ class WeightSelect(View):
     @discord.ui.select(custom_id="weight_select")
     async def select_callback(self, select: discord.ui.Select, interaction: discord.Interaction):
         weight = float(select.values[0])
-        set_user_basic(self.user_id, self.user_name, self.height, weight)
-        PENDING.pop(self.user_id, None)
+        await storage_executor.run(set_user_basic, self.user_id, self.user_name, self.height, weight)
+        onboarding_sessions.pop(self.user_id)
         await interaction.response.send_message(f"已記錄身高 {self.height}cm、體重 {weight}kg。", ephemeral=True)
 
 
 class GoalSelect(View):
-    def __init__(self, ctx: commands.Context):
+    def __init__(self, ctx: commands.Context, url: str | None = None):
         super().__init__(timeout=60)
         self.ctx = ctx
+        self.url = url
         options = [
             discord.SelectOption(label="健康飲食", value="healthy"),
             discord.SelectOption(label="減重飲食", value="weight_loss"),
@@ -125,7 +221,7 @@ class GoalSelect(View):
     async def select_callback(self, select: discord.ui.Select, interaction: discord.Interaction):
         goal = select.values[0]
         await interaction.response.defer()
-        await analyze_main(self.ctx, goal)
+        await analyze_main(self.ctx, goal, self.url)
 
 
 class AskModal(discord.ui.Modal):
@@ -138,13 +234,7 @@ class AskModal(discord.ui.Modal):
         q = self.question.value.strip()
         # 使用 interaction 回覆並在後續把答案發到頻道
         await interaction.response.defer()
-        try:
-            answer = answer_question(q)
-            embed = discord.Embed(title="💬 問題解答", description=answer, color=0x87CEEB)
-            embed.add_field(name="問題", value=q, inline=False)
-            await interaction.followup.send(embed=embed)
-        except Exception as e:
-            await interaction.followup.send(f"❌ 回答失敗：{e}")
+        await send_answer(functools.partial(interaction.followup.send, wait=True), q, user_id=str(interaction.user.id))
 
 
 class MainMenu(View):
@@ -174,100 +264,261 @@ class MainMenu(View):
             await interaction.response.send_modal(AskModal())
 
 
-async def analyze_main(ctx: commands.Context, goal: str):
+def image_url(argument: str | None):
+    """
+    !analyze 的參數是 http / https 網址時回傳網址，否則回傳 None（改用附件）。
+
+    Discord 中以 <網址> 包住可避免產生預覽，因此先去掉角括號。
+    """
+    if not argument:
+        return None
+    url = argument.strip().strip("<>")
+    parsed = urlparse(url)
+    if parsed.scheme.lower() in ("http", "https") and parsed.netloc:
+        return url
+    return None
+
+
+async def analyze_main(ctx: commands.Context, goal: str, url: str | None = None):
     await ctx.send("圖片收到，分析中...🔍")
-    if not ctx.message.attachments:
-        await ctx.send("⚠️ 請在訊息中附上食物圖片（PNG/JPG/JPEG）。")
-        return
-    attachment = ctx.message.attachments[0]
-    if not attachment.filename.lower().endswith(("png", "jpg", "jpeg")):
-        await ctx.send("⚠️ 請上傳 PNG、JPG 或 JPEG 格式的圖片！")
-        return
+    if url:
+        # 網址圖片：串流下載，大小、格式與逾時檢查在 image_fetcher 內處理
+        sources = [(os.path.basename(urlparse(url).path) or url, functools.partial(image_fetcher.fetch, url))]
+    else:
+        if not ctx.message.attachments:
+            await ctx.send("⚠️ 請在訊息中附上食物圖片（PNG/JPG/JPEG），或在指令後加上圖片網址。")
+            return
+        attachments = [attachment for attachment in ctx.message.attachments if attachment.filename.lower().endswith(IMAGE_EXTENSIONS)]
+        if not attachments:
+            await ctx.send("⚠️ 請上傳 PNG、JPG 或 JPEG 格式的圖片！")
+            return
+        if any(attachment.size > MAX_IMAGE_BYTES for attachment in attachments):
+            await ctx.send(f"⚠️ 圖片太大了，請上傳 {MAX_IMAGE_BYTES // (1024 * 1024)}MB 以內的圖片！")
+            return
+        if len(attachments) > MAX_MEAL_IMAGES:
+            await ctx.send(f"一次最多分析 {MAX_MEAL_IMAGES} 張圖片，只會分析前 {MAX_MEAL_IMAGES} 張。")
+            attachments = attachments[:MAX_MEAL_IMAGES]
+        sources = [(attachment.filename, attachment.read) for attachment in attachments]
+    trace = {"images": len(sources)}
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(attachment.filename)[1]) as temp_file:
-            await attachment.save(temp_file.name)
-            temp_file_path = temp_file.name
-        try:
-            food_results = analyze_food(temp_file_path, is_url=False)
-            if not food_results:
+        with metrics.timer("analyze_total", trace):
+            with metrics.timer("download", trace):
+                images = await asyncio.gather(*(read() for _, read in sources))
+            with metrics.timer("recognize", trace):
+                meal = await inference_executor.run(recognize_meal, list(images))
+            if all("error" in image for image in meal):
+                await ctx.send(f"❌ 發生錯誤：{meal[0]['error']}")
+                return
+            nutrition_summary = [item for image in meal for item in image.get("summary", [])]
+            if not nutrition_summary:
                 await ctx.send("⚠️ 未辨識到任何食物，請試試其他照片！")
                 return
-        finally:
+
+            filenames = [filename for filename, _ in sources]
+            if LLM_STREAM:
+                # 辨識與營養結果先送出，建議欄位隨串流逐步更新
+                embed = build_analysis_embed(goal, filenames, meal, STREAM_PLACEHOLDER)
+                with metrics.timer("embed_send", trace):
+                    message = await ctx.send(embed=embed)
+                with metrics.timer("user_log_write", trace):
+                    await storage_executor.run(add_food_feedbacks, str(ctx.author.id), nutrition_summary)
+                with metrics.timer("recommendation", trace):
+                    chunks = stream_diet_recommendation(nutrition_summary, goal)
+                    await stream_to_message(message, embed, render_field(len(embed.fields) - 1), chunks, "生成建議錯誤：")
+                return
+
+            # 整餐只送出一次建議請求、寫入一次紀錄
             try:
-                os.unlink(temp_file_path)
-            except Exception:
-                pass
-
-        nutrition_summary = []
-        for food, prob in sorted(food_results.items(), key=lambda x: x[1], reverse=True)[:2]:
-            nutrition = MOCK_NUTRITION.get(food.lower(), MOCK_NUTRITION["default"])
-            nutrition_summary.append({
-                "food": food,
-                "calories": nutrition["calories"],
-                "carbs": nutrition["carbs"],
-                "protein": nutrition["protein"],
-                "fat": nutrition["fat"],
-            })
-        try:
-            recommendation = generate_diet_recommendation(nutrition_summary, goal)
-        except Exception as e:
-            recommendation = f"生成建議錯誤：{str(e)}"
-
-        user_id = str(ctx.author.id)
-        for item in nutrition_summary:
-            add_food_feedback(user_id, item["food"], item["calories"])
-
-        embed = discord.Embed(title="🍱 食物辨識與飲食建議", description="以下是圖片的食物辨識結果與飲食建議：", color=0xFFA07A)
-        recognition_text = "\n".join([f"{food}: {prob:.2%}" for food, prob in sorted(food_results.items(), key=lambda x: x[1], reverse=True)[:2]])
-        embed.add_field(name="🔍 辨識結果", value=recognition_text, inline=False)
-        for item in nutrition_summary:
-            embed.add_field(
-                name=f"📊 {item['food']} 營養",
-                value=f"熱量: {item['calories']} kcal\n碳水化合物: {item['carbs']}g\n蛋白質: {item['protein']}g\n脂肪: {item['fat']}g",
-                inline=True,
-            )
-        embed.add_field(name=f"{'健康' if goal == 'healthy' else '瘦身'}建議", value=recommendation, inline=False)
-        embed.set_footer(text="由食物營養師為您分析 ✨")
-        await ctx.send(embed=embed)
+                with metrics.timer("recommendation", trace):
+                    recommendation = await generate_diet_recommendation(nutrition_summary, goal)
+            except Exception as e:
+                recommendation = f"生成建議錯誤：{str(e)}"
+
+            with metrics.timer("user_log_write", trace):
+                await storage_executor.run(add_food_feedbacks, str(ctx.author.id), nutrition_summary)
+
+            embed = build_analysis_embed(goal, filenames, meal, recommendation)
+            with metrics.timer("embed_send", trace):
+                await ctx.send(embed=embed)
+    except ImageFetchError as e:
+        metrics.incr("errors_total", stage="fetch")
+        await ctx.send(f"⚠️ {e}")
     except Exception as e:
+        metrics.incr("errors_total", stage="analyze")
         await ctx.send(f"❌ 發生錯誤：{str(e)}")
+    finally:
+        metrics.log_event("analyze", user_id=str(ctx.author.id), stages=trace)
 
 
 async def handle_hello(ctx: commands.Context):
-    ensure_user_record(str(ctx.author.id), ctx.author.name)
+    await storage_executor.run(ensure_user_record, str(ctx.author.id), ctx.author.name)
     await ctx.send(f"嗨 {ctx.author.name}，我是你的食物營養師！")
 
 
-async def handle_analyze(ctx: commands.Context):
-    ensure_user_record(str(ctx.author.id), ctx.author.name)
-    logs = load_user_logs()
-    user = logs.get(str(ctx.author.id), {})
+async def handle_analyze(ctx: commands.Context, url: str | None = None):
+    user = await storage_executor.run(ensure_user_and_get, str(ctx.author.id), ctx.author.name)
     if user.get("height") is None or user.get("weight") is None:
-        PENDING[str(ctx.author.id)] = {"step": "height", "user_name": ctx.author.name}
+        onboarding_sessions.set(str(ctx.author.id), {"step": "height", "user_name": ctx.author.name})
         await ctx.send("請先提供基本資料：", view=HeightSelect(str(ctx.author.id), ctx.author.name))
         return
-    await ctx.send("請選擇分析目標：", view=GoalSelect(ctx))
+    await ctx.send("請選擇分析目標：", view=GoalSelect(ctx, url))
 
 
 async def handle_ask(ctx: commands.Context, question: str | None = None):
-    ensure_user_record(str(ctx.author.id), ctx.author.name)
+    await storage_executor.run(ensure_user_record, str(ctx.author.id), ctx.author.name)
     if not question:
         # 直接開啟 Modal
         return await ctx.send("請使用主選單的「問題詢問」或在指令後加上問題。")
-    await ctx.send("正在查詢，請稍候...🤔")
+    if not LLM_STREAM:
+        await ctx.send("正在查詢，請稍候...🤔")
+    await send_answer(ctx.send, question, user_id=str(ctx.author.id))
+
+
+async def send_answer(send, question, user_id=None):
+    """
+    回答問題並送出 embed；串流模式先送出帶問題的 embed，再隨回答逐步編輯。
+
+    Args:
+        send (callable): 送出訊息的函式（ctx.send 或 interaction.followup.send），需回傳可 edit() 的訊息。
+        question (str): 用戶的問題。
+    """
+    trace = {}
     try:
-        answer = answer_question(question)
-        embed = discord.Embed(title="💬 問題解答", description=answer, color=0x87CEEB)
-        embed.add_field(name="問題", value=question, inline=False)
-        await ctx.send(embed=embed)
+        with metrics.timer("ask_total", trace):
+            if LLM_STREAM:
+                embed = discord.Embed(title="💬 問題解答", description=STREAM_PLACEHOLDER, color=0x87CEEB)
+                embed.add_field(name="問題", value=question, inline=False)
+                message = await send(embed=embed)
+                _, ok = await stream_to_message(message, embed, render_description, stream_answer(question), "❌ 回答失敗：")
+                if not ok:
+                    metrics.incr("errors_total", stage="ask")
+                return
+            answer = await answer_question(question)
+            embed = discord.Embed(title="💬 問題解答", description=answer, color=0x87CEEB)
+            embed.add_field(name="問題", value=question, inline=False)
+            await send(embed=embed)
     except Exception as e:
-        await ctx.send(f"❌ 回答失敗：{e}")
+        metrics.incr("errors_total", stage="ask")
+        await send(f"❌ 回答失敗：{e}")
+    finally:
+        metrics.log_event("ask", user_id=user_id, stages=trace)
+
+
+def format_totals(row):
+    return f"{row['calories']:.0f} kcal｜碳水 {row['carbs']:.0f}g｜蛋白質 {row['protein']:.0f}g｜脂肪 {row['fat']:.0f}g"
+
+
+def days_covered(week: str):
+    """該週已經過的天數，本週尚未結束時只算到今天。"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    return datetime.now().weekday() + 1 if week == week_start(today) else 7
+
+
+def build_history_embed(user_id: str, days: int = 7):
+    """最近幾天的每日熱量與營養素總和，加上最常吃的食物。"""
+    embed = discord.Embed(title="📅 近期飲食紀錄", description=f"最近 {days} 天的每日攝取：", color=0x90EE90)
+    daily = user_store.daily_totals(user_id, days)
+    if not daily:
+        embed.description = "目前還沒有紀錄，先用 !analyze 分析一餐吧！"
+        return embed
+    for row in daily:
+        embed.add_field(name=row["day"], value=f"{format_totals(row)}（{row['entries']} 項）", inline=False)
+    top = user_store.top_foods(user_id)
+    if top:
+        embed.add_field(name="🍽️ 最常吃", value="\n".join(f"{item['food']} × {item['count']}" for item in top), inline=False)
+    embed.set_footer(text="由食物營養師為您分析 ✨")
+    return embed
+
+
+def build_summary_embed(user_id: str, weeks: int = 4):
+    """每週總和、平均每日熱量與身高體重對照的趨勢。"""
+    embed = discord.Embed(title="📈 飲食週報", description=f"最近 {weeks} 週的攝取摘要：", color=0x90EE90)
+    weekly = user_store.weekly_totals(user_id, weeks)
+    if not weekly:
+        embed.description = "目前還沒有紀錄，先用 !analyze 分析一餐吧！"
+        return embed
+    for row in weekly:
+        embed.add_field(name=f"{row['week']} 當週", value=f"{format_totals(row)}\n平均每日 {row['calories'] / days_covered(row['week']):.0f} kcal", inline=False)
+
+    user = user_store.get_user(user_id) or {}
+    height, weight = user.get("height"), user.get("weight")
+    if height and weight:
+        bmi = weight / (height / 100) ** 2
+        # 粗估每日熱量需求：體重(kg) × 30 kcal
+        target = weight * 30
+        this_week = weekly[-1]
+        average = this_week["calories"] / days_covered(this_week["week"])
+        trend = f"BMI {bmi:.1f}，建議每日約 {target:.0f} kcal\n最近一週平均每日 {average:.0f} kcal（{average - target:+.0f} kcal）"
+        if len(weekly) > 1:
+            trend += f"\n較上週總熱量 {this_week['calories'] - weekly[-2]['calories']:+.0f} kcal"
+        embed.add_field(name="⚖️ 趨勢", value=trend, inline=False)
+    embed.set_footer(text="由食物營養師為您分析 ✨")
+    return embed
+
+
+async def handle_history(ctx: commands.Context):
+    await storage_executor.run(ensure_user_record, str(ctx.author.id), ctx.author.name)
+    await ctx.send(embed=await storage_executor.run(build_history_embed, str(ctx.author.id)))
+
+
+async def handle_summary(ctx: commands.Context):
+    await storage_executor.run(ensure_user_record, str(ctx.author.id), ctx.author.name)
+    await ctx.send(embed=await storage_executor.run(build_summary_embed, str(ctx.author.id)))
+
+
+def build_stats_embed():
+    """各階段延遲百分位數、快取命中率、佇列深度與錯誤次數。"""
+    embed = discord.Embed(title="📊 效能統計", color=0xB0C4DE)
+    if not metrics.enabled:
+        embed.description = "效能監控已關閉（METRICS_ENABLED=0）。"
+        return embed
+    snapshot = metrics.snapshot()
+    stages = "\n".join(
+        f"{stage}: p50 {row['p50'] * 1000:.0f}ms｜p95 {row['p95'] * 1000:.0f}ms｜p99 {row['p99'] * 1000:.0f}ms（{row['count']} 次）"
+        for stage, row in sorted(snapshot["stages"].items())
+    )
+    embed.add_field(name="⏱️ 各階段延遲", value=stages or "尚無資料", inline=False)
+    embed.add_field(
+        name="🎯 快取命中率",
+        value="\n".join(f"{name}: {metrics.hit_ratio(name):.1%}" for name in ("recognition", "recommendation", "question")),
+        inline=True,
+    )
+    if CASCADE:
+        fast, full = (metrics.counter("recognition_stage_total", stage=stage) for stage in ("fast", "full"))
+        embed.add_field(
+            name="🪜 信心分流",
+            value=f"第一階段回答 {fast} 張、完整模型 {full} 張（{fast / (fast + full) if fast + full else 0:.1%} 免跑完整模型）",
+            inline=False,
+        )
+    embed.add_field(name="📥 佇列深度", value="\n".join(f"{name}: {value}" for name, value in sorted(snapshot["gauges"].items())) or "無", inline=True)
+    errors = {name: value for name, value in snapshot["counters"].items() if name.startswith("errors_total")}
+    embed.add_field(name="⚠️ 錯誤次數", value="\n".join(f"{name}: {value}" for name, value in sorted(errors.items())) or "0", inline=False)
+    return embed
+
+
+async def handle_stats(ctx: commands.Context):
+    await ctx.send(embed=build_stats_embed())
 
 
 def register_commands(bot: commands.Bot):
     @bot.event
     async def on_ready():
         print(f"{bot.user} 上線啦！")
+        if WARMUP_ON_READY and not getattr(bot, "_warm_up_started", False):
+            bot._warm_up_started = True
+            if uses_server():
+                try:
+                    health = await inference_executor.run(inference_client.health)
+                    print(f"推理服務 {inference_client.path}：{health['status']}（pid {health['pid']}）")
+                except Exception as e:
+                    print(f"推理服務健康檢查失敗：{e}")
+            else:
+                start_warm_up()
+        onboarding_sessions.start_sweeper()
+        start_question_index()
+        if metrics.enabled and METRICS_PORT > 0 and not getattr(bot, "_metrics_server", None):
+            bot._metrics_server = await metrics.serve(port=METRICS_PORT)
+            print(f"Prometheus 監控：http://127.0.0.1:{METRICS_PORT}/metrics")
 
     @bot.event
     async def on_message(message: discord.Message):
@@ -276,12 +527,12 @@ def register_commands(bot: commands.Bot):
             return
         user_id = str(message.author.id)
         # fallback numeric input for pending height/weight
-        if user_id in PENDING:
-            info = PENDING[user_id]
+        info = onboarding_sessions.get(user_id)
+        if info is not None:
             if info.get("step") == "height":
                 try:
                     height = int(message.content.strip())
-                    PENDING[user_id] = {"step": "weight", "user_name": info["user_name"], "height": height}
+                    onboarding_sessions.set(user_id, {"step": "weight", "user_name": info["user_name"], "height": height})
                     await message.channel.send("已記錄身高，請選擇體重：", view=WeightSelect(user_id, info["user_name"], height))
                     return
                 except Exception:
@@ -289,8 +540,8 @@ def register_commands(bot: commands.Bot):
             elif info.get("step") == "weight":
                 try:
                     weight = float(message.content.strip())
-                    set_user_basic(user_id, info["user_name"], info["height"], weight)
-                    PENDING.pop(user_id, None)
+                    await storage_executor.run(set_user_basic, user_id, info["user_name"], info["height"], weight)
+                    onboarding_sessions.pop(user_id)
                     await message.channel.send(f"已記錄身高 {info['height']}cm、體重 {weight}kg。")
                     return
                 except Exception:
@@ -307,8 +558,9 @@ def register_commands(bot: commands.Bot):
         await handle_hello(ctx)
 
     @bot.command(name="analyze")
-    async def _analyze(ctx: commands.Context):
-        await handle_analyze(ctx)
+    async def _analyze(ctx: commands.Context, url: str | None = None):
+        # 參數不是圖片網址（例如 !analyze healthy）時照常分析附件
+        await handle_analyze(ctx, image_url(url))
 
     @bot.command(name="ask")
     async def _ask(ctx: commands.Context, *, question: str | None = None):
@@ -321,6 +573,19 @@ def register_commands(bot: commands.Bot):
             return
         await handle_ask(ctx, question)
 
+    @bot.command(name="history")
+    async def _history(ctx: commands.Context):
+        await handle_history(ctx)
+
+    @bot.command(name="summary")
+    async def _summary(ctx: commands.Context):
+        await handle_summary(ctx)
+
+    @bot.command(name="stats")
+    @commands.has_permissions(administrator=True)
+    async def _stats(ctx: commands.Context):
+        await handle_stats(ctx)
+
     # register application (slash) commands so Discord shows them when user types '/'
     @bot.tree.command(name="hello", description="打招呼 - 與營養師互動")
     async def slash_hello(interaction: discord.Interaction):
@@ -336,3 +601,11 @@ def register_commands(bot: commands.Bot):
     async def slash_ask(interaction: discord.Interaction):
         # open modal directly
         await interaction.response.send_modal(AskModal())
+
+    @bot.tree.command(name="history", description="查看最近幾天的飲食紀錄")
+    async def slash_history(interaction: discord.Interaction):
+        await interaction.response.send_message(embed=await storage_executor.run(build_history_embed, str(interaction.user.id)), ephemeral=True)
+
+    @bot.tree.command(name="summary", description="查看每週飲食摘要與趨勢")
+    async def slash_summary(interaction: discord.Interaction):
+        await interaction.response.send_message(embed=await storage_executor.run(build_summary_embed, str(interaction.user.id)), ephemeral=True)
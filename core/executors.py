@@ -0,0 +1,70 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# 執行緒池設定（可由環境變數覆寫）
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "8"))  # 需 >= 批次大小，批次佇列才湊得滿
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "2"))  # user_store 共用一條 SQLite 連線，多開執行緒也只會排隊
+
+
+class BoundedExecutor:
+    """
+    把阻塞呼叫丟到專屬執行緒池，避免卡住 asyncio 事件迴圈。
+
+    同時執行的數量由 max_workers 限制，超過的請求在協程端排隊等待，
+    queued / running 可用來觀察目前的佇列深度。
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.limit = max(1, max_workers)
+        self.queued = 0
+        self.running = 0
+        self._pool = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix=name)
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self):
+        # Semaphore 必須在事件迴圈內建立；換了事件迴圈（例如多次 asyncio.run）時重新建立
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, func, *args, **kwargs):
+        """在執行緒池中執行 func(*args, **kwargs) 並等待結果。"""
+        semaphore = self._get_semaphore()
+        self.queued += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    def stats(self):
+        return {"queued": self.queued, "running": self.running, "limit": self.limit}
+
+
+# CPU 密集的圖像辨識（LLM 呼叫走 llm_client 的原生 async 路徑，有自己的並行上限）
+inference_executor = BoundedExecutor("inference", INFERENCE_WORKERS)
+metrics.register_gauge("inference_queued", lambda: inference_executor.queued)
+metrics.register_gauge("inference_running", lambda: inference_executor.running)
+
+# 使用紀錄的 SQLite 讀寫（磁碟 I/O 與 fsync，和推理分開排隊，不會被辨識工作擋住）
+storage_executor = BoundedExecutor("storage", STORAGE_WORKERS)
+metrics.register_gauge("storage_queued", lambda: storage_executor.queued)
+
+
+def executor_stats():
+    """回傳各執行緒池的佇列深度與執行中數量。"""
+    return {executor.name: executor.stats() for executor in (inference_executor, storage_executor)}
@@ -0,0 +1,210 @@
+import asyncio
+import ipaddress
+import os
+import socket
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+from PIL import ImageFile
+
+from image_recognition import MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS
+
+# 網址圖片下載設定（可由環境變數覆寫）
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FOOD_FETCH_CONNECT_TIMEOUT", "5"))  # 建立連線逾時（秒）
+FETCH_READ_TIMEOUT = float(os.getenv("FOOD_FETCH_READ_TIMEOUT", "10"))  # 兩次收到資料之間的最長間隔（秒）
+FETCH_TOTAL_TIMEOUT = float(os.getenv("FOOD_FETCH_TOTAL_TIMEOUT", "30"))  # 整個下載（含轉址）的上限（秒）
+FETCH_MAX_CONNECTIONS = int(os.getenv("FOOD_FETCH_MAX_CONNECTIONS", "20"))  # 連線池大小
+FETCH_MAX_REDIRECTS = int(os.getenv("FOOD_FETCH_MAX_REDIRECTS", "3"))
+FETCH_ALLOW_PRIVATE = os.getenv("FOOD_FETCH_ALLOW_PRIVATE", "0").lower() in ("1", "true", "yes")  # 是否允許內網／本機位址
+FETCH_CHUNK_SIZE = 64 * 1024
+PROBE_BYTES = 256 * 1024  # 在前多少位元組內嘗試解析圖片檔頭
+ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/jpg", "image/pjpeg", "image/png", "image/webp"}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class ImageFetchError(Exception):
+    """網址圖片無法下載或不符合限制，訊息可直接顯示給使用者。"""
+
+
+def is_internal_address(address):
+    """內網、本機、保留或多播位址；避免使用者讓機器人連到內部服務（例如 Prometheus 監控埠）。"""
+    ip = ipaddress.ip_address(address.split("%")[0])
+    return ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast or ip.is_unspecified
+
+
+def _check_url(url, is_blocked):
+    """
+    檢查一個網址（每次轉址都要檢查）。主機名稱在連線時由 _CheckedResolver 檢查，
+    但 aiohttp 對 IP 位址形式的主機不會經過解析器，因此在這裡先擋下。
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ImageFetchError("只支援 http / https 圖片網址")
+    try:
+        ipaddress.ip_address(parsed.hostname)
+    except ValueError:
+        return parsed
+    if is_blocked(parsed.hostname):
+        raise ImageFetchError("不支援內部網路位址的圖片")
+    return parsed
+
+
+class _CheckedResolver(AbstractResolver):
+    """
+    DNS 解析後檢查所有位址，連線池只會連到檢查過的位址；
+    檢查與實際連線用的是同一次解析結果，不會被 DNS rebinding 換成內網位址。
+    """
+
+    def __init__(self, is_blocked):
+        self._resolver = DefaultResolver()
+        self._is_blocked = is_blocked
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        try:
+            hosts = await self._resolver.resolve(host, port, family)
+        except OSError:
+            raise ImageFetchError("找不到圖片網址的主機")
+        if any(self._is_blocked(entry["host"]) for entry in hosts):
+            raise ImageFetchError("不支援內部網路位址的圖片")
+        return hosts
+
+    async def close(self):
+        await self._resolver.close()
+
+
+def _check_response(status, content_type, content_length, max_bytes):
+    """收到回應標頭就先檢查，不符合的請求不必下載內容。"""
+    if status != 200:
+        raise ImageFetchError(f"圖片下載失敗（HTTP {status}）")
+    if (content_type or "").split(";")[0].strip().lower() not in ALLOWED_CONTENT_TYPES:
+        raise ImageFetchError(f"網址不是支援的圖片格式（{content_type or '未知'}）")
+    if content_length is not None and content_length > max_bytes:
+        raise ImageFetchError(f"圖片過大（{content_length // 1024} KB），上限為 {max_bytes // 1024} KB")
+
+
+class _Download:
+    """
+    累積下載內容並在過程中檢查：超過位元組上限立即中止；
+    以 PIL 的 ImageFile.Parser 逐段解析，一收到檔頭就檢查解析度，不必等整張圖下載完。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        self._parser = ImageFile.Parser()
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if len(self.buffer) > self.max_bytes:
+            raise ImageFetchError(f"圖片過大，上限為 {self.max_bytes // 1024} KB")
+        if self._parser is None:
+            return
+        self._parser.feed(chunk)
+        image = self._parser.image
+        if image is not None:
+            # 只需要檔頭資訊，後續完整解碼交給 load_image_bytes（JPEG 可用 draft 模式縮小解碼）
+            self._parser = None
+            width, height = image.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise ImageFetchError(f"圖片解析度過高（{width}x{height}）")
+        elif len(self.buffer) > PROBE_BYTES:
+            self._parser = None
+
+    def result(self):
+        return bytes(self.buffer)
+
+
+class ImageFetcher:
+    """
+    非同步的網址圖片下載器：共用 aiohttp 連線池，設定連線／讀取／總時間逾時，
+    依 Content-Type 與 Content-Length 提早拒絕，串流下載並強制位元組上限。
+
+    轉址由這裡逐次處理，每一跳都重新檢查網址與位址。is_blocked 判斷哪些位址不可連線，
+    allow_private=True 時不限制。
+    """
+
+    def __init__(
+        self,
+        max_bytes=MAX_IMAGE_BYTES,
+        connect_timeout=FETCH_CONNECT_TIMEOUT,
+        read_timeout=FETCH_READ_TIMEOUT,
+        total_timeout=FETCH_TOTAL_TIMEOUT,
+        max_connections=FETCH_MAX_CONNECTIONS,
+        max_redirects=FETCH_MAX_REDIRECTS,
+        allow_private=FETCH_ALLOW_PRIVATE,
+        is_blocked=is_internal_address,
+    ):
+        self.max_bytes = max_bytes
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_connections = max_connections
+        self.max_redirects = max_redirects
+        self.is_blocked = (lambda address: False) if allow_private else is_blocked
+        self._session = None
+
+    def _get_session(self):
+        # ClientSession 必須在事件迴圈內建立
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(connect=self.connect_timeout, sock_read=self.read_timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300, resolver=_CheckedResolver(self.is_blocked)),
+            )
+        return self._session
+
+    async def fetch(self, url):
+        """
+        下載網址圖片並回傳原始位元組。
+
+        Raises:
+            ImageFetchError: 網址不支援、逾時、格式不符、轉址到內部位址或超過大小／解析度上限。
+        """
+        try:
+            return await asyncio.wait_for(self._fetch(url), timeout=self.total_timeout)
+        except asyncio.TimeoutError:
+            raise ImageFetchError("圖片下載逾時")
+        except aiohttp.ClientError as e:
+            raise ImageFetchError(f"圖片下載失敗：{e}")
+
+    async def _fetch(self, url):
+        for _ in range(self.max_redirects + 1):
+            _check_url(url, self.is_blocked)
+            async with self._get_session().get(url, allow_redirects=False) as response:
+                if response.status in REDIRECT_STATUSES:
+                    location = response.headers.get("Location")
+                    if not location:
+                        raise ImageFetchError(f"圖片下載失敗（HTTP {response.status}）")
+                    url = urljoin(str(response.url), location)
+                    continue
+                _check_response(response.status, response.headers.get("Content-Type"), response.content_length, self.max_bytes)
+                download = _Download(self.max_bytes)
+                async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                    download.feed(chunk)
+                return download.result()
+        raise ImageFetchError("圖片網址轉址次數過多")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+image_fetcher = ImageFetcher()
+
+
+def fetch_image_sync(url, **options):
+    """
+    ImageFetcher.fetch 的同步版本（analyze_food 使用），套用相同的檢查與上限。
+
+    每次呼叫在獨立的事件迴圈中以新的 ImageFetcher 下載，不可在事件迴圈內呼叫；
+    options 會傳給 ImageFetcher。
+    """
+    async def fetch_once():
+        fetcher = ImageFetcher(**options)
+        try:
+            return await fetcher.fetch(url)
+        finally:
+            await fetcher.close()
+
+    return asyncio.run(fetch_once())
@@ -1,51 +1,521 @@
 from PIL import Image
+import atexit
 import io
-import requests
-from transformers import AutoModelForImageClassification, AutoProcessor
-import torch
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
 
-# 載入圖像辨識模型
-image_model = AutoModelForImageClassification.from_pretrained("nateraw/food")
-image_processor = AutoProcessor.from_pretrained("nateraw/food")
+from metrics import metrics
+from recognition_cache import RECOGNITION_CACHE_FILE, RECOGNITION_CACHE_PERSIST, RecognitionCache, content_digest, dhash
+
+MODEL_NAME = "nateraw/food"
+
+# 圖像辨識模型在第一次使用時才載入（torch / transformers 匯入與權重載入都很慢）
+image_model = None
+image_processor = None
+inference_backend = None
+class_labels = None  # 依類別索引排列的標籤，只從模型設定檔讀取
+fast_stage = None  # 信心分流第一階段：(backend, processor, processor 參數)
+_model_lock = threading.Lock()
+
+# 啟動耗時分析（秒）：imports、weight_load、first_inference
+STARTUP_TIMINGS = {}
+
+# 批次推理設定（可由環境變數覆寫）
+BATCH_MAX_SIZE = int(os.getenv("FOOD_BATCH_MAX_SIZE", "8"))  # 單一批次最多幾張圖
+BATCH_MAX_WAIT_MS = float(os.getenv("FOOD_BATCH_MAX_WAIT_MS", "20"))  # 收集批次的最長等待時間
+BATCH_MAX_QUEUE = int(os.getenv("FOOD_BATCH_MAX_QUEUE", "64"))  # 排隊上限，超過即拒絕（背壓）
+
+# 圖片解碼限制，提早擋下解壓縮炸彈
+MAX_IMAGE_BYTES = int(os.getenv("FOOD_MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+# 一則訊息最多分析幾張圖片（同一餐的多張照片一起辨識），也是推理服務單一請求的張數上限
+MAX_MEAL_IMAGES = int(os.getenv("FOOD_MAX_MEAL_IMAGES", "4"))
+MAX_IMAGE_PIXELS = int(os.getenv("FOOD_MAX_IMAGE_PIXELS", str(40_000_000)))
+DECODE_SIZE = 224  # 模型輸入尺寸，JPEG 直接縮小解碼到接近此大小
+DECODE_WORKERS = int(os.getenv("FOOD_DECODE_WORKERS", "4"))  # 一次分析多張圖片時平行解碼的執行緒數
+
+# 信心分流：先跑快速的小模型，信心不足才跑完整模型（可由環境變數覆寫）
+CASCADE = os.getenv("FOOD_CASCADE", "0").lower() in ("1", "true", "yes")
+CASCADE_THRESHOLD = float(os.getenv("FOOD_CASCADE_THRESHOLD", "0.8"))  # 第一階段 top-1 機率低於此值改跑完整模型
+CASCADE_MARGIN = float(os.getenv("FOOD_CASCADE_MARGIN", "0"))  # top-1 與 top-2 的差距低於此值也改跑完整模型
+CASCADE_MODEL = os.getenv("FOOD_CASCADE_MODEL", "")  # 第一階段模型（須與 MODEL_NAME 標籤相同），空字串表示以低解析度執行原模型
+CASCADE_SIZE = int(os.getenv("FOOD_CASCADE_SIZE", "128"))  # 低解析度第一階段的輸入邊長（16 的倍數）
+
+
+def model_fingerprint():
+    """會影響輸出機率的設定，持久化的辨識快取只在設定完全相同時沿用。"""
+    fingerprint = {
+        "model": MODEL_NAME,
+        # 與 inference_backends.BACKEND_NAME 相同；在這裡匯入該模組會載入 torch
+        "backend": os.getenv("FOOD_BACKEND", "eager"),
+        "decode_size": DECODE_SIZE,
+        "cascade": CASCADE,
+    }
+    if CASCADE:
+        fingerprint.update(cascade_threshold=CASCADE_THRESHOLD, cascade_margin=CASCADE_MARGIN, cascade_model=CASCADE_MODEL, cascade_size=CASCADE_SIZE)
+    return fingerprint
+
+
+recognition_cache = RecognitionCache(path=RECOGNITION_CACHE_FILE if RECOGNITION_CACHE_PERSIST else None, fingerprint=model_fingerprint())
+atexit.register(recognition_cache.save)
+
+
+class InferenceQueueFull(Exception):
+    """推理佇列已滿，呼叫端應稍後再試。"""
+
+
+class InferenceBatcher:
+    """
+    將多位使用者同時送來的圖片合併成一個批次推理。
+
+    背景執行緒從佇列取出第一張圖後，最多再等 max_wait_ms 或湊滿 max_batch_size 張，
+    接著一次送進模型，最後把每張圖各自的機率分佈回填到呼叫端的 Future。
+    """
+
+    def __init__(self, predict_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, max_queue=BATCH_MAX_QUEUE):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, image):
+        """送出一張 RGB 圖片，回傳會收到機率向量的 Future；佇列已滿時丟出 InferenceQueueFull。"""
+        future = Future()
+        try:
+            self._queue.put_nowait((image, future))
+        except queue.Full:
+            raise InferenceQueueFull("目前辨識請求過多，請稍後再試")
+        self._ensure_worker()
+        return future
+
+    def submit_many(self, images):
+        """
+        連續送出多張圖片，回傳 Future 列表。
+
+        每張圖片各自排隊，可能與其他請求的圖片合併，也可能被切到相鄰的兩個批次（例如佇列中已有其他圖片，
+        或工作執行緒在送出途中取走一批），不保證同一組圖片在同一次前向傳遞完成。
+
+        佇列剩餘空間不足時整組拒絕，丟出 InferenceQueueFull。
+        """
+        if self._queue.maxsize and self._queue.qsize() + len(images) > self._queue.maxsize:
+            raise InferenceQueueFull("目前辨識請求過多，請稍後再試")
+        futures = []
+        for image in images:
+            future = Future()
+            try:
+                self._queue.put_nowait((image, future))
+            except queue.Full:
+                raise InferenceQueueFull("目前辨識請求過多，請稍後再試")
+            futures.append(future)
+        self._ensure_worker()
+        return futures
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="food-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            metrics.incr("inference_batches_total")
+            metrics.incr("inference_images_total", len(batch))
+            try:
+                results = self.predict_fn([image for image, _ in batch])
+                for (_, future), probs in zip(batch, results):
+                    future.set_result(probs)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+def load_image_bytes(data, target_size=DECODE_SIZE):
+    """
+    從記憶體中的圖片位元組解碼成 RGB 圖片。
+
+    先只讀取檔頭檢查大小上限；JPEG 使用 draft 模式在解碼時直接縮小（1/2、1/4、1/8），
+    不必先解出整張千萬像素的手機照片。
+
+    Args:
+        data (bytes): 圖片原始位元組。
+        target_size (int): 解碼後最短邊至少要保留的像素數。
+
+    Returns:
+        PIL.Image.Image: RGB 圖片。
+    """
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"圖片過大（{len(data) // 1024} KB），上限為 {MAX_IMAGE_BYTES // 1024} KB")
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"圖片解析度過高（{width}x{height}）")
+    if image.format == "JPEG":
+        image.draft("RGB", (target_size, target_size))
+    return image.convert("RGB")
+
+
+def get_model():
+    """
+    取得圖像辨識模型與前處理器，第一次呼叫時才載入，多執行緒同時呼叫也只會載入一次。
+
+    Returns:
+        tuple: (image_model, image_processor)
+    """
+    global image_model, image_processor
+    if image_model is None:
+        with _model_lock:
+            if image_model is None:
+                start = time.perf_counter()
+                from transformers import AutoModelForImageClassification, AutoProcessor
+                import torch  # noqa: F401
+                STARTUP_TIMINGS["imports"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                processor = AutoProcessor.from_pretrained(MODEL_NAME)
+                model = AutoModelForImageClassification.from_pretrained(MODEL_NAME)
+                model.eval()
+                STARTUP_TIMINGS["weight_load"] = time.perf_counter() - start
+
+                # 先設定 processor，確保其他執行緒看到 image_model 時 processor 也已就緒
+                image_processor = processor
+                image_model = model
+                print(f"圖像辨識模型載入完成：匯入 {STARTUP_TIMINGS['imports']:.2f}s，權重 {STARTUP_TIMINGS['weight_load']:.2f}s")
+    return image_model, image_processor
+
+
+def get_backend():
+    """取得依 FOOD_BACKEND 設定建立的推理後端（eager / int8 / torchscript / compile / onnx）。"""
+    global inference_backend
+    if inference_backend is None:
+        model, _ = get_model()
+        with _model_lock:
+            if inference_backend is None:
+                from inference_backends import BACKEND_NAME, create_backend
+
+                start = time.perf_counter()
+                inference_backend = create_backend(model)
+                STARTUP_TIMINGS["backend_build"] = time.perf_counter() - start
+                print(f"推理後端：{BACKEND_NAME}（建立耗時 {STARTUP_TIMINGS['backend_build']:.2f}s）")
+    return inference_backend
+
+
+def warm_up():
+    """載入模型並跑一次假圖片推理，讓第一位使用者不必負擔冷啟動。"""
+    get_backend()
+    start = time.perf_counter()
+    predict_batch([Image.new("RGB", (224, 224))])
+    if CASCADE:
+        # 兩個階段都要預熱，不論假圖片在第一階段是否有信心
+        predict_fast([Image.new("RGB", (224, 224))])
+    STARTUP_TIMINGS["first_inference"] = time.perf_counter() - start
+    print("模型預熱完成：" + "，".join(f"{name} {seconds:.2f}s" for name, seconds in STARTUP_TIMINGS.items()))
+
+
+def start_warm_up():
+    """在背景執行緒預熱模型，不阻塞事件迴圈。"""
+    thread = threading.Thread(target=warm_up, name="food-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def predict_batch(images):
+    """
+    對多張 RGB 圖片做一次批次推理。
+
+    Args:
+        images (list): PIL.Image 列表，processor 會統一縮放成相同尺寸後堆疊成批次。
+
+    Returns:
+        list: 每張圖片的機率列表，順序與輸入相同。
+    """
+    _, image_processor = get_model()
+    backend = get_backend()
+    with metrics.timer("preprocess"):
+        inputs = image_processor(images=images, return_tensors="pt")
+
+    # 模型推理（後端負責裝置與執行緒設定）
+    with metrics.timer("forward"):
+        logits = backend.predict(inputs["pixel_values"])
+    with metrics.timer("softmax"):
+        probs = logits.softmax(dim=1).tolist()
+    return probs
+
+
+def get_fast_stage():
+    """
+    取得信心分流的第一階段，第一次呼叫時才建立。
+
+    設定 FOOD_CASCADE_MODEL 時載入該模型（標籤必須與 MODEL_NAME 完全相同），
+    否則共用完整模型的權重，以 CASCADE_SIZE 的低解析度輸入執行。
+
+    Returns:
+        tuple: (backend, processor, processor 參數)
+    """
+    global fast_stage
+    if fast_stage is None:
+        model, processor = get_model()
+        with _model_lock:
+            if fast_stage is None:
+                from inference_backends import EagerBackend, LowResolutionBackend
+
+                start = time.perf_counter()
+                if CASCADE_MODEL:
+                    from transformers import AutoModelForImageClassification, AutoProcessor
+
+                    small_model = AutoModelForImageClassification.from_pretrained(CASCADE_MODEL)
+                    if small_model.config.id2label != model.config.id2label:
+                        raise ValueError(f"{CASCADE_MODEL} 的標籤與 {MODEL_NAME} 不同，無法作為第一階段")
+                    stage = (EagerBackend(small_model.eval()), AutoProcessor.from_pretrained(CASCADE_MODEL), {})
+                    description = CASCADE_MODEL
+                else:
+                    size = {"height": CASCADE_SIZE, "width": CASCADE_SIZE}
+                    stage = (LowResolutionBackend(model), processor, {"size": size})
+                    description = f"{MODEL_NAME} @ {CASCADE_SIZE}px"
+                fast_stage = stage
+                STARTUP_TIMINGS["cascade_build"] = time.perf_counter() - start
+                print(f"信心分流第一階段：{description}（門檻 {CASCADE_THRESHOLD}，差距 {CASCADE_MARGIN}）")
+    return fast_stage
+
+
+def predict_fast(images):
+    """
+    以第一階段模型推理多張 RGB 圖片。
+
+    Returns:
+        torch.Tensor: (N, num_labels) 機率。
+    """
+    backend, processor, options = get_fast_stage()
+    with metrics.timer("fast_preprocess"):
+        inputs = processor(images=images, return_tensors="pt", **options)
+    with metrics.timer("fast_forward"):
+        return backend.predict(inputs["pixel_values"]).softmax(dim=1)
+
+
+def is_confident(probs, threshold=CASCADE_THRESHOLD, margin=CASCADE_MARGIN):
+    """
+    第一階段的結果是否足以直接採用。
+
+    Args:
+        probs (torch.Tensor): (N, num_labels) 機率。
+
+    Returns:
+        list: 每張圖片是否 top-1 機率達門檻且與 top-2 的差距達 margin。
+    """
+    top = probs.topk(2, dim=1).values
+    return ((top[:, 0] >= threshold) & (top[:, 0] - top[:, 1] >= margin)).tolist()
+
+
+def predict_cascade(images, threshold=CASCADE_THRESHOLD, margin=CASCADE_MARGIN):
+    """
+    信心分流推理：整批先跑第一階段，只有信心不足的圖片再一起送進完整模型。
+
+    Returns:
+        list: 每張圖片的 (機率列表, 回答的階段 "fast" 或 "full")，順序與輸入相同。
+    """
+    probs = predict_fast(images)
+    results = [(row, "fast") for row in probs.tolist()]
+    unsure = [i for i, confident in enumerate(is_confident(probs, threshold, margin)) if not confident]
+    if unsure:
+        for i, row in zip(unsure, predict_batch([images[i] for i in unsure])):
+            results[i] = (row, "full")
+    return results
+
+
+def predict_images(images):
+    """批次佇列使用的推理函式：開啟 FOOD_CASCADE 時走信心分流，否則直接跑完整模型。"""
+    if not CASCADE:
+        return predict_batch(images)
+    results = predict_cascade(images)
+    for _, stage in results:
+        metrics.incr("recognition_stage_total", stage=stage)
+    return [probs for probs, _ in results]
+
+
+batcher = InferenceBatcher(predict_images)
+metrics.register_gauge("batch_queue_depth", batcher._queue.qsize)
+
 
 def analyze_food(image_source, food_labels=None, is_url=True, threshold=0.05):
     """
     使用 nateraw/food 模型分析食物照片，返回高機率食物標籤。
-    
+
     Args:
         image_source (str): 圖片 URL 或本地檔案路徑。
         food_labels (list): 食物標籤列表（可選，若為 None 則使用模型預設標籤）。
         is_url (bool): True 表示 image_source 是 URL，False 表示本地檔案路徑。
         threshold (float): 機率閾值，僅返回高於此值的標籤。
-    
+
     Returns:
         dict: 食物標籤和機率，例如 {"pizza": 0.8, "burger": 0.15}。
     """
     try:
         # 處理圖片
         if is_url:
-            response = requests.get(image_source)
-            response.raise_for_status()
-            image = Image.open(io.BytesIO(response.content)).convert("RGB")
+            from image_fetch import fetch_image_sync  # image_fetch 依賴本模組的大小上限，延後匯入
+
+            data = fetch_image_sync(image_source)
         else:
             if not os.path.exists(image_source):
                 raise FileNotFoundError(f"本地圖片 {image_source} 不存在")
-            image = Image.open(image_source).convert("RGB")
-        
-        inputs = image_processor(images=image, return_tensors="pt")
-
-        # 模型推理
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        with torch.no_grad():  # 不用梯度計算 節省資源
-            outputs = image_model(**inputs.to(device))
-        probs = outputs.logits.softmax(dim=1)
-
-        # 使用模型預設標籤或自定義標籤
-        if food_labels is None:
-            food_labels = list(image_model.config.id2label.values())
-        
-        # 僅返回高於閾值的標籤
-        return {label: prob.item() for label, prob in zip(food_labels, probs[0]) if prob.item() > threshold}
+            with open(image_source, "rb") as f:
+                data = f.read()
     except Exception as e:
-        raise Exception(f"圖像辨識錯誤：{str(e)}")
\ No newline at end of file
+        raise Exception(f"圖像辨識錯誤：{str(e)}")
+    return analyze_food_bytes(data, food_labels=food_labels, threshold=threshold)
+
+
+def get_labels():
+    """
+    依類別索引排列的模型標籤（config.id2label）。
+
+    只讀取模型設定檔（AutoConfig，不需要 torch），命中辨識快取時不會為了標籤載入模型權重。
+    """
+    global class_labels
+    if class_labels is None:
+        if image_model is not None:
+            config = image_model.config
+        else:
+            from transformers import AutoConfig
+            config = AutoConfig.from_pretrained(MODEL_NAME)
+        id2label = config.id2label
+        class_labels = [id2label[i] for i in range(len(id2label))]
+    return class_labels
+
+
+_decode_pool = None
+
+
+def _get_decode_pool():
+    global _decode_pool
+    if _decode_pool is None:
+        with _model_lock:
+            if _decode_pool is None:
+                _decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="food-decode")
+    return _decode_pool
+
+
+def _lookup_or_decode(data):
+    """
+    查辨識快取，未命中時解碼圖片。
+
+    Returns:
+        tuple: (digest, image_hash, image, probs)；probs 不為 None 表示命中快取，此時不需推理。
+    """
+    # 完全相同的檔案直接命中，不必解碼
+    digest = content_digest(data)
+    probs = recognition_cache.get(digest)
+    if probs is not None:
+        metrics.incr("cache_hits_total", cache="recognition")
+        return digest, None, None, probs
+    with metrics.timer("decode"):
+        image = load_image_bytes(data)
+        image_hash = dhash(image)
+    probs = recognition_cache.get(digest, image_hash)
+    metrics.incr("cache_misses_total" if probs is None else "cache_hits_total", cache="recognition")
+    return digest, image_hash, image, probs
+
+
+def recognize_food_batch(datas):
+    """
+    一次辨識多張圖片：平行查快取與解碼，未命中快取的圖片一起送進批次佇列，在同一次前向傳遞完成。
+
+    Args:
+        datas (list): 每張圖片的原始位元組。
+
+    Returns:
+        list: 順序與輸入相同；成功為所有類別的機率列表，失敗為 Exception（訊息可直接顯示給使用者）。
+    """
+    def prepare(data):
+        try:
+            return _lookup_or_decode(data)
+        except Exception as e:
+            return e
+
+    if len(datas) > 1:
+        prepared = list(_get_decode_pool().map(prepare, datas))
+    else:
+        prepared = [prepare(data) for data in datas]
+
+    results = list(prepared)
+    pending = [i for i, item in enumerate(prepared) if not isinstance(item, Exception) and item[3] is None]
+    if pending:
+        # 交給批次佇列，與其他同時進來的請求一起推理
+        with metrics.timer("inference"):
+            try:
+                futures = batcher.submit_many([prepared[i][2] for i in pending])
+                for i, future in zip(pending, futures):
+                    try:
+                        results[i] = prepared[i][:3] + (future.result(),)
+                    except Exception as e:
+                        results[i] = e
+            except InferenceQueueFull as e:
+                for i in pending:
+                    results[i] = e
+
+    for i, item in enumerate(results):
+        if isinstance(item, Exception):
+            metrics.incr("errors_total", stage="recognition")
+            results[i] = Exception(f"圖像辨識錯誤：{str(item)}")
+            continue
+        digest, image_hash, _, probs = item
+        if image_hash is not None:
+            recognition_cache.put(digest, image_hash, probs)
+        results[i] = probs
+    return results
+
+
+def recognize_food_bytes(data):
+    """
+    辨識記憶體中的圖片位元組，回傳所有類別的 softmax 機率（順序同 get_labels()）。
+
+    Args:
+        data (bytes): 圖片原始位元組。
+
+    Returns:
+        list: 每個類別的機率。
+    """
+    result = recognize_food_batch([data])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def analyze_food_bytes(data, food_labels=None, threshold=0.05):
+    """
+    直接分析記憶體中的圖片位元組（例如 Discord 的 await attachment.read()），不經過暫存檔。
+
+    Args:
+        data (bytes): 圖片原始位元組。
+        food_labels (list): 食物標籤列表（可選，若為 None 則使用模型預設標籤）。
+        threshold (float): 機率閾值，僅返回高於此值的標籤。
+
+    Returns:
+        dict: 食物標籤和機率，例如 {"pizza": 0.8, "burger": 0.15}。
+    """
+    probs = recognize_food_bytes(data)
+
+    # 使用模型預設標籤或自定義標籤
+    if food_labels is None:
+        food_labels = get_labels()
+
+    # 僅返回高於閾值的標籤
+    return {label: prob for label, prob in zip(food_labels, probs) if prob > threshold}
@@ -0,0 +1,158 @@
+import os
+
+import torch
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 推理後端設定（可由環境變數覆寫）
+BACKEND_NAME = os.getenv("FOOD_BACKEND", "eager")  # eager / int8 / torchscript / compile / onnx
+NUM_THREADS = int(os.getenv("FOOD_NUM_THREADS", "0"))  # intra-op 執行緒數，0 表示使用框架預設值
+DEVICE = os.getenv("FOOD_DEVICE", "cpu")  # 只有 eager 後端支援 cuda
+ONNX_MODEL_FILE = os.path.join(BASE_DIR, "cache/onnx/food.onnx")
+INPUT_SIZE = 224
+
+
+class _LogitsOnly(torch.nn.Module):
+    """把 transformers 模型包成只吃 pixel_values、只回傳 logits 的模組，方便 trace / export。"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values, return_dict=False)[0]
+
+
+def _example_input(batch_size=1):
+    return torch.zeros(batch_size, 3, INPUT_SIZE, INPUT_SIZE)
+
+
+class EagerBackend:
+    """原始 fp32 PyTorch 模型。"""
+
+    name = "eager"
+
+    def __init__(self, model, num_threads=NUM_THREADS, device=DEVICE):
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.device = device
+        self.model = model.to(device).eval()
+
+    def predict(self, pixel_values):
+        """輸入 (N, 3, H, W) 的 pixel_values，回傳 CPU 上的 (N, num_labels) logits。"""
+        with torch.inference_mode():
+            return self.model(pixel_values=pixel_values.to(self.device)).logits.cpu()
+
+
+class LowResolutionBackend(EagerBackend):
+    """
+    同一個 ViT 以較小的輸入尺寸執行（內插位置編碼），patch 數隨邊長平方減少，
+    作為信心分流的第一階段；不需要額外的權重，標籤空間與完整模型相同。
+    """
+
+    name = "lowres"
+
+    def predict(self, pixel_values):
+        with torch.inference_mode():
+            return self.model(pixel_values=pixel_values.to(self.device), interpolate_pos_encoding=True).logits.cpu()
+
+
+class Int8Backend(EagerBackend):
+    """Linear 層做動態 int8 量化，ViT 的運算大多在 Linear，CPU 上最划算。"""
+
+    name = "int8"
+
+    def __init__(self, model, num_threads=NUM_THREADS):
+        quantized = torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        super().__init__(quantized, num_threads=num_threads, device="cpu")
+
+
+class TorchScriptBackend:
+    """trace 後 freeze，移除 Python 端的呼叫開銷並做運算子融合。"""
+
+    name = "torchscript"
+
+    def __init__(self, model, num_threads=NUM_THREADS):
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        with torch.inference_mode():
+            traced = torch.jit.trace(_LogitsOnly(model.cpu().eval()), _example_input(), check_trace=False)
+        self.module = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+    def predict(self, pixel_values):
+        with torch.inference_mode():
+            return self.module(pixel_values)
+
+
+class CompileBackend:
+    """torch.compile（inductor），第一次呼叫各批次大小時會編譯，建議搭配預熱。"""
+
+    name = "compile"
+
+    def __init__(self, model, num_threads=NUM_THREADS):
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.module = torch.compile(_LogitsOnly(model.cpu().eval()), dynamic=True)
+
+    def predict(self, pixel_values):
+        with torch.inference_mode():
+            return self.module(pixel_values)
+
+
+class OnnxBackend:
+    """匯出成 ONNX 後以 ONNX Runtime 執行，匯出檔快取在 cache/onnx/ 下。"""
+
+    name = "onnx"
+
+    def __init__(self, model, num_threads=NUM_THREADS, path=ONNX_MODEL_FILE):
+        import onnxruntime
+
+        if not os.path.exists(path):
+            export_onnx(model, path)
+        options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def predict(self, pixel_values):
+        (logits,) = self.session.run(["logits"], {"pixel_values": pixel_values.numpy()})
+        return torch.from_numpy(logits)
+
+
+def export_onnx(model, path=ONNX_MODEL_FILE):
+    """把模型匯出成批次大小可變的 ONNX 檔。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with torch.inference_mode():
+        torch.onnx.export(
+            _LogitsOnly(model.cpu().eval()),
+            (_example_input(),),
+            tmp_path,
+            input_names=["pixel_values"],
+            output_names=["logits"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17,
+        )
+    os.replace(tmp_path, path)
+
+
+BACKENDS = {backend.name: backend for backend in (EagerBackend, Int8Backend, TorchScriptBackend, CompileBackend, OnnxBackend)}
+
+
+def create_backend(model, name=BACKEND_NAME, num_threads=NUM_THREADS):
+    """
+    依名稱建立推理後端。
+
+    Args:
+        model: transformers 圖像分類模型。
+        name (str): 後端名稱，見 BACKENDS。
+        num_threads (int): intra-op 執行緒數。
+
+    Returns:
+        具有 predict(pixel_values) 方法的後端物件。
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"未知的推理後端 {name}，可用：{', '.join(BACKENDS)}")
+    return BACKENDS[name](model, num_threads=num_threads)
@@ -0,0 +1,197 @@
+import json
+import os
+import queue
+import socket
+import threading
+
+import numpy as np
+
+import image_recognition
+from image_recognition import MAX_MEAL_IMAGES
+from inference_server import HEADER, INFERENCE_SOCKET, MAX_PAYLOAD, OP_HEALTH, OP_RECOGNIZE, OP_RECOGNIZE_BATCH, STATUS_OK, pack_images
+from metrics import metrics
+
+# 用戶端設定（可由環境變數覆寫）
+INFERENCE_TIMEOUT = float(os.getenv("FOOD_INFERENCE_TIMEOUT", "30"))  # 單次請求逾時（秒）
+INFERENCE_POOL_SIZE = int(os.getenv("FOOD_INFERENCE_POOL_SIZE", "8"))  # 保留的閒置連線數
+INFERENCE_FALLBACK = os.getenv("FOOD_INFERENCE_FALLBACK", "1").lower() in ("1", "true", "yes")  # 服務無法連線時改在本行程推理
+
+
+class InferenceUnavailable(ConnectionError):
+    """推理服務無法連線或連線中斷（可改在本行程推理）。"""
+
+
+class InferenceTimeout(Exception):
+    """推理服務在逾時內沒有回應：服務仍在執行只是太慢，改在本行程推理只會更慢，直接回報錯誤。"""
+
+
+class InferenceClient:
+    """
+    推理服務（inference_server.py）的同步用戶端，在推理執行緒池中呼叫。
+
+    連線用完放回池中重複使用；連線出錯時直接丟棄，下次再重新連線。
+    """
+
+    def __init__(self, path, timeout=INFERENCE_TIMEOUT, pool_size=INFERENCE_POOL_SIZE):
+        self.path = path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._labels = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise InferenceUnavailable(f"無法連線到推理服務：{e}") from e
+        return sock
+
+    def _recv_exactly(self, sock, size):
+        chunks = []
+        while size:
+            chunk = sock.recv(min(size, 1 << 20))
+            if not chunk:
+                raise InferenceUnavailable("推理服務中斷連線")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _request(self, op, payload=b""):
+        try:
+            sock = self._idle.get_nowait()
+        except queue.Empty:
+            return self._exchange(self._connect(), op, payload)
+        try:
+            return self._exchange(sock, op, payload)
+        except InferenceUnavailable:
+            # 閒置的連線可能已被服務端關閉（例如服務重新啟動），以新連線重送一次
+            return self._exchange(self._connect(), op, payload)
+
+    def _exchange(self, sock, op, payload):
+        """在 sock 上送出一個請求並讀取回應，成功後把連線放回池中。"""
+        try:
+            sock.sendall(HEADER.pack(op, len(payload)) + payload)
+            status, length = HEADER.unpack(self._recv_exactly(sock, HEADER.size))
+            if length > MAX_PAYLOAD:
+                raise InferenceUnavailable("推理服務回應格式錯誤")
+            body = self._recv_exactly(sock, length)
+        except TimeoutError as e:
+            sock.close()
+            raise InferenceTimeout(f"推理服務 {self.timeout:g} 秒內沒有回應") from e
+        except OSError as e:
+            sock.close()
+            if isinstance(e, InferenceUnavailable):
+                raise
+            raise InferenceUnavailable(f"推理服務連線中斷：{e}") from e
+        try:
+            self._idle.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+        if status != STATUS_OK:
+            raise Exception(body.decode("utf-8"))
+        return body
+
+    def health(self):
+        """回傳推理服務狀態 dict（status 為 "ok" 表示模型已就緒）。"""
+        return json.loads(self._request(OP_HEALTH))
+
+    def labels(self):
+        if self._labels is None:
+            info = self.health()
+            if info["status"] != "ok":
+                raise InferenceUnavailable("推理服務尚在載入模型")
+            self._labels = info["labels"]
+        return self._labels
+
+    def recognize(self, data):
+        """回傳所有類別的機率（順序同 labels()）。"""
+        body = self._request(OP_RECOGNIZE, data)
+        return np.frombuffer(body, dtype="<f4").tolist()
+
+    def recognize_batch(self, datas):
+        """
+        多張圖片一次送出；回傳列表，成功為機率列表，失敗為 Exception。
+
+        超過 MAX_MEAL_IMAGES 張時分成多個請求，每個請求都在服務端的 MAX_PAYLOAD 之內。
+        """
+        results = []
+        for start in range(0, len(datas), MAX_MEAL_IMAGES):
+            results.extend(self._recognize_chunk(datas[start:start + MAX_MEAL_IMAGES]))
+        return results
+
+    def _recognize_chunk(self, datas):
+        body = self._request(OP_RECOGNIZE_BATCH, pack_images(datas))
+        results, offset = [], 0
+        for _ in datas:
+            status, length = HEADER.unpack_from(body, offset)
+            offset += HEADER.size
+            item = body[offset:offset + length]
+            offset += length
+            if status == STATUS_OK:
+                results.append(np.frombuffer(item, dtype="<f4").tolist())
+            else:
+                results.append(Exception(item.decode("utf-8")))
+        return results
+
+
+# 設定 FOOD_INFERENCE_SOCKET 時改用推理服務，否則在本行程推理
+inference_client = InferenceClient(INFERENCE_SOCKET) if INFERENCE_SOCKET else None
+_fallback_lock = threading.Lock()
+_fallback_reported = False
+
+
+def _fall_back(error):
+    global _fallback_reported
+    if not INFERENCE_FALLBACK:
+        raise Exception(f"圖像辨識錯誤：{error}")
+    metrics.incr("errors_total", stage="inference_server")
+    with _fallback_lock:
+        if not _fallback_reported:
+            _fallback_reported = True
+            print(f"{error}，改在本行程推理")
+
+
+def uses_server():
+    return inference_client is not None
+
+
+def get_labels():
+    """依類別索引排列的模型標籤，來源與 recognize_food_bytes 相同。"""
+    if inference_client is not None:
+        try:
+            return inference_client.labels()
+        except InferenceUnavailable as e:
+            _fall_back(e)
+    return image_recognition.get_labels()
+
+
+def recognize_food_bytes(data):
+    """
+    辨識圖片位元組，回傳所有類別的 softmax 機率；有設定推理服務時送到服務端。
+
+    服務無法連線且允許退回（FOOD_INFERENCE_FALLBACK=1）時改在本行程推理。
+    """
+    if inference_client is not None:
+        try:
+            with metrics.timer("remote_inference"):
+                return inference_client.recognize(data)
+        except InferenceUnavailable as e:
+            _fall_back(e)
+    return image_recognition.recognize_food_bytes(data)
+
+
+def recognize_food_batch(datas):
+    """
+    一次辨識多張圖片（同一個批次），回傳與輸入順序相同的列表，失敗的圖片為 Exception。
+
+    有設定推理服務時整組送到服務端，規則同 recognize_food_bytes。
+    """
+    if inference_client is not None:
+        try:
+            with metrics.timer("remote_inference"):
+                return inference_client.recognize_batch(datas)
+        except InferenceUnavailable as e:
+            _fall_back(e)
+    return image_recognition.recognize_food_batch(datas)
@@ -0,0 +1,194 @@
+"""
+獨立的圖像辨識推理服務：一個行程持有模型，多個 bot 行程（或分片）透過 Unix socket 共用。
+
+用法：
+    python core/inference_server.py [--socket /tmp/food_inference.sock] [--cpus 0-3] [--threads 4]
+
+bot 端設定 FOOD_INFERENCE_SOCKET 為相同路徑即改用此服務（見 inference_client.py）。
+
+通訊格式（每個連線可連續送出多個請求，依序回應）：
+    請求：1 位元組操作碼 + 4 位元組長度（big-endian）+ 內容
+        b"R" 辨識，內容為圖片原始位元組
+        b"B" 多張圖片一起辨識，內容為 4 位元組張數，接著每張圖為 4 位元組長度 + 原始位元組
+    內容長度超過 MAX_PAYLOAD（MAX_MEAL_IMAGES 張 MAX_IMAGE_BYTES 的圖片）時回應 b"E"；用戶端一次最多送 MAX_MEAL_IMAGES 張
+        b"H" 健康檢查，內容為空
+    回應：1 位元組狀態 + 4 位元組長度 + 內容
+        b"O" 成功：辨識回傳 float32（little-endian）機率向量，順序同模型標籤；健康檢查回傳 JSON；
+             多張辨識依序為每張圖的「狀態 + 長度 + 內容」（個別圖片失敗不影響其他圖片）
+        b"E" 失敗：內容為 UTF-8 錯誤訊息
+"""
+import argparse
+import asyncio
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from executors import inference_executor
+from image_recognition import MAX_IMAGE_BYTES, MAX_MEAL_IMAGES, batcher, get_labels, recognize_food_batch, recognize_food_bytes, warm_up
+
+# 推理服務設定（可由環境變數覆寫）
+INFERENCE_SOCKET = os.getenv("FOOD_INFERENCE_SOCKET", "")
+DEFAULT_SOCKET = "/tmp/food_inference.sock"
+
+HEADER = struct.Struct(">cI")
+OP_RECOGNIZE = b"R"
+OP_RECOGNIZE_BATCH = b"B"
+OP_HEALTH = b"H"
+STATUS_OK = b"O"
+STATUS_ERROR = b"E"
+COUNT = struct.Struct(">I")
+# 單一請求的內容上限：一餐最多 MAX_MEAL_IMAGES 張、每張最多 MAX_IMAGE_BYTES 的多張辨識請求（含長度欄位）
+MAX_PAYLOAD = COUNT.size + MAX_MEAL_IMAGES * (COUNT.size + MAX_IMAGE_BYTES)
+
+
+def encode_probs(probs):
+    return np.asarray(probs, dtype="<f4").tobytes()
+
+
+def pack_images(datas):
+    return COUNT.pack(len(datas)) + b"".join(COUNT.pack(len(data)) + data for data in datas)
+
+
+def unpack_images(payload):
+    (count,), offset, datas = COUNT.unpack_from(payload), COUNT.size, []
+    for _ in range(count):
+        (length,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        datas.append(payload[offset:offset + length])
+        offset += length
+    return datas
+
+
+def parse_cpus(text):
+    """'0-3,6' -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in text.split(","):
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+class InferenceServer:
+    """在 asyncio 中接受連線，辨識工作交給推理執行緒池與批次佇列（不同連線的圖片會合併成同一批）。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.started_at = time.time()
+        self.ready = False
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+
+    def health(self):
+        return {
+            "status": "ok" if self.ready else "loading",
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started_at,
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections": self.connections,
+            "queue": batcher._queue.qsize(),
+            "labels": get_labels() if self.ready else [],
+        }
+
+    async def _recognize(self, data):
+        return encode_probs(await inference_executor.run(recognize_food_bytes, data))
+
+    async def _recognize_batch(self, payload):
+        results = await inference_executor.run(recognize_food_batch, unpack_images(payload))
+        parts = []
+        for result in results:
+            if isinstance(result, Exception):
+                self.errors += 1
+                status, body = STATUS_ERROR, str(result).encode("utf-8")
+            else:
+                status, body = STATUS_OK, encode_probs(result)
+            parts.append(HEADER.pack(status, len(body)) + body)
+        return b"".join(parts)
+
+    async def _discard(self, reader, length):
+        while length:
+            chunk = await reader.read(min(length, 1 << 20))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", length)
+            length -= len(chunk)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    op, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if length > MAX_PAYLOAD:
+                    # 讀掉內容讓連線保持同步，回覆錯誤而不是直接斷線（斷線會讓用戶端誤判服務離線）
+                    await self._discard(reader, length)
+                    self.errors += 1
+                    body = f"請求過大（{length // 1024} KB），上限為 {MAX_PAYLOAD // 1024} KB".encode("utf-8")
+                    writer.write(HEADER.pack(STATUS_ERROR, len(body)) + body)
+                    await writer.drain()
+                    continue
+                payload = await reader.readexactly(length)
+                try:
+                    if op == OP_RECOGNIZE:
+                        self.requests += 1
+                        body = await self._recognize(payload)
+                    elif op == OP_RECOGNIZE_BATCH:
+                        self.requests += 1
+                        body = await self._recognize_batch(payload)
+                    elif op == OP_HEALTH:
+                        body = json.dumps(self.health()).encode("utf-8")
+                    else:
+                        raise ValueError(f"未知的操作碼：{op!r}")
+                    status = STATUS_OK
+                except Exception as e:
+                    self.errors += 1
+                    status, body = STATUS_ERROR, str(e).encode("utf-8")
+                writer.write(HEADER.pack(status, len(body)) + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        # 先開始接受連線（健康檢查回報 loading），模型預熱完才標記為就緒
+        await inference_executor.run(warm_up)
+        self.ready = True
+        print(f"推理服務就緒：{self.path}（pid {os.getpid()}）")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=INFERENCE_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument("--cpus", help="綁定的 CPU 核心，例如 0-3")
+    parser.add_argument("--threads", type=int, help="intra-op 執行緒數（覆寫 FOOD_NUM_THREADS）")
+    args = parser.parse_args()
+
+    if args.cpus:
+        os.sched_setaffinity(0, parse_cpus(args.cpus))
+    if args.threads:
+        # inference_backends 在第一次載入模型時才匯入，此時設定仍來得及
+        os.environ["FOOD_NUM_THREADS"] = str(args.threads)
+
+    try:
+        asyncio.run(InferenceServer(args.socket).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
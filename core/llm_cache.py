@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# LLM 回應快取設定（可由環境變數覆寫）
+LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE", os.path.join(BASE_DIR, "cache/llm_cache.db"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))  # 記憶體 LRU 上限
+LLM_CACHE_MAX_STORED = int(os.getenv("LLM_CACHE_MAX_STORED", "50000"))  # 磁碟上每個 namespace 的上限
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 86400  # 0 表示永不過期
+PRUNE_EVERY = 100  # 每寫入幾筆檢查一次磁碟上限
+
+# 舊版 JSON 快取
+LEGACY_RECOMMENDATION_CACHE_FILE = os.path.join(BASE_DIR, "cache/recommendation_cache.json")
+LEGACY_QUESTION_CACHE_FILE = os.path.join(BASE_DIR, "cache/question_cache.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace      TEXT NOT NULL,
+    key            TEXT NOT NULL,
+    value          TEXT NOT NULL,
+    prompt_version TEXT,
+    model          TEXT,
+    created_at     REAL NOT NULL,
+    query          TEXT,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_age ON entries(namespace, created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def make_key(payload, prompt_version, model):
+    """
+    以正規化後的輸入、提示版本與模型名稱計算快取鍵。
+
+    Args:
+        payload (dict): 影響回應的輸入，例如 {"summary": [...], "goal": "healthy"}。
+        prompt_version (str): 提示模板版本，模板變更時改版即可讓舊快取失效。
+        model (str): 模型名稱。
+
+    Returns:
+        str: SHA-256 十六進位字串。
+    """
+    canonical = json.dumps(
+        {"payload": payload, "prompt_version": prompt_version, "model": model},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def canonical_summary(nutrition_summary):
+    """只保留會進入提示的欄位，並依食物名稱排序，讓相同餐點得到相同的鍵。"""
+    fields = ("food", "calories", "carbs", "protein", "fat")
+    items = [{field: item.get(field, "未知") for field in fields} for item in nutrition_summary]
+    return sorted(items, key=lambda item: str(item["food"]))
+
+
+class LLMCache:
+    """
+    LLM 回應快取：記憶體 LRU（含 TTL）加上 SQLite 持久化。
+
+    每個 namespace（recommendation / question）共用同一個資料庫，寫入只新增單列；
+    每寫入 PRUNE_EVERY 筆檢查一次，超過 max_stored 時刪除最舊的資料。
+    """
+
+    def __init__(self, path=LLM_CACHE_FILE, memory_entries=LLM_CACHE_MEMORY_ENTRIES, max_stored=LLM_CACHE_MAX_STORED, ttl=LLM_CACHE_TTL):
+        self.memory_entries = memory_entries
+        self.max_stored = max_stored
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()  # (namespace, key) -> (value, created_at)
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # 舊版資料庫沒有 query 欄位
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if "query" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN query TEXT")
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _remember(self, memory_key, value, created_at):
+        self._memory[memory_key] = (value, created_at)
+        self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, namespace, key):
+        """查詢快取，未命中或已過期時回傳 None。"""
+        memory_key = (namespace, key)
+        with self._lock:
+            entry = self._memory.get(memory_key)
+            if entry is None:
+                row = self._conn.execute("SELECT value, created_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(memory_key, *entry)
+            else:
+                self._memory.move_to_end(memory_key)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    self._memory.pop(memory_key, None)
+                    self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, namespace, key, value, prompt_version=None, model=None, query=None):
+        """寫入單筆快取（同時更新記憶體與資料庫），query 為原始問題文字，供相似問題索引使用。"""
+        created_at = time.time()
+        with self._lock:
+            self._remember((namespace, key), value, created_at)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, prompt_version, model, created_at, query) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, value, prompt_version, model, created_at, query),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(namespace)
+
+    def _prune(self, namespace):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()
+        overflow = count - self.max_stored
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries WHERE namespace = ? ORDER BY created_at LIMIT ?)",
+                (namespace, overflow),
+            )
+            self.evictions += overflow
+            # 記憶體中可能還留著被刪除的項目，直接清掉該 namespace，之後會從資料庫重新載入
+            for memory_key in [k for k in self._memory if k[0] == namespace]:
+                del self._memory[memory_key]
+
+    def has(self, namespace, key):
+        """是否有未過期的快取，不影響命中統計與 LRU 順序。"""
+        with self._lock:
+            entry = self._memory.get((namespace, key))
+            if entry is None:
+                entry = self._conn.execute("SELECT value, created_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return entry is not None and not self._expired(entry[1])
+
+    def version_counts(self, namespace):
+        """各 (prompt_version, model) 的筆數，用來確認還有多少舊版提示產生的資料。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prompt_version, model, COUNT(*) FROM entries WHERE namespace = ? GROUP BY 1, 2 ORDER BY 3 DESC", (namespace,)
+            ).fetchall()
+        return [{"prompt_version": row[0], "model": row[1], "count": row[2]} for row in rows]
+
+    def purge_stale(self, namespace, prompt_version, model):
+        """刪除不是由指定提示版本與模型產生的資料（包含沒有記錄版本的資料），回傳刪除筆數。"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND (prompt_version IS NOT ? OR model IS NOT ?)",
+                (namespace, prompt_version, model),
+            )
+            for memory_key in [k for k in self._memory if k[0] == namespace]:
+                del self._memory[memory_key]
+        return cursor.rowcount
+
+    def queries(self, namespace, prompt_version=None):
+        """列出某個 namespace 中有原始問題文字的 (key, query)。"""
+        sql = "SELECT key, query FROM entries WHERE namespace = ? AND query IS NOT NULL"
+        params = (namespace,)
+        if prompt_version is not None:
+            sql += " AND prompt_version = ?"
+            params += (prompt_version,)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def count(self, namespace=None):
+        sql, params = ("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)) if namespace else ("SELECT COUNT(*) FROM entries", ())
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "stored_entries": self.count(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def get_meta(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+
+# 舊版推薦快取鍵：完整提示文字 + "_" + goal，這裡把餐點行解析回 nutrition_summary
+_LEGACY_ITEM = re.compile(r"^- (?P<food>.+?)：熱量 (?P<calories>\S+) kcal，碳水化合物 (?P<carbs>\S+?)g，蛋白質 (?P<protein>\S+?)g，脂肪 (?P<fat>\S+?)g$")
+
+
+def _legacy_number(value):
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def parse_legacy_recommendation_key(cache_key):
+    """把舊版推薦快取鍵解析成 (nutrition_summary, goal)，無法解析時回傳 None。"""
+    for goal in ("weight_loss", "healthy"):
+        if cache_key.endswith(f"_{goal}"):
+            break
+    else:
+        return None
+    summary = []
+    for line in cache_key.splitlines():
+        match = _LEGACY_ITEM.match(line)
+        if match:
+            item = match.groupdict()
+            summary.append({field: item[field] if field == "food" else _legacy_number(item[field]) for field in item})
+    return (summary, goal) if summary else None
+
+
+def parse_legacy_question_key(cache_key):
+    """舊版問題快取鍵為完整提示文字（更早期則直接是問題本身）。"""
+    marker = "問題："
+    return cache_key.split(marker, 1)[1] if marker in cache_key else cache_key
+
+
+def migrate_legacy_caches(cache, recommendation_key_fn, question_key_fn, recommendation_path=LEGACY_RECOMMENDATION_CACHE_FILE, question_path=LEGACY_QUESTION_CACHE_FILE):
+    """
+    一次性匯入舊版 JSON 快取，完成後在 meta 表記錄，之後不再重複匯入。
+
+    Args:
+        cache (LLMCache): 目標快取。
+        recommendation_key_fn (callable): (nutrition_summary, goal) -> (namespace, key, prompt_version, model)。
+        question_key_fn (callable): question -> (namespace, key, prompt_version, model)。
+
+    Returns:
+        int: 匯入的筆數。
+    """
+    if cache.get_meta("legacy_json_migrated"):
+        return 0
+    imported = 0
+    for path, parse, key_fn in (
+        (recommendation_path, parse_legacy_recommendation_key, lambda parsed: recommendation_key_fn(*parsed)),
+        (question_path, parse_legacy_question_key, question_key_fn),
+    ):
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        for legacy_key, value in legacy.items():
+            parsed = parse(legacy_key)
+            if parsed is None:
+                continue
+            namespace, key, prompt_version, model = key_fn(parsed)
+            query = parsed if isinstance(parsed, str) else None
+            cache.set(namespace, key, value, prompt_version=prompt_version, model=model, query=query)
+            imported += 1
+    cache.set_meta("legacy_json_migrated", str(time.time()))
+    return imported
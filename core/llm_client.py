@@ -0,0 +1,253 @@
+import asyncio
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # 未安裝 google SDK 時（例如使用假客戶端測試）
+    google_exceptions = None
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 用戶端設定（可由環境變數覆寫）
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "15"))  # 對應 Gemini 配額的每分鐘請求數
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))  # 令牌桶容量，允許的瞬間突發請求數
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))  # 同時進行中的 API 呼叫上限
+LLM_MAX_PENDING = int(os.getenv("LLM_MAX_PENDING", "32"))  # 排隊 + 執行中的上限，超過直接拒絕
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))  # 單次呼叫逾時（秒）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = 0.5  # 第一次重試前的基準等待秒數
+LLM_BACKOFF_MAX = 8.0
+
+
+class LLMError(Exception):
+    """LLM 呼叫失敗，訊息可直接顯示給使用者。"""
+
+
+class LLMOverloaded(LLMError):
+    """排隊請求過多，為保護配額直接拒絕。"""
+
+
+def _retryable_errors():
+    errors = (asyncio.TimeoutError, ConnectionError)
+    if google_exceptions is not None:
+        errors += (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.TooManyRequests,
+        )
+    return errors
+
+
+RETRYABLE_ERRORS = _retryable_errors()
+
+
+class TokenBucket:
+    """
+    非同步令牌桶限流：每秒補充 rate 個令牌，最多累積 capacity 個。
+
+    等待中的呼叫者依序取得令牌。
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+def _default_model_factory(model_name):
+    """建立真正的 Gemini 模型物件，第一次使用時才讀取 API Key。"""
+    import google.generativeai as genai
+
+    if not getattr(_default_model_factory, "configured", False):
+        env_file = os.path.join(BASE_DIR, "test.env" if os.path.exists(os.path.join(BASE_DIR, "test.env")) else ".env")
+        load_dotenv(env_file)
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise LLMError("錯誤：未找到 GEMINI_API_KEY，請在 test.env 或 .env 檔案中設置正確的 API Key。")
+        genai.configure(api_key=api_key)
+        _default_model_factory.configured = True
+    return genai.GenerativeModel(model_name)
+
+
+class GeminiClient:
+    """
+    共用的非同步 Gemini 用戶端。
+
+    - 依模型名稱重用 GenerativeModel 物件（底層連線也一併重用）
+    - 使用 generate_content_async，不佔用執行緒
+    - 令牌桶限流、並行上限與排隊上限，佇列過深時直接丟出 LLMOverloaded
+    - 每次呼叫有逾時，可重試的錯誤以含抖動的指數退避重試
+
+    model_factory 可替換成回傳假模型的函式，方便在沒有網路時測試。
+    """
+
+    def __init__(
+        self,
+        model_factory=_default_model_factory,
+        rate_per_minute=LLM_RATE_PER_MINUTE,
+        burst=LLM_BURST,
+        concurrency=LLM_CONCURRENCY,
+        max_pending=LLM_MAX_PENDING,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+    ):
+        self.model_factory = model_factory
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pending = 0  # 排隊中 + 執行中
+        self.running = 0
+        self.requests = 0  # 實際送出的 API 呼叫（含重試）
+        self.retries = 0
+        self.errors = 0
+        self.rejected = 0
+        self._models = {}
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def model(self, model_name):
+        if model_name not in self._models:
+            self._models[model_name] = self.model_factory(model_name)
+        return self._models[model_name]
+
+    def _backoff(self, attempt):
+        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    async def generate(self, prompt, model_name, generation_config=None):
+        """
+        送出提示並回傳去除前後空白的回應文字。
+
+        Raises:
+            LLMOverloaded: 排隊請求已達上限。
+            LLMError: 逾時或重試後仍失敗。
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise LLMOverloaded("目前詢問的人太多了，請稍後再試 🙏")
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                self.running += 1
+                try:
+                    return await self._generate_with_retry(prompt, model_name, generation_config)
+                finally:
+                    self.running -= 1
+        finally:
+            self.pending -= 1
+
+    async def _generate_with_retry(self, prompt, model_name, generation_config):
+        model = self.model(model_name)
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self.requests += 1
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(prompt, generation_config=generation_config),
+                    timeout=self.timeout,
+                )
+                return response.text.strip()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    self.errors += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise LLMError("Gemini 回應逾時，請稍後再試") from e
+                    raise LLMError(f"Gemini API 暫時無法使用：{e}") from e
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            except Exception as e:
+                self.errors += 1
+                raise LLMError(f"Gemini API 錯誤：{e}") from e
+
+    async def stream(self, prompt, model_name, generation_config=None):
+        """
+        串流版的 generate：逐段 yield 回應文字（generate_content_async(stream=True)）。
+
+        限流、並行與排隊上限和 generate 相同，逾時以「等待下一段」計算；
+        尚未收到任何文字前的可重試錯誤會重試，開始輸出後才失敗則直接丟出 LLMError。
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise LLMOverloaded("目前詢問的人太多了，請稍後再試 🙏")
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                self.running += 1
+                try:
+                    async for text in self._stream_with_retry(prompt, model_name, generation_config):
+                        yield text
+                finally:
+                    self.running -= 1
+        finally:
+            self.pending -= 1
+
+    async def _stream_with_retry(self, prompt, model_name, generation_config):
+        model = self.model(model_name)
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self.requests += 1
+            started = False
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(prompt, generation_config=generation_config, stream=True),
+                    timeout=self.timeout,
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    text = chunk.text if started else chunk.text.lstrip()
+                    if text:
+                        started = True
+                        yield text
+            except RETRYABLE_ERRORS as e:
+                if started or attempt >= self.max_retries:
+                    self.errors += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise LLMError("Gemini 回應逾時，請稍後再試") from e
+                    raise LLMError(f"Gemini API 暫時無法使用：{e}") from e
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            except Exception as e:
+                self.errors += 1
+                raise LLMError(f"Gemini API 錯誤：{e}") from e
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "limit": self.concurrency,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "rejected": self.rejected,
+        }
+
+
+gemini_client = GeminiClient()
@@ -1,49 +1,153 @@
-import json
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# 專案根目錄（即本檔案的上層目錄）
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# 載入環境變數
-env_file = os.path.join(BASE_DIR, "test.env" if os.path.exists(os.path.join(BASE_DIR, "test.env")) else ".env")
-if not os.path.exists(env_file):
-    raise FileNotFoundError(f"錯誤：無法找到 {env_file} 檔案，請確認檔案存在於 {BASE_DIR} 目錄。")
-if not load_dotenv(env_file):
-    raise RuntimeError(f"錯誤：無法載入 {env_file} 檔案，請檢查檔案格式或權限。")
-
-# Gemini API 配置
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("錯誤：未找到 GEMINI_API_KEY，請在 test.env 或 .env 檔案中設置正確的 API Key。")
-
-genai.configure(api_key=GEMINI_API_KEY)
-
-# 本地快取檔案
-RECOMMENDATION_CACHE_FILE = os.path.join(BASE_DIR, "cache/recommendation_cache.json")
-QUESTION_CACHE_FILE = os.path.join(BASE_DIR, "cache/question_cache.json")
-
-# 初始化快取檔案
-if not os.path.exists(RECOMMENDATION_CACHE_FILE):
-    with open(RECOMMENDATION_CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump({}, f)
-if not os.path.exists(QUESTION_CACHE_FILE):
-    with open(QUESTION_CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump({}, f)
-
-def generate_diet_recommendation(nutrition_summary, goal="healthy"):
+import asyncio
+import threading
+import time
+
+import llm_client
+from executors import storage_executor
+from metrics import metrics
+from llm_cache import LLMCache, canonical_summary, make_key, migrate_legacy_caches
+from semantic_cache import QuestionIndex
+from singleflight import SingleFlight
+
+# 模型與提示版本（修改提示模板時請更新版本，舊快取會自動失效）
+MODEL_NAME = "gemini-2.0-flash"
+RECOMMENDATION_PROMPT_VERSION = "rec-v1"
+QUESTION_PROMPT_VERSION = "ask-v1"
+
+
+def recommendation_cache_key(nutrition_summary, goal):
+    payload = {"summary": canonical_summary(nutrition_summary), "goal": goal}
+    return "recommendation", make_key(payload, RECOMMENDATION_PROMPT_VERSION, MODEL_NAME), RECOMMENDATION_PROMPT_VERSION, MODEL_NAME
+
+
+def question_cache_key(question):
+    payload = {"question": question.strip()}
+    return "question", make_key(payload, QUESTION_PROMPT_VERSION, MODEL_NAME), QUESTION_PROMPT_VERSION, MODEL_NAME
+
+
+# 本地快取（記憶體 LRU + SQLite），第一次啟動時匯入舊版 JSON 快取
+llm_cache = LLMCache()
+migrate_legacy_caches(llm_cache, recommendation_cache_key, question_cache_key)
+
+# 已快取問題的相似度索引：啟動時在背景執行緒建立（10 萬筆約數秒），完成前略過相似問題查詢
+question_index = None
+_question_index_task = None
+_question_index_lock = threading.Lock()
+_pending_questions = []  # 索引建立期間新增的問題，完成時補進索引
+
+
+def build_question_index():
+    """從快取中的原始問題建立索引（阻塞，請在執行緒中呼叫）。"""
+    global question_index
+    index = QuestionIndex()
+    for key, query in llm_cache.queries("question", QUESTION_PROMPT_VERSION):
+        index.add(query, key)
+    with _question_index_lock:
+        for query, key in _pending_questions:
+            index.add(query, key)
+        _pending_questions.clear()
+        question_index = index
+    return index
+
+
+def start_question_index():
+    """在目前的事件迴圈以背景執行緒建立索引（重複呼叫不會建立第二次）。"""
+    global _question_index_task
+    if _question_index_task is None:
+        _question_index_task = asyncio.get_running_loop().create_task(asyncio.to_thread(build_question_index))
+    return _question_index_task
+
+
+def add_to_question_index(question, key):
+    with _question_index_lock:
+        if question_index is None:
+            _pending_questions.append((question, key))
+            return
+    question_index.add(question, key)
+
+
+# 相同快取鍵的同時請求只送出一次 Gemini API 呼叫
+inflight_requests = SingleFlight()
+metrics.register_gauge("llm_inflight", lambda: inflight_requests.stats()["inflight"])
+metrics.register_gauge("gemini_pending", lambda: llm_client.gemini_client.stats()["pending"])
+metrics.register_gauge("gemini_running", lambda: llm_client.gemini_client.stats()["running"])
+
+
+async def _generate_uncached(cache_entry, prompt, max_output_tokens, query=None):
     """
-    使用 Google Gemini API 生成飲食建議，優化為繁體中文和台灣飲食文化。
-    
+    快取未命中時呼叫 Gemini 並寫入快取；相同鍵的同時請求共用同一次呼叫，錯誤不會寫入快取。
+
     Args:
-        nutrition_summary (list): 營養分析結果，包含食物名稱和營養數據。
-        goal (str): 目標，"healthy" 或 "weight_loss"。
-    
+        cache_entry (tuple): recommendation_cache_key / question_cache_key 的回傳值。
+        prompt (str): 提示文字。
+        max_output_tokens (int): 回應長度上限。
+        query (str): 原始問題文字，會一併存入快取供相似問題比對。
+
     Returns:
-        str: 飲食建議，或錯誤訊息。
+        str: 模型回應文字。
     """
-    # 構建提示
+    namespace, cache_key, prompt_version, model_name = cache_entry
+
+    async def call():
+        try:
+            with metrics.timer("gemini_call"):
+                text = await llm_client.gemini_client.generate(
+                    prompt,
+                    model_name,
+                    generation_config={
+                        "max_output_tokens": max_output_tokens,
+                        "temperature": 0.7
+                    }
+                )
+        except Exception:
+            metrics.incr("errors_total", stage="gemini")
+            raise
+
+        # 儲存到快取（SQLite 寫入與定期清理在儲存執行緒池中執行）
+        await storage_executor.run(llm_cache.set, namespace, cache_key, text, prompt_version=prompt_version, model=model_name, query=query)
+        return text
+
+    return await inflight_requests.do((namespace, cache_key), call)
+
+
+async def _stream_uncached(cache_entry, prompt, max_output_tokens, query=None):
+    """
+    快取未命中時以串流呼叫 Gemini，每收到一段就 yield 目前累積的完整文字。
+
+    相同鍵的同時請求（串流或非串流）共用同一次呼叫；串流完整結束後才寫入一次快取，
+    中途失敗的部分回應不會進入快取。
+    """
+    namespace, cache_key, prompt_version, model_name = cache_entry
+
+    async def produce():
+        text = ""
+        start = time.perf_counter()
+        try:
+            async for chunk in llm_client.gemini_client.stream(
+                prompt,
+                model_name,
+                generation_config={
+                    "max_output_tokens": max_output_tokens,
+                    "temperature": 0.7
+                }
+            ):
+                if not text:
+                    metrics.observe("llm_first_token", time.perf_counter() - start)
+                text += chunk
+                yield text
+        except Exception:
+            metrics.incr("errors_total", stage="gemini")
+            raise
+        metrics.observe("gemini_call", time.perf_counter() - start)
+
+        if text.strip():
+            await storage_executor.run(llm_cache.set, namespace, cache_key, text.strip(), prompt_version=prompt_version, model=model_name, query=query)
+
+    async for text in inflight_requests.stream((namespace, cache_key), produce):
+        yield text
+
+
+def recommendation_prompt(nutrition_summary, goal):
     prompt = (
         "你是專精台灣飲食的營養師，使用繁體中文，語氣親切，適合台灣年輕人。根據以下餐點分析，提供100字內的飲食建議，"
         "餐點分析：\n"
@@ -59,36 +163,81 @@ def generate_diet_recommendation(nutrition_summary, goal="healthy"):
         prompt += "建議如何平衡今日剩餘飲食，保持健康，考慮台灣飲食習慣。"
     elif goal == "weight_loss":
         prompt += "根據這餐早餐，建議減重飲食計畫，考慮台灣飲食習慣。"
+    return prompt
 
+
+def question_prompt(question):
+    return (
+        "你是一位知識淵博的助手，專精台灣文化，使用繁體中文，語氣親切，適合台灣年輕人。請回答以下問題，答案簡潔且不超過150字：\n"
+        f"問題：{question}"
+    )
+
+
+async def _cached_recommendation(cache_entry):
+    with metrics.timer("llm_cache_lookup"):
+        cached = await storage_executor.run(llm_cache.get, *cache_entry[:2])
+    metrics.incr("cache_misses_total" if cached is None else "cache_hits_total", cache="recommendation")
+    return cached
+
+
+async def _cached_answer(question, cache_entry):
+    """先查完全相同的問題，再查換句話說的相同問題；SQLite 查詢在儲存執行緒池中執行。"""
+    with metrics.timer("llm_cache_lookup"):
+        cached = await storage_executor.run(llm_cache.get, *cache_entry[:2])
+        if cached is None:
+            # 換句話說的相同問題；索引尚未建立完成時不查（第一次提問時才開始建立）
+            index = question_index
+            if index is None:
+                start_question_index()
+            else:
+                match = index.search(question)
+                if match is not None:
+                    cached = await storage_executor.run(llm_cache.get, "question", match[0])
+    metrics.incr("cache_misses_total" if cached is None else "cache_hits_total", cache="question")
+    return cached
+
+
+async def generate_diet_recommendation(nutrition_summary, goal="healthy"):
+    """
+    使用 Google Gemini API 生成飲食建議，優化為繁體中文和台灣飲食文化。
+    
+    Args:
+        nutrition_summary (list): 營養分析結果，包含食物名稱和營養數據。
+        goal (str): 目標，"healthy" 或 "weight_loss"。
+    
+    Returns:
+        str: 飲食建議。
+
+    Raises:
+        llm_client.LLMError: API 呼叫失敗，訊息可直接顯示給使用者。
+    """
     # 檢查快取
-    with open(RECOMMENDATION_CACHE_FILE, "r", encoding="utf-8") as f:
-        cache = json.load(f)
-    cache_key = f"{prompt}_{goal}"
-    if cache_key in cache:
-        return cache[cache_key]
+    cache_entry = recommendation_cache_key(nutrition_summary, goal)
+    cached = await _cached_recommendation(cache_entry)
+    if cached is not None:
+        return cached
 
     # Gemini API 呼叫
-    try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 100,
-                "temperature": 0.7
-            }
-        )
-        recommendation = response.text.strip()
-
-        # 儲存到快取
-        cache[cache_key] = recommendation
-        with open(RECOMMENDATION_CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(cache, f, indent=2, ensure_ascii=False)
-
-        return recommendation
-    except Exception as e:
-        return f"Gemini API 錯誤：{str(e)}"
-
-def answer_question(question):
+    return await _generate_uncached(cache_entry, recommendation_prompt(nutrition_summary, goal), max_output_tokens=100)
+
+
+async def stream_diet_recommendation(nutrition_summary, goal="healthy"):
+    """
+    串流版的 generate_diet_recommendation：逐步 yield 目前累積的建議文字，快取命中時只 yield 一次完整文字。
+
+    Raises:
+        llm_client.LLMError: API 呼叫失敗，訊息可直接顯示給使用者。
+    """
+    cache_entry = recommendation_cache_key(nutrition_summary, goal)
+    cached = await _cached_recommendation(cache_entry)
+    if cached is not None:
+        yield cached
+        return
+    async for text in _stream_uncached(cache_entry, recommendation_prompt(nutrition_summary, goal), max_output_tokens=100):
+        yield text
+
+
+async def answer_question(question):
     """
     使用 Google Gemini API 回答用戶問題，優化為繁體中文，適合台灣年輕人。
     
@@ -96,38 +245,35 @@ def answer_question(question):
         question (str): 用戶輸入的問題。
     
     Returns:
-        str: 回答，或錯誤訊息。
-    """
-    # 構建提示
-    prompt = (
-        "你是一位知識淵博的助手，專精台灣文化，使用繁體中文，語氣親切，適合台灣年輕人。請回答以下問題，答案簡潔且不超過150字：\n"
-        f"問題：{question}"
-    )
+        str: 回答。
 
-    # 檢查快取
-    with open(QUESTION_CACHE_FILE, "r", encoding="utf-8") as f:
-        cache = json.load(f)
-    cache_key = f"{prompt}"
-    if cache_key in cache:
-        return cache[cache_key]
+    Raises:
+        llm_client.LLMError: API 呼叫失敗，訊息可直接顯示給使用者。
+    """
+    # 檢查快取（含換句話說的相同問題）
+    cache_entry = question_cache_key(question)
+    cached = await _cached_answer(question, cache_entry)
+    if cached is not None:
+        return cached
 
     # Gemini API 呼叫
-    try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 150,
-                "temperature": 0.7
-            }
-        )
-        answer = response.text.strip()
-
-        # 儲存到快取
-        cache[cache_key] = answer
-        with open(QUESTION_CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(cache, f, indent=2, ensure_ascii=False)
-
-        return answer
-    except Exception as e:
-        return f"Gemini API 錯誤：{str(e)}"
\ No newline at end of file
+    answer = await _generate_uncached(cache_entry, question_prompt(question), max_output_tokens=150, query=question)
+    add_to_question_index(question, cache_entry[1])
+    return answer
+
+
+async def stream_answer(question):
+    """
+    串流版的 answer_question：逐步 yield 目前累積的回答，快取命中時只 yield 一次完整文字。
+
+    Raises:
+        llm_client.LLMError: API 呼叫失敗，訊息可直接顯示給使用者。
+    """
+    cache_entry = question_cache_key(question)
+    cached = await _cached_answer(question, cache_entry)
+    if cached is not None:
+        yield cached
+        return
+    async for text in _stream_uncached(cache_entry, question_prompt(question), max_output_tokens=150, query=question):
+        yield text
+    add_to_question_index(question, cache_entry[1])
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 監控設定（可由環境變數覆寫）
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # > 0 時在 127.0.0.1 提供 Prometheus 文字格式
+METRICS_JSON_LOG = os.getenv("METRICS_JSON_LOG", "")  # 設定路徑時每個請求寫一行 JSON
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))  # 每個階段保留最近幾筆耗時計算百分位數
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class StageTimings:
+    """單一階段的耗時：累計次數與總和，加上最近 window 筆樣本供計算百分位數。"""
+
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    """
+    輕量的效能監控：各階段耗時（p50/p95/p99）、計數器與即時量測值（佇列深度等）。
+
+    enabled 為 False 時所有記錄方法都直接返回，幾乎沒有額外成本。
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, json_log=METRICS_JSON_LOG):
+        self.enabled = enabled
+        self.json_log = json_log
+        self.timings = {}  # stage -> StageTimings
+        self.counters = {}  # (name, label_key) -> value
+        self.gauges = {}  # name -> callable，回傳數值或 {label_key: 數值}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            timings = self.timings.get(stage)
+            if timings is None:
+                timings = self.timings[stage] = StageTimings()
+            timings.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, trace=None):
+        """
+        量測區塊耗時並記錄到 stage；若傳入 trace（dict），同時把秒數寫入 trace[stage]。
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(stage, elapsed)
+            if trace is not None:
+                trace[stage] = elapsed
+
+    def incr(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_gauge(self, name, fn):
+        """註冊即時量測值，fn 在輸出時才呼叫。"""
+        self.gauges[name] = fn
+
+    def log_event(self, event, **fields):
+        """寫一行結構化 JSON 紀錄（未設定 METRICS_JSON_LOG 時不做事）。"""
+        if not self.enabled or not self.json_log:
+            return
+        line = json.dumps({"ts": time.time(), "event": event, **fields}, ensure_ascii=False, default=str)
+        with self._log_lock:
+            with open(self.json_log, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _gauge_values(self):
+        values = {}
+        for name, fn in self.gauges.items():
+            try:
+                result = fn()
+            except Exception:
+                continue
+            if isinstance(result, dict):
+                for label_key, value in result.items():
+                    values[(name, label_key)] = value
+            else:
+                values[(name, ())] = result
+        return values
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    def hit_ratio(self, namespace):
+        hits = self.counter("cache_hits_total", cache=namespace)
+        misses = self.counter("cache_misses_total", cache=namespace)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def snapshot(self):
+        """目前所有數據的 dict，供 !stats 與 JSON 輸出使用。"""
+        with self._lock:
+            stages = {stage: {"count": t.count, "sum": t.total, **{f"p{int(q * 100)}": v for q, v in t.quantiles().items()}} for stage, t in self.timings.items()}
+            counters = {name + _format_labels(key): value for (name, key), value in self.counters.items()}
+        gauges = {name + _format_labels(key): value for (name, key), value in self._gauge_values().items()}
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def prometheus_text(self):
+        """Prometheus 文字格式。"""
+        lines = ["# TYPE food_stage_seconds summary"]
+        with self._lock:
+            for stage, t in sorted(self.timings.items()):
+                key = (("stage", stage),)
+                for q, value in t.quantiles().items():
+                    lines.append(f"food_stage_seconds{_format_labels(key, [('quantile', q)])} {value:.6f}")
+                lines.append(f"food_stage_seconds_count{_format_labels(key)} {t.count}")
+                lines.append(f"food_stage_seconds_sum{_format_labels(key)} {t.total:.6f}")
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, key), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE food_{name} counter")
+                typed.add(name)
+            lines.append(f"food_{name}{_format_labels(key)} {value}")
+        for (name, key), value in sorted(self._gauge_values().items()):
+            if name not in typed:
+                lines.append(f"# TYPE food_{name} gauge")
+                typed.add(name)
+            lines.append(f"food_{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host="127.0.0.1", port=METRICS_PORT):
+        """在本機啟動極簡 HTTP 服務，任何 GET 請求都回傳 Prometheus 文字。"""
+
+        async def handle(reader, writer):
+            try:
+                # 只需要讀完請求標頭
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                body = self.prometheus_text().encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+
+metrics = Metrics()
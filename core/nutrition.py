@@ -0,0 +1,131 @@
+import csv
+import json
+import os
+import threading
+
+import numpy as np
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 營養資料版本：更新資料時新增 data/nutrition_<版本>.csv 並修改此處
+NUTRITION_VERSION = "v1"
+NUTRITION_DATA_FILE = os.path.join(BASE_DIR, f"data/nutrition_{NUTRITION_VERSION}.csv")
+NUTRITION_MATRIX_FILE = os.path.join(BASE_DIR, f"cache/nutrition_{NUTRITION_VERSION}.npy")
+NUTRITION_LABELS_FILE = os.path.join(BASE_DIR, f"cache/nutrition_{NUTRITION_VERSION}.labels.json")
+
+# 矩陣欄位順序（每份的數值）
+NUTRIENTS = ("calories", "carbs", "protein", "fat")
+# 資料檔中找不到的標籤使用的預設值
+DEFAULT_NUTRITION = (500, 60, 20, 25)
+# 辨識結果取前幾名（一張圖最多記錄幾種食物，也是預熱建議快取時組合的食物數）
+TOP_K = 2
+
+
+def _compile(data_file=NUTRITION_DATA_FILE, matrix_file=NUTRITION_MATRIX_FILE, labels_file=NUTRITION_LABELS_FILE):
+    """把 CSV 轉成 float32 矩陣存成 .npy，之後啟動直接 memory-map，不必重新解析。"""
+    labels, rows = [], []
+    with open(data_file, "r", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            labels.append(record["label"])
+            rows.append([float(record[name]) for name in NUTRIENTS])
+    os.makedirs(os.path.dirname(matrix_file), exist_ok=True)
+    # 先寫暫存檔再取代，避免中斷或多個行程同時編譯時讀到寫一半的檔案；
+    # 矩陣最後取代，_load 以矩陣的修改時間判斷是否需要重新編譯
+    suffix = f".{os.getpid()}.tmp"
+    with open(labels_file + suffix, "w", encoding="utf-8") as f:
+        json.dump(labels, f)
+    os.replace(labels_file + suffix, labels_file)
+    with open(matrix_file + suffix, "wb") as f:
+        np.save(f, np.asarray(rows, dtype=np.float32))
+    os.replace(matrix_file + suffix, matrix_file)
+
+
+def _load(data_file=NUTRITION_DATA_FILE, matrix_file=NUTRITION_MATRIX_FILE, labels_file=NUTRITION_LABELS_FILE):
+    """回傳 (標籤列表, memory-mapped 矩陣)，資料檔比快取新時重新編譯。"""
+    stale = not (os.path.exists(matrix_file) and os.path.exists(labels_file)) or os.path.getmtime(data_file) > os.path.getmtime(matrix_file)
+    if stale:
+        _compile(data_file, matrix_file, labels_file)
+    with open(labels_file, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    return labels, np.load(matrix_file, mmap_mode="r")
+
+
+class NutritionTable:
+    """
+    依模型類別索引排列的營養矩陣，shape 為 (類別數, len(NUTRIENTS))。
+
+    第 i 列對應 image_model.config.id2label[i]，因此 softmax 機率向量可以直接與矩陣相乘，
+    一次算出機率加權的期望營養。
+    """
+
+    def __init__(self, class_labels, data_labels, data_matrix):
+        self.labels = list(class_labels)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        row_of = {label.lower(): i for i, label in enumerate(data_labels)}
+        matrix = np.tile(np.asarray(DEFAULT_NUTRITION, dtype=np.float32), (len(self.labels), 1))
+        rows = [(i, row_of.get(label.lower())) for i, label in enumerate(self.labels)]
+        found = [(i, j) for i, j in rows if j is not None]
+        if found:
+            class_ids, data_ids = zip(*found)
+            matrix[list(class_ids)] = data_matrix[list(data_ids)]
+        self.matrix = matrix
+        self.missing = [label for (_, j), label in zip(rows, self.labels) if j is None]
+
+    def lookup(self, label, portion=1.0):
+        """
+        查詢單一食物的營養。
+
+        Args:
+            label (str): 模型標籤。
+            portion (float): 份量倍數，1.0 為一份。
+
+        Returns:
+            dict: {"calories", "carbs", "protein", "fat"}。
+        """
+        i = self.index.get(label)
+        values = self.matrix[i] if i is not None else np.asarray(DEFAULT_NUTRITION, dtype=np.float32)
+        return _to_dict(values * portion)
+
+    def expected(self, probs, portion=1.0):
+        """以 softmax 機率加權所有類別，回傳期望營養（一次矩陣乘法）。"""
+        return _to_dict((np.asarray(probs, dtype=np.float32) @ self.matrix) * portion)
+
+    def top_k(self, probs, k=TOP_K, threshold=0.0):
+        """
+        用 np.argpartition 取出機率最高的 k 個類別（只用 numpy，推理服務模式下機器人行程不必載入 torch）。
+
+        Returns:
+            list: [(label, prob), ...]，已依機率排序且只保留高於 threshold 的項目。
+        """
+        probs = np.asarray(probs, dtype=np.float64)
+        k = min(k, len(self.labels))
+        indices = np.argpartition(-probs, k - 1)[:k]
+        indices = indices[np.argsort(-probs[indices], kind="stable")]
+        return [(self.labels[i], float(probs[i])) for i in indices if probs[i] > threshold]
+
+def _to_dict(values):
+    return {name: round(float(value)) for name, value in zip(NUTRIENTS, values)}
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_nutrition_table(class_labels):
+    """
+    取得與模型類別對齊的營養表，第一次呼叫時載入後快取在記憶體。
+
+    Args:
+        class_labels (list): 依類別索引排列的模型標籤（image_model.config.id2label 的值）。
+    """
+    global _table
+    if _table is None or _table.labels != list(class_labels):
+        with _table_lock:
+            if _table is None or _table.labels != list(class_labels):
+                data_labels, data_matrix = _load()
+                table = NutritionTable(class_labels, data_labels, data_matrix)
+                if table.missing:
+                    print(f"營養資料缺少 {len(table.missing)} 個標籤，使用預設值：{', '.join(table.missing[:5])}")
+                _table = table
+    return _table
@@ -0,0 +1,95 @@
+"""
+離線預先產生常見餐點組合的飲食建議，放進建議快取，使用者第一次遇到時就能直接命中。
+
+從使用者紀錄統計最常出現的 top-k 食物組合，對每個組合與目標（healthy / weight_loss）呼叫
+generate_diet_recommendation。共用 llm_client 的限流與並行上限，另以 --concurrency 限制同時進行的請求。
+已在快取中的組合會略過，因此中斷後重新執行即可從未完成的地方繼續。
+
+快取項目記錄產生時的提示版本與模型；修改提示模板並更新 RECOMMENDATION_PROMPT_VERSION 後，
+以 --purge-stale 刪除舊版本的資料再重新預熱。
+
+用法：
+    python core/prewarm_recommendations.py [--top 200] [--goals healthy,weight_loss] [--concurrency 4]
+                                           [--min-count 2] [--purge-stale] [--dry-run]
+"""
+import argparse
+import asyncio
+import time
+
+from llm_client import LLMError
+from llm_gemini import MODEL_NAME, RECOMMENDATION_PROMPT_VERSION, generate_diet_recommendation, llm_cache, recommendation_cache_key
+from nutrition import TOP_K, NutritionTable, _load
+from user_store import user_store
+
+GOALS = ("healthy", "weight_loss")
+PROGRESS_EVERY = 20  # 每完成幾筆印一次進度
+
+
+def build_jobs(combinations, goals):
+    """把 (食物組合, 次數) 轉成 [(nutrition_summary, goal, 次數), ...]，營養數值與線上查詢方式相同。"""
+    foods = sorted({food for combination, _ in combinations for food in combination})
+    table = NutritionTable(foods, *_load())
+    jobs = []
+    for combination, count in combinations:
+        summary = [{"food": food, **table.lookup(food)} for food in combination]
+        jobs.extend((summary, goal, count) for goal in goals)
+    return jobs
+
+
+async def prewarm(jobs, concurrency):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    done = {"generated": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    async def run(summary, goal):
+        if llm_cache.has(*recommendation_cache_key(summary, goal)[:2]):
+            done["skipped"] += 1
+            return
+        async with semaphore:
+            try:
+                await generate_diet_recommendation(summary, goal)
+                done["generated"] += 1
+            except LLMError as e:
+                done["failed"] += 1
+                print(f"失敗：{', '.join(item['food'] for item in summary)}（{goal}）：{e}")
+        finished = done["generated"] + done["failed"]
+        if finished % PROGRESS_EVERY == 0:
+            print(f"已產生 {done['generated']} 筆，失敗 {done['failed']} 筆（{time.perf_counter() - start:.0f}s）")
+
+    await asyncio.gather(*(run(summary, goal) for summary, goal, _ in jobs))
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=200, help="預熱最常見的前幾個食物組合")
+    parser.add_argument("--min-count", type=int, default=1, help="組合至少出現幾次才預熱")
+    parser.add_argument("--goals", default=",".join(GOALS))
+    parser.add_argument("--concurrency", type=int, default=4, help="同時進行的建議請求數")
+    parser.add_argument("--purge-stale", action="store_true", help="先刪除舊提示版本或其他模型產生的建議")
+    parser.add_argument("--dry-run", action="store_true", help="只列出要預熱的組合，不呼叫 API")
+    args = parser.parse_args()
+
+    goals = [goal for goal in args.goals.split(",") if goal]
+    print(f"目前提示版本 {RECOMMENDATION_PROMPT_VERSION}，模型 {MODEL_NAME}")
+    for row in llm_cache.version_counts("recommendation"):
+        print(f"  快取中 {row['prompt_version']} / {row['model']}：{row['count']} 筆")
+    if args.purge_stale:
+        removed = llm_cache.purge_stale("recommendation", RECOMMENDATION_PROMPT_VERSION, MODEL_NAME)
+        print(f"已刪除 {removed} 筆舊版本建議")
+
+    combinations = [(foods, count) for foods, count in user_store.meal_combinations(max_items=TOP_K, limit=args.top) if count >= args.min_count]
+    jobs = build_jobs(combinations, goals)
+    pending = sum(not llm_cache.has(*recommendation_cache_key(summary, goal)[:2]) for summary, goal, _ in jobs)
+    print(f"{len(combinations)} 個食物組合 × {len(goals)} 個目標 = {len(jobs)} 筆，其中 {pending} 筆尚未快取")
+    if args.dry_run:
+        for summary, goal, count in jobs:
+            print(f"{count:>6}  {goal:<12}{', '.join(item['food'] for item in summary)}")
+        return
+
+    done = asyncio.run(prewarm(jobs, args.concurrency))
+    print(f"完成：產生 {done['generated']} 筆，略過 {done['skipped']} 筆（已快取），失敗 {done['failed']} 筆")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 辨識結果快取設定（可由環境變數覆寫）
+RECOGNITION_CACHE_SIZE = int(os.getenv("FOOD_RECOGNITION_CACHE_SIZE", "2048"))
+RECOGNITION_CACHE_MAX_DISTANCE = int(os.getenv("FOOD_RECOGNITION_CACHE_MAX_DISTANCE", "5"))  # dHash 漢明距離門檻，-1 表示只做完全比對
+RECOGNITION_CACHE_PERSIST = os.getenv("FOOD_RECOGNITION_CACHE_PERSIST", "1").lower() in ("1", "true", "yes")
+RECOGNITION_CACHE_FILE = os.path.join(BASE_DIR, "cache/recognition_cache.json")
+SAVE_EVERY = 32  # 每新增幾筆寫一次檔，結束時也會寫
+
+
+def content_digest(data):
+    """圖片原始位元組的 SHA-256，用於完全相同檔案的比對。"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, hash_size=8):
+    """
+    計算 difference hash：縮成 (hash_size+1)x hash_size 灰階後比較左右相鄰像素。
+
+    重新壓縮、縮放或截圖轉存的同一張照片，漢明距離通常只差幾個位元。
+
+    Args:
+        image (PIL.Image.Image): 圖片。
+        hash_size (int): 每列位元數，預設 8 產生 64 位元雜湊。
+
+    Returns:
+        int: 感知雜湊值。
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class RecognitionCache:
+    """
+    以圖片內容為鍵的辨識結果快取，LRU 淘汰。
+
+    先用位元組雜湊做完全比對；未命中時再用 dHash 找漢明距離在門檻內的相似圖片。
+    快取值為模型輸出的完整機率列表，命中時完全不需要經過 torch。
+    fingerprint 描述產生這些機率的設定（模型、後端、信心分流），與存檔中的不同時捨棄舊檔。
+    """
+
+    def __init__(self, max_entries=RECOGNITION_CACHE_SIZE, max_distance=RECOGNITION_CACHE_MAX_DISTANCE, path=None, fingerprint=None):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.path = path
+        self.fingerprint = fingerprint
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # digest -> (image_hash, probs)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def get(self, digest, image_hash=None):
+        """
+        查詢快取，image_hash 為 None 時只做完全比對（不計入未命中）。
+
+        Returns:
+            list | None: 命中時回傳機率列表。
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.exact_hits += 1
+                return entry[1]
+            if image_hash is None:
+                return None
+            if self.max_distance >= 0:
+                for key, (cached_hash, probs) in reversed(self._entries.items()):
+                    if bin(cached_hash ^ image_hash).count("1") <= self.max_distance:
+                        self._entries.move_to_end(key)
+                        self.near_hits += 1
+                        return probs
+            self.misses += 1
+            return None
+
+    def put(self, digest, image_hash, probs):
+        with self._lock:
+            self._entries[digest] = (image_hash, probs)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("fingerprint") != self.fingerprint:
+            # 換了模型或推理設定，舊的機率已不適用；下次存檔時覆寫
+            print(f"辨識快取的設定與目前不同（{data.get('fingerprint')} → {self.fingerprint}），捨棄 {len(data.get('entries', []))} 筆舊快取")
+            return
+        with self._lock:
+            for digest, image_hash, probs in data.get("entries", [])[-self.max_entries:]:
+                self._entries[digest] = (int(image_hash, 16), probs)
+
+    def save(self):
+        if not self.path or not self._unsaved:
+            return
+        with self._lock:
+            entries = [[digest, format(image_hash, "x"), probs] for digest, (image_hash, probs) in self._entries.items()]
+            self._unsaved = 0
+        # 先寫暫存檔再取代，避免寫到一半中斷留下壞檔
+        with self._save_lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self.fingerprint, "entries": entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def stats(self):
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
@@ -0,0 +1,168 @@
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# 相似度門檻（可由環境變數覆寫），cosine 相似度高於此值才視為同一個問題
+QUESTION_SIMILARITY_THRESHOLD = float(os.getenv("QUESTION_SIMILARITY_THRESHOLD", "0.7"))
+MAX_POSTINGS = int(os.getenv("QUESTION_INDEX_MAX_POSTINGS", "5000"))  # 出現在太多問題中的 n-gram 查詢時略過
+NORM_REBUILD_GROWTH = 1.25  # 文件數成長到上次重算時的幾倍就重算文件向量長度
+
+# 去掉標點、空白與不影響語意的語助詞後再切 n-gram
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+_FILLERS = re.compile(r"請問|的|了|嗎|呢|啊|呀|吧|喔|哦")
+# 問句常用的疑問詞與動詞，去掉後剩下的字視為問題的主題（食物、營養素、時機等）
+_QUESTION_WORDS = re.compile(r"多少|什麼|哪些|哪個|怎麼|怎樣|可以|應該|比較|一天|每天|每日|能|是|有|吃|喝|會|要|很|最")
+_SYNONYMS = (("減重", "減肥"),)
+# 否定與相反方向的字：問題兩邊必須完全相同（「不可以吃」與「可以吃」、「熱量高」與「熱量低」是相反的問題）
+_POLARITY = frozenset("不沒別勿未無非免高低前後增減胖瘦")
+
+
+def normalize_question(text):
+    text = _PUNCTUATION.sub("", text.lower())
+    return _FILLERS.sub("", text)
+
+
+def subject_chars(text):
+    """正規化後的問題去掉疑問詞，回傳剩下的字（主題）的集合。"""
+    for word, canonical in _SYNONYMS:
+        text = text.replace(word, canonical)
+    return frozenset(_QUESTION_WORDS.sub("", text))
+
+
+def same_subject(a, b):
+    """
+    兩個問題的主題是否相同：否定／方向字（_POLARITY）兩邊必須完全相同，
+    其餘的字則是字數較少的一方必須完全包含在另一方中。
+
+    只看整體 n-gram 相似度時，「一天要喝多少咖啡」與「一天要喝多少水」、「雞腿肉」與「雞胸肉」
+    只差一兩個字就會超過門檻，但問的是不同的東西；允許多出的字（例如「一根香蕉」對「香蕉」），
+    但多出一個「不」或「沒」就是相反的問題。
+    """
+    if a & _POLARITY != b & _POLARITY:
+        return False
+    shorter, longer = (a, b) if len(a) <= len(b) else (b, a)
+    return shorter <= longer
+
+
+def char_ngrams(text, sizes=(1, 2)):
+    """字元 n-gram 次數，中文以單字與雙字詞為主。"""
+    grams = Counter()
+    for n in sizes:
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class _Postings:
+    """單一 n-gram 的倒排串列，以可成長的 numpy 陣列保存文件編號與詞頻權重。"""
+
+    __slots__ = ("ids", "weights", "size")
+
+    def __init__(self):
+        self.ids = np.empty(4, dtype=np.int32)
+        self.weights = np.empty(4, dtype=np.float32)
+        self.size = 0
+
+    def append(self, doc_id, weight):
+        if self.size == len(self.ids):
+            self.ids = np.resize(self.ids, self.size * 2)
+            self.weights = np.resize(self.weights, self.size * 2)
+        self.ids[self.size] = doc_id
+        self.weights[self.size] = weight
+        self.size += 1
+
+
+class QuestionIndex:
+    """
+    問題的字元 n-gram TF-IDF 索引，用來找出換句話說的重複問題。
+
+    以倒排索引保存，查詢時只看和問題有共同 n-gram 的文件（略過串列長度超過 max_postings 的高頻 n-gram），
+    用 np.bincount 一次算出所有候選的 cosine 相似度，再依分數由高到低取第一個主題相同（same_subject）的問題。
+    新增問題是 O(問題長度) 的增量更新；文件向量長度在文件數每成長 NORM_REBUILD_GROWTH 倍時依最新 IDF 重算。
+    """
+
+    def __init__(self, threshold=QUESTION_SIMILARITY_THRESHOLD, max_postings=MAX_POSTINGS):
+        self.threshold = threshold
+        self.max_postings = max_postings
+        self.keys = []  # doc_id -> 快取鍵
+        self._subjects = []  # doc_id -> 主題字集合
+        self._norms = np.empty(1024, dtype=np.float32)
+        self._postings = {}
+        self._seen = set()
+        self._norms_built_at = 1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _idf(self, gram):
+        postings = self._postings.get(gram)
+        df = postings.size if postings else 0
+        return math.log((len(self.keys) + 1) / (df + 1)) + 1
+
+    def add(self, question, key):
+        """加入一個已快取的問題；相同的正規化問題只會加入一次。"""
+        text = normalize_question(question)
+        if not text or text in self._seen:
+            return
+        self._seen.add(text)
+        doc_id = len(self.keys)
+        self.keys.append(key)
+        self._subjects.append(subject_chars(text))
+        grams = char_ngrams(text)
+        norm = 0.0
+        for gram, tf in grams.items():
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = _Postings()
+            postings.append(doc_id, tf)
+            norm += (tf * self._idf(gram)) ** 2
+        if doc_id == len(self._norms):
+            self._norms = np.resize(self._norms, doc_id * 2)
+        self._norms[doc_id] = math.sqrt(norm) or 1.0
+        # IDF 隨文件數改變，文件數成長一定比例後重算全部長度（攤提後仍是 O(1)）
+        if len(self.keys) >= self._norms_built_at * NORM_REBUILD_GROWTH:
+            self._rebuild_norms()
+
+    def _rebuild_norms(self):
+        count = len(self.keys)
+        ids, weights = [], []
+        for gram, postings in self._postings.items():
+            ids.append(postings.ids[:postings.size])
+            weights.append(np.square(postings.weights[:postings.size] * self._idf(gram)))
+        squared = np.bincount(np.concatenate(ids), weights=np.concatenate(weights), minlength=count)
+        self._norms[:count] = np.sqrt(squared)
+        self._norms_built_at = count
+
+    def search(self, question):
+        """
+        找出最相似的已快取問題。
+
+        Returns:
+            tuple | None: (快取鍵, 相似度)，沒有主題相同且高於門檻的問題時回傳 None。
+        """
+        if not self.keys:
+            return None
+        text = normalize_question(question)
+        ids, weights = [], []
+        query_norm = 0.0
+        for gram, tf in char_ngrams(text).items():
+            idf = self._idf(gram)
+            query_norm += (tf * idf) ** 2
+            postings = self._postings.get(gram)
+            # 高頻 n-gram 的 IDF 很低、串列又很長，略過只讓分數略為保守
+            if postings is None or postings.size > self.max_postings:
+                continue
+            ids.append(postings.ids[:postings.size])
+            weights.append(postings.weights[:postings.size] * (tf * idf * idf))
+        if not ids:
+            return None
+        scores = np.bincount(np.concatenate(ids), weights=np.concatenate(weights), minlength=len(self.keys))
+        scores /= self._norms[:len(self.keys)] * math.sqrt(query_norm)
+        candidates = np.flatnonzero(scores >= self.threshold)
+        subject = subject_chars(text)
+        for doc_id in candidates[np.argsort(-scores[candidates], kind="stable")]:
+            if same_subject(subject, self._subjects[doc_id]):
+                return self.keys[doc_id], float(scores[doc_id])
+        return None
@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 引導流程（身高 → 體重）的暫存狀態設定（可由環境變數覆寫）
+SESSION_TTL = float(os.getenv("ONBOARDING_SESSION_TTL", "120"))  # 與身高／體重選單的逾時相同（秒）
+SESSION_MAX_ENTRIES = int(os.getenv("ONBOARDING_SESSION_MAX", "10000"))  # 超過即淘汰最舊的流程
+SESSION_SWEEP_INTERVAL = float(os.getenv("ONBOARDING_SESSION_SWEEP_INTERVAL", "30"))  # 背景清除過期流程的間隔（秒）
+SESSION_PERSIST = os.getenv("ONBOARDING_SESSION_PERSIST", "1").lower() in ("1", "true", "yes")
+SESSION_SAVE_DELAY = float(os.getenv("ONBOARDING_SESSION_SAVE_DELAY", "1"))  # 變更後延遲多久合併存檔一次（秒）
+SESSION_FILE = os.path.join(BASE_DIR, "cache/onboarding_sessions.json")
+
+
+class SessionStore:
+    """
+    有期限、有上限的使用者流程狀態（user_id -> dict）。
+
+    每次寫入都會重新計算期限並移到最後，因此項目依到期時間排序：
+    查詢、寫入都是 O(1)，清除過期項目只需從最前面開始檢查。
+    到期時間以 clock（預設 time.time）計算，存檔後重新啟動仍然有效；測試時可傳入模擬時鐘。
+
+    寫入只標記為待存檔，不在呼叫端（事件迴圈）寫檔：在事件迴圈中時延遲 save_delay 秒後
+    於背景執行緒合併寫入一次，其餘情況由背景清除或結束時（atexit）存檔。
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES, path=None, clock=time.time, save_delay=SESSION_SAVE_DELAY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.clock = clock
+        self.save_delay = save_delay
+        self._entries = OrderedDict()  # user_id -> (expires_at, data)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._sweeper = None
+        self._save_handle = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        """回傳進行中的流程狀態，不存在或已過期時回傳 None。"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[user_id]
+                self._dirty = True
+                metrics.incr("sessions_evicted_total", reason="expired")
+                return None
+            return entry[1]
+
+    def set(self, user_id, data):
+        """寫入流程狀態並重新計算期限；超過上限時淘汰最接近到期的流程。"""
+        with self._lock:
+            self._entries[user_id] = (self.clock() + self.ttl, data)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("sessions_evicted_total", reason="cap")
+            self._dirty = True
+        self._schedule_save()
+
+    def pop(self, user_id):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            self._dirty = self._dirty or entry is not None
+        if entry is not None:
+            self._schedule_save()
+        return entry[1] if entry is not None else None
+
+    def sweep(self):
+        """清除所有已過期的流程，回傳清除的數量。"""
+        now = self.clock()
+        removed = 0
+        with self._lock:
+            while self._entries:
+                user_id, (expires_at, _) = next(iter(self._entries.items()))
+                if expires_at > now:
+                    break
+                del self._entries[user_id]
+                removed += 1
+            self._dirty = self._dirty or removed > 0
+        if removed:
+            metrics.incr("sessions_evicted_total", removed, reason="expired")
+            self._schedule_save()
+        return removed
+
+    def start_sweeper(self, interval=SESSION_SWEEP_INTERVAL):
+        """在目前的事件迴圈啟動背景清除工作（重複呼叫不會啟動第二個）。"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever(interval))
+        return self._sweeper
+
+    async def _sweep_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def _schedule_save(self):
+        """安排一次延遲存檔；已安排過或不在事件迴圈中時不做事（由 sweep / atexit 存檔）。"""
+        if not self.path or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_handle = loop.call_later(self.save_delay, self._save_in_background, loop)
+
+    def _save_in_background(self, loop):
+        self._save_handle = None
+        loop.run_in_executor(None, self.save)
+
+    def flush(self):
+        """取消尚未執行的延遲存檔並立即寫入（結束時使用）。"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self.save()
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        now = self.clock()
+        with self._lock:
+            for user_id, expires_at, value in sorted(data.get("entries", []), key=lambda entry: entry[1])[-self.max_entries:]:
+                if expires_at > now:
+                    self._entries[user_id] = (expires_at, value)
+
+    def save(self):
+        if not self.path:
+            return
+        # 背景存檔與結束時存檔可能同時進行：取快照與寫檔都在 _save_lock 內，較新的快照一定較晚寫入
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = [[user_id, expires_at, value] for user_id, (expires_at, value) in self._entries.items()]
+                self._dirty = False
+            # 先寫暫存檔再取代，避免寫到一半中斷留下壞檔
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        metrics.incr("sessions_saved_total")
+
+onboarding_sessions = SessionStore(path=SESSION_FILE if SESSION_PERSIST else None)
+metrics.register_gauge("onboarding_sessions", onboarding_sessions.__len__)
+atexit.register(onboarding_sessions.flush)
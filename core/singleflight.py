@@ -0,0 +1,137 @@
+import asyncio
+import functools
+
+
+class _Broadcast:
+    """
+    把一個串流的最新值轉發給所有訂閱者。
+
+    串流每次產生的是目前累積的完整結果，訂閱者只需要最新值，來不及處理的中間值會直接略過。
+    """
+
+    def __init__(self):
+        self.value = None
+        self.version = 0
+        self.done = False
+        self.error = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    def publish(self, value):
+        self.value = value
+        self.version += 1
+        self._wake()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    async def subscribe(self):
+        seen = 0
+        while True:
+            if self.version > seen:
+                seen = self.version
+                yield self.value
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    async def result(self):
+        """等串流結束，回傳最後的值。"""
+        value = None
+        async for value in self.subscribe():
+            pass
+        return value
+
+
+class SingleFlight:
+    """
+    合併相同鍵的同時請求：第一個呼叫者實際執行，其餘呼叫者 await 同一個結果。
+
+    執行失敗時例外會傳給所有等待者，且不會保留結果，下一次呼叫會重新執行。
+    stream() 為串流版本，相同鍵的 do() 與 stream() 也會互相合併。
+    """
+
+    def __init__(self):
+        self.calls = 0  # 實際執行次數
+        self.shared = 0  # 共用他人結果的次數
+        self._inflight = {}
+        self._streams = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        以 key 合併執行 await fn(*args, **kwargs) 並回傳結果。
+
+        fn 在背景工作中執行，與 stream() 相同：任何呼叫者（含第一個）被取消都不影響其他等待者，
+        執行仍會跑完。
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            # shield：某個等待者被取消時不影響其他人
+            return await asyncio.shield(task)
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.shared += 1
+            return await broadcast.result()
+        self.calls += 1
+        task = self._inflight[key] = asyncio.get_running_loop().create_task(fn(*args, **kwargs))
+        task.add_done_callback(functools.partial(self._finish, key))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            self._inflight.pop(key)
+        if not task.cancelled():
+            # 所有等待者都已取消時避免 "exception was never retrieved" 警告
+            task.exception()
+
+    async def stream(self, key, fn, *args, **kwargs):
+        """
+        串流版的 do：fn(*args, **kwargs) 為 async generator，每次產生目前累積的完整結果。
+
+        第一個呼叫者在背景工作中執行串流，所有呼叫者（含第一個）訂閱同一份結果；
+        某個訂閱者中途離開不影響其他人，串流仍會跑完。失敗時例外傳給所有訂閱者。
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            yield await asyncio.shield(future)
+            return
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.calls += 1
+            broadcast = self._streams[key] = _Broadcast()
+            # 保留工作的參照，避免背景工作在執行中被回收
+            broadcast.task = asyncio.get_running_loop().create_task(self._pump(key, broadcast, fn(*args, **kwargs)))
+        else:
+            self.shared += 1
+        async for value in broadcast.subscribe():
+            yield value
+
+    async def _pump(self, key, broadcast, generator):
+        try:
+            async for value in generator:
+                broadcast.publish(value)
+        except BaseException as e:
+            broadcast.finish(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            broadcast.finish()
+        finally:
+            self._streams.pop(key, None)
+
+    def inflight(self):
+        return len(self._inflight) + len(self._streams)
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared, "inflight": self.inflight()}
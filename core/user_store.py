@@ -0,0 +1,287 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import groupby
+
+# 專案根目錄（即本檔案的上層目錄）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USER_DB_FILE = os.getenv("USER_DB_FILE", os.path.join(BASE_DIR, "user_log.db"))
+LEGACY_USER_LOG_FILE = os.getenv("USER_LEGACY_LOG_FILE", os.path.join(BASE_DIR, "user_log.json"))  # 設為空字串停用匯入
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id   TEXT PRIMARY KEY,
+    user_name TEXT,
+    height    INTEGER,
+    weight    REAL
+);
+CREATE TABLE IF NOT EXISTS foods (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id   TEXT NOT NULL REFERENCES users(user_id),
+    food      TEXT NOT NULL,
+    calories  REAL,
+    timestamp TEXT NOT NULL,
+    carbs     REAL,
+    protein   REAL,
+    fat       REAL
+);
+CREATE INDEX IF NOT EXISTS idx_foods_user_time ON foods(user_id, timestamp);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id  TEXT NOT NULL,
+    day      TEXT NOT NULL,
+    calories REAL NOT NULL DEFAULT 0,
+    carbs    REAL NOT NULL DEFAULT 0,
+    protein  REAL NOT NULL DEFAULT 0,
+    fat      REAL NOT NULL DEFAULT 0,
+    entries  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+CREATE TABLE IF NOT EXISTS weekly_rollups (
+    user_id  TEXT NOT NULL,
+    week     TEXT NOT NULL,
+    calories REAL NOT NULL DEFAULT 0,
+    carbs    REAL NOT NULL DEFAULT 0,
+    protein  REAL NOT NULL DEFAULT 0,
+    fat      REAL NOT NULL DEFAULT 0,
+    entries  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, week)
+);
+CREATE TABLE IF NOT EXISTS food_counts (
+    user_id  TEXT NOT NULL,
+    food     TEXT NOT NULL,
+    count    INTEGER NOT NULL DEFAULT 0,
+    calories REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, food)
+);
+"""
+
+# 舊版資料庫沒有的欄位：(資料表, 欄位, 型別)
+ADDED_COLUMNS = [("foods", "carbs", "REAL"), ("foods", "protein", "REAL"), ("foods", "fat", "REAL")]
+
+# 累加到 daily / weekly rollup 的 UPSERT，period 欄位名稱分別為 day / week
+ROLLUP_UPSERT = (
+    "INSERT INTO {table} (user_id, {period}, calories, carbs, protein, fat, entries) VALUES (?, ?, ?, ?, ?, ?, 1) "
+    "ON CONFLICT(user_id, {period}) DO UPDATE SET calories=calories+excluded.calories, carbs=carbs+excluded.carbs, "
+    "protein=protein+excluded.protein, fat=fat+excluded.fat, entries=entries+1"
+)
+# 週以星期一的日期為鍵（SQLite：先跳到當週星期日再減 6 天）
+WEEK_START_SQL = "date(timestamp, 'weekday 0', '-6 days')"
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def week_start(day):
+    """回傳該日所屬週（星期一開始）的星期一日期字串。"""
+    date = datetime.strptime(day[:10], "%Y-%m-%d")
+    return (date - timedelta(days=date.weekday())).strftime("%Y-%m-%d")
+
+
+class UserStore:
+    """
+    以 SQLite（WAL 模式）保存使用者資料與飲食紀錄。
+
+    每次寫入只動到相關的列，成本不會隨歷史紀錄變多而增加；
+    同一次分析的多筆食物在同一個交易內寫入。第一次建立資料庫時會自動匯入舊的 user_log.json。
+    每筆紀錄寫入時同步累加每日、每週與食物次數的 rollup，查詢統計不必掃描原始紀錄。
+    """
+
+    def __init__(self, path=USER_DB_FILE, legacy_path=LEGACY_USER_LOG_FILE):
+        self.path = path
+        is_new = path == ":memory:" or not os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        if is_new and legacy_path and os.path.exists(legacy_path):
+            self.migrate_json(legacy_path)
+
+    def _upgrade_schema(self):
+        """補上舊版資料庫缺少的欄位；有紀錄但還沒有 rollup 時重建一次。"""
+        for table, column, column_type in ADDED_COLUMNS:
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        has_foods = self._conn.execute("SELECT 1 FROM foods LIMIT 1").fetchone()
+        has_rollups = self._conn.execute("SELECT 1 FROM daily_rollups LIMIT 1").fetchone()
+        if has_foods and not has_rollups:
+            self.rebuild_rollups()
+
+    @contextmanager
+    def _transaction(self):
+        """取得寫入鎖並開啟交易，離開時提交，發生例外則回滾。"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def _write(self, statements):
+        """在單一交易內執行多條 (sql, params)，回傳每條影響的列數。"""
+        with self._transaction() as cursor:
+            counts = []
+            for sql, params in statements:
+                cursor.execute(sql, params)
+                counts.append(cursor.rowcount)
+            return counts
+
+    def ensure_user(self, user_id, user_name):
+        """建立使用者紀錄，已存在則不動；回傳是否為新建立。"""
+        (count,) = self._write([("INSERT OR IGNORE INTO users (user_id, user_name) VALUES (?, ?)", (user_id, user_name))])
+        return count == 1
+
+    def set_basic(self, user_id, user_name, height, weight):
+        self._write([(
+            "INSERT INTO users (user_id, user_name, height, weight) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET user_name=excluded.user_name, height=excluded.height, weight=excluded.weight",
+            (user_id, user_name, height, weight),
+        )])
+
+    def get_user(self, user_id):
+        """回傳 {"user_name", "height", "weight"}，不存在時回傳 None。"""
+        with self._lock:
+            row = self._conn.execute("SELECT user_name, height, weight FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def add_foods(self, user_id, items, timestamp=None):
+        """
+        一次寫入多筆飲食紀錄並更新 rollup，使用者不存在時略過。
+
+        Args:
+            user_id (str): 使用者 ID。
+            items (list): [{"food", "calories", "carbs", "protein", "fat"}, ...]，營養欄位可省略。
+            timestamp (str): 紀錄時間，預設為現在。
+        """
+        timestamp = timestamp or _now()
+        day = timestamp[:10]
+        week = week_start(day)
+        with self._transaction() as cursor:
+            if not cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+                return
+            for item in items:
+                calories = item.get("calories")
+                carbs, protein, fat = item.get("carbs"), item.get("protein"), item.get("fat")
+                cursor.execute(
+                    "INSERT INTO foods (user_id, food, calories, timestamp, carbs, protein, fat) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, item["food"], calories, timestamp, carbs, protein, fat),
+                )
+                totals = (calories or 0, carbs or 0, protein or 0, fat or 0)
+                cursor.execute(ROLLUP_UPSERT.format(table="daily_rollups", period="day"), (user_id, day) + totals)
+                cursor.execute(ROLLUP_UPSERT.format(table="weekly_rollups", period="week"), (user_id, week) + totals)
+                cursor.execute(
+                    "INSERT INTO food_counts (user_id, food, count, calories) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(user_id, food) DO UPDATE SET count=count+1, calories=calories+excluded.calories",
+                    (user_id, item["food"], calories or 0),
+                )
+
+    def get_foods(self, user_id, limit=None):
+        """依時間新到舊回傳使用者的飲食紀錄。"""
+        sql = "SELECT food, calories, carbs, protein, fat, timestamp FROM foods WHERE user_id = ? ORDER BY timestamp DESC, id DESC"
+        params = (user_id,)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def daily_totals(self, user_id, days=7):
+        """最近 days 天（含今天）的每日熱量與三大營養素總和，依日期排序。"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, calories, carbs, protein, fat, entries FROM daily_rollups WHERE user_id = ? AND day >= ? ORDER BY day",
+                (user_id, since),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def weekly_totals(self, user_id, weeks=4):
+        """最近 weeks 週（含本週）的每週總和，week 為該週星期一的日期。"""
+        since = week_start((datetime.now() - timedelta(weeks=weeks - 1)).strftime("%Y-%m-%d"))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT week, calories, carbs, protein, fat, entries FROM weekly_rollups WHERE user_id = ? AND week >= ? ORDER BY week",
+                (user_id, since),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def top_foods(self, user_id, limit=5):
+        """最常吃的食物與累計熱量。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT food, count, calories FROM food_counts WHERE user_id = ? ORDER BY count DESC, food LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def meal_combinations(self, max_items=2, limit=None):
+        """
+        統計所有使用者最常出現的餐點組合。
+
+        同一次分析的食物以相同的 timestamp 寫入，因此以 (user_id, timestamp) 分組；
+        只保留不超過 max_items 項的組合（單張圖片的 top-k），多張圖片的整餐不列入。
+
+        Returns:
+            list: [(依名稱排序的食物 tuple, 次數), ...]，依次數由多到少排序。
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, timestamp, food FROM foods ORDER BY user_id, timestamp, id").fetchall()
+        counts = Counter()
+        for _, group in groupby(rows, key=lambda row: (row["user_id"], row["timestamp"])):
+            foods = tuple(sorted({row["food"] for row in group}))
+            if len(foods) <= max_items:
+                counts[foods] += 1
+        return counts.most_common(limit)
+
+    def rebuild_rollups(self, user_id=None):
+        """從原始紀錄重建 rollup，user_id 為 None 時重建全部使用者。"""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id else ("", ())
+        sums = "SUM(COALESCE(calories, 0)), SUM(COALESCE(carbs, 0)), SUM(COALESCE(protein, 0)), SUM(COALESCE(fat, 0)), COUNT(*)"
+        statements = []
+        for table in ("daily_rollups", "weekly_rollups", "food_counts"):
+            statements.append((f"DELETE FROM {table} {where}", params))
+        statements += [
+            (f"INSERT INTO daily_rollups SELECT user_id, substr(timestamp, 1, 10), {sums} FROM foods {where} GROUP BY 1, 2", params),
+            (f"INSERT INTO weekly_rollups SELECT user_id, {WEEK_START_SQL}, {sums} FROM foods {where} GROUP BY 1, 2", params),
+            (f"INSERT INTO food_counts SELECT user_id, food, COUNT(*), SUM(COALESCE(calories, 0)) FROM foods {where} GROUP BY 1, 2", params),
+        ]
+        self._write(statements)
+
+    def migrate_json(self, legacy_path):
+        """把舊版 user_log.json 匯入資料庫，完成後將原檔改名為 .migrated 保留備份。"""
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            logs = json.load(f)
+        statements = []
+        for user_id, record in logs.items():
+            statements.append((
+                "INSERT OR REPLACE INTO users (user_id, user_name, height, weight) VALUES (?, ?, ?, ?)",
+                (user_id, record.get("user_name"), record.get("height"), record.get("weight")),
+            ))
+            for entry in record.get("foods", []):
+                statements.append((
+                    "INSERT INTO foods (user_id, food, calories, timestamp) VALUES (?, ?, ?, ?)",
+                    (user_id, entry["food"], entry.get("calories"), entry.get("timestamp") or _now()),
+                ))
+        self._write(statements)
+        self.rebuild_rollups()
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        print(f"已將 {len(logs)} 位使用者從 {os.path.basename(legacy_path)} 匯入資料庫")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+user_store = UserStore()
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+# 所有寫入都導向暫存目錄，不影響正式的使用者紀錄與快取
+WORK_DIR = tempfile.mkdtemp(prefix="food_tests_")
+os.environ.setdefault("USER_DB_FILE", os.path.join(WORK_DIR, "user_log.db"))
+os.environ.setdefault("USER_LEGACY_LOG_FILE", "")
+os.environ.setdefault("LLM_CACHE_FILE", os.path.join(WORK_DIR, "llm_cache.db"))
+os.environ.setdefault("FOOD_RECOGNITION_CACHE_PERSIST", "0")
+os.environ.setdefault("ONBOARDING_SESSION_PERSIST", "0")
+os.environ.setdefault("METRICS_JSON_LOG", "")
+
+
+class FakeGeminiModel:
+    """取代 GenerativeModel：記錄呼叫次數，延遲後回傳固定文字（stream=True 時分段送出）或丟出 error。"""
+
+    def __init__(self, reply="多喝水、少喝含糖飲料。", delay=0.05, error=None, chunks=4):
+        self.reply = reply
+        self.delay = delay
+        self.error = error
+        self.chunks = chunks
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(text=self.reply)
+
+    async def _stream(self):
+        size = -(-len(self.reply) // self.chunks)
+        for i in range(0, len(self.reply), size):
+            await asyncio.sleep(self.delay / self.chunks)
+            if self.error is not None and i:
+                raise self.error
+            yield SimpleNamespace(text=self.reply[i:i + size])
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """把共用的 Gemini 用戶端換成使用假模型、不限流的 GeminiClient，回傳安裝函式。"""
+    import llm_client
+
+    def install(model):
+        client = llm_client.GeminiClient(model_factory=lambda name: model, rate_per_minute=1e9, burst=1_000_000, max_pending=1_000_000, max_retries=0)
+        monkeypatch.setattr(llm_client, "gemini_client", client)
+        return client
+
+    return install
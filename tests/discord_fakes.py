@@ -0,0 +1,91 @@
+"""
+假的 Discord 物件與事件迴圈延遲監測，測試（tests/）與離線壓測（bench/bench_e2e.py）共用。
+
+只實作 discord_handler 會用到的 commands.Context / 附件 / 訊息 / Interaction 介面，不需要 discord.py 連線。
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+LAG_INTERVAL = 0.01  # 事件迴圈延遲取樣間隔（秒）
+
+
+class FakeAttachment:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.size = len(data)
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+
+class FakeMessage:
+    def __init__(self, content=None, embed=None):
+        self.content = content
+        self.embed = embed
+        self.edits = 0
+        self.created = time.perf_counter()
+
+    async def edit(self, content=None, embed=None):
+        self.edits += 1
+        self.content = content if content is not None else self.content
+        self.embed = embed if embed is not None else self.embed
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        message = FakeMessage(content, embed)
+        self.sent.append(message)
+        return message
+
+
+class FakeContext:
+    """analyze_main / handle_* 會用到的 commands.Context 介面；送出的訊息記錄在 channel.sent。"""
+
+    def __init__(self, user_id, attachments=()):
+        self.author = SimpleNamespace(id=user_id, name=f"user{user_id}", bot=False)
+        self.channel = FakeChannel()
+        self.message = SimpleNamespace(attachments=list(attachments), author=self.author, channel=self.channel, content="")
+        self.interaction = None
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        pass
+
+    async def send_message(self, content=None, **kwargs):
+        pass
+
+    async def send_modal(self, modal):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, user):
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeChannel()
+
+
+def failed(channel):
+    """處理函式會把錯誤轉成「❌」或「⚠️」開頭的訊息（串流模式則寫進 embed），而不是丟出例外。"""
+    for message in channel.sent:
+        text = message.content or (message.embed.description if message.embed is not None else None)
+        if isinstance(text, str) and text.startswith(("❌", "⚠️")):
+            return True
+    return False
+
+
+async def monitor_loop_lag(samples, stop, interval=LAG_INTERVAL):
+    """每 interval 秒醒來一次，實際多睡的時間就是事件迴圈被卡住的時間。"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+
+import discord_handler  # noqa: E402
+from discord_handler import image_url  # noqa: E402
+
+
+class RecordingBot:
+    """只記錄 register_commands 註冊的指令，不連線 Discord。"""
+
+    def __init__(self):
+        self.commands = {}
+        self.tree = SimpleNamespace(command=lambda **kwargs: lambda func: func)
+
+    def event(self, func):
+        return func
+
+    def command(self, name):
+        def register(func):
+            self.commands[name] = func
+            return func
+        return register
+
+
+@pytest.mark.parametrize("argument,expected", [
+    ("https://example.com/food.jpg", "https://example.com/food.jpg"),
+    ("<http://example.com/food.jpg>", "http://example.com/food.jpg"),
+    ("HTTPS://example.com/a.png", "HTTPS://example.com/a.png"),
+])
+def test_http_urls_are_fetched(argument, expected):
+    assert image_url(argument) == expected
+
+
+@pytest.mark.parametrize("argument", [None, "", "healthy", "減重", "ftp://example.com/food.jpg", "file:///etc/passwd", "https://", "example.com/food.jpg"])
+def test_other_arguments_use_the_attachments(argument):
+    assert image_url(argument) is None
+
+
+def test_analyze_with_a_goal_argument_uses_the_attachment(monkeypatch):
+    calls = []
+
+    async def handle_analyze(ctx, url=None):
+        calls.append(url)
+
+    monkeypatch.setattr(discord_handler, "handle_analyze", handle_analyze)
+    bot = RecordingBot()
+    discord_handler.register_commands(bot)
+    asyncio.run(bot.commands["analyze"](None, "healthy"))
+    asyncio.run(bot.commands["analyze"](None, "<https://example.com/food.jpg>"))
+    assert calls == [None, "https://example.com/food.jpg"]
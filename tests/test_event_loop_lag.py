@@ -0,0 +1,95 @@
+import asyncio
+import io
+import random
+import time
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("discord")
+
+import discord_handler  # noqa: E402
+import image_recognition  # noqa: E402
+from conftest import FakeGeminiModel  # noqa: E402
+from discord_fakes import FakeAttachment, FakeContext, failed, monitor_loop_lag  # noqa: E402
+from nutrition import _load  # noqa: E402
+from user_store import user_store  # noqa: E402
+
+PREDICT_SECONDS = 0.2  # 假模型每個批次的阻塞時間
+STORAGE_SECONDS = 0.1  # 假的慢速寫入
+MAX_LAG = 0.1  # 阻塞呼叫若在事件迴圈上執行，延遲至少是 PREDICT_SECONDS
+
+
+def random_jpeg(rng):
+    # 每次都是不同的圖片，不會命中辨識快取
+    image = Image.effect_noise((64, 64), rng.uniform(20, 80)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def slow_backends(monkeypatch, fake_gemini):
+    """圖像模型與使用紀錄寫入都換成會阻塞呼叫端執行緒的假實作。"""
+    labels, _ = _load()
+    probs = [0.2 / (len(labels) - 1)] * len(labels)
+    probs[0] = 0.8
+
+    def predict(images):
+        time.sleep(PREDICT_SECONDS)
+        return [list(probs) for _ in images]
+
+    add_foods = user_store.add_foods
+
+    def slow_add_foods(*args, **kwargs):
+        time.sleep(STORAGE_SECONDS)
+        return add_foods(*args, **kwargs)
+
+    monkeypatch.setattr(image_recognition.batcher, "predict_fn", predict)
+    monkeypatch.setattr(discord_handler, "get_labels", lambda: labels)
+    monkeypatch.setattr(user_store, "add_foods", slow_add_foods)
+    fake_gemini(FakeGeminiModel(delay=0.01))
+
+
+def run_analyses(count, seed):
+    rng = random.Random(seed)
+    contexts = [FakeContext(1000 + i, [FakeAttachment(f"{i}.jpg", random_jpeg(rng))]) for i in range(count)]
+
+    async def run():
+        lag, stop = [], asyncio.Event()
+        monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+        await asyncio.gather(*(discord_handler.analyze_main(ctx, "healthy") for ctx in contexts))
+        stop.set()
+        await monitor
+        return lag
+
+    lag = asyncio.run(run())
+    for ctx in contexts:
+        assert not failed(ctx.channel), [m.content for m in ctx.channel.sent]
+        assert any(m.embed is not None for m in ctx.channel.sent)
+    return max(lag)
+
+
+@pytest.mark.parametrize("count", [1, 8])
+def test_loop_lag_stays_flat_while_analyses_block(slow_backends, count):
+    assert run_analyses(count, seed=count) < MAX_LAG
+
+
+def test_storage_calls_do_not_block_the_loop(slow_backends, monkeypatch):
+    ensure_user = user_store.ensure_user
+
+    def slow_ensure_user(*args, **kwargs):
+        time.sleep(PREDICT_SECONDS)
+        return ensure_user(*args, **kwargs)
+
+    monkeypatch.setattr(user_store, "ensure_user", slow_ensure_user)
+
+    async def run():
+        lag, stop = [], asyncio.Event()
+        monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+        await asyncio.gather(*(discord_handler.handle_hello(FakeContext(2000 + i)) for i in range(4)))
+        stop.set()
+        await monitor
+        return lag
+
+    assert max(asyncio.run(run())) < MAX_LAG
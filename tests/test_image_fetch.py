@@ -0,0 +1,169 @@
+import asyncio
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from PIL import Image
+
+from image_fetch import ImageFetchError, ImageFetcher, fetch_image_sync
+
+MAX_BYTES = 256 * 1024
+CHUNK = 16 * 1024
+
+
+def make_jpeg(width=200, height=150):
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """本機測試伺服器；requests 記錄每個連接埠收到的請求數。"""
+
+    protocol_version = "HTTP/1.1"
+    valid = make_jpeg()
+    requests = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status=200, content_type="image/jpeg", length=0, chunked=False, location=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if location:
+            self.send_header("Location", location)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+    def do_GET(self):
+        port = self.server.server_address[1]
+        with self.lock:
+            self.requests[port] = self.requests.get(port, 0) + 1
+        parsed = urlparse(self.path)
+        try:
+            if parsed.path == "/redirect":
+                self._headers(302, location=parse_qs(parsed.query)["to"][0])
+            elif parsed.path == "/redirect_loop.jpg":
+                self._headers(302, location="/redirect_loop.jpg")
+            elif parsed.path == "/valid.jpg":
+                self._headers(length=len(self.valid))
+                self.wfile.write(self.valid)
+            elif parsed.path == "/declared_huge.jpg":
+                self._headers(length=MAX_BYTES * 10)
+                for _ in range(MAX_BYTES * 10 // CHUNK):
+                    self.wfile.write(b"\0" * CHUNK)
+            elif parsed.path == "/chunked_huge.jpg":
+                self._headers(chunked=True)
+                for _ in range(MAX_BYTES * 10 // CHUNK):
+                    self.wfile.write(f"{CHUNK:x}\r\n".encode() + b"\0" * CHUNK + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+            elif parsed.path == "/wrong_type.jpg":
+                body = b"<html>not an image</html>"
+                self._headers(content_type="text/html; charset=utf-8", length=len(body))
+                self.wfile.write(body)
+            else:
+                self._headers(404, content_type="text/plain")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def start_server(host):
+    server = ThreadingHTTPServer((host, 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server():
+    server = start_server("127.0.0.1")
+    yield f"http://127.0.0.1:{server.server_address[1]}", server.server_address[1]
+    server.shutdown()
+
+
+@pytest.fixture
+def allowed_server():
+    """127.0.0.2 上的伺服器，轉址測試中視為外部位址（macOS 預設無法綁定，此時略過）。"""
+    try:
+        server = start_server("127.0.0.2")
+    except OSError:
+        pytest.skip("無法綁定 127.0.0.2")
+    yield f"http://127.0.0.2:{server.server_address[1]}"
+    server.shutdown()
+
+
+def fetch(url, **options):
+    options = {"max_bytes": MAX_BYTES, "allow_private": True, "total_timeout": 5, **options}
+
+    async def run():
+        fetcher = ImageFetcher(**options)
+        try:
+            return await fetcher.fetch(url)
+        finally:
+            await fetcher.close()
+
+    return asyncio.run(run())
+
+
+def test_valid_image(server):
+    base, _ = server
+    assert fetch(base + "/valid.jpg") == Handler.valid
+    assert fetch_image_sync(base + "/valid.jpg", max_bytes=MAX_BYTES, allow_private=True) == Handler.valid
+
+
+def test_redirect_is_followed(server):
+    base, _ = server
+    assert fetch(base + "/redirect?to=/valid.jpg", max_redirects=1) == Handler.valid
+
+
+def test_redirect_limit(server):
+    base, _ = server
+    with pytest.raises(ImageFetchError, match="轉址次數過多"):
+        fetch(base + "/redirect_loop.jpg")
+    with pytest.raises(ImageFetchError, match="轉址次數過多"):
+        fetch(base + "/redirect?to=/redirect?to=/valid.jpg", max_redirects=1)
+
+
+def test_private_address_is_rejected_without_connecting(server):
+    base, port = server
+    before = Handler.requests.get(port, 0)
+    with pytest.raises(ImageFetchError, match="內部網路"):
+        fetch(base + "/valid.jpg", allow_private=False)
+    with pytest.raises(ImageFetchError, match="內部網路"):
+        fetch_image_sync(base + "/valid.jpg", allow_private=False)
+    assert Handler.requests.get(port, 0) == before
+
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "localhost"])
+def test_redirect_to_a_blocked_address_is_rejected(server, allowed_server, host):
+    _, port = server
+    before = Handler.requests.get(port, 0)
+    url = f"{allowed_server}/redirect?to=http://{host}:{port}/valid.jpg"
+    with pytest.raises(ImageFetchError, match="內部網路"):
+        fetch(url, allow_private=False, is_blocked=lambda address: address != "127.0.0.2")
+    # 每一跳都重新檢查，被封鎖的伺服器不會收到請求
+    assert Handler.requests.get(port, 0) == before
+
+
+@pytest.mark.parametrize("path", ["/declared_huge.jpg", "/chunked_huge.jpg"])
+def test_size_cap(server, path):
+    base, _ = server
+    with pytest.raises(ImageFetchError, match="圖片過大"):
+        fetch(base + path)
+
+
+def test_content_type(server):
+    base, _ = server
+    with pytest.raises(ImageFetchError, match="不是支援的圖片格式"):
+        fetch(base + "/wrong_type.jpg")
+
+
+def test_unsupported_scheme():
+    with pytest.raises(ImageFetchError, match="只支援 http / https"):
+        fetch("file:///etc/passwd")
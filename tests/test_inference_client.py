@@ -0,0 +1,135 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import image_recognition
+import inference_client
+import inference_server
+from conftest import ROOT
+from inference_client import InferenceClient, InferenceTimeout, InferenceUnavailable
+from inference_server import InferenceServer
+
+
+@pytest.fixture
+def stalled_server(tmp_path):
+    """接受連線、讀取請求，但永遠不回應的推理服務（模擬忙碌中的服務）。"""
+    path = str(tmp_path / "stalled.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            connections.append(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield path
+    server.close()
+    for conn in connections:
+        conn.close()
+
+
+@pytest.fixture
+def running_server(tmp_path):
+    """在背景執行緒的事件迴圈中執行真正的 InferenceServer（不載入模型）。"""
+    path = str(tmp_path / "inference.sock")
+    server = InferenceServer(path)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def serve():
+        listener = await asyncio.start_unix_server(server.handle, path=path)
+        started.set()
+        async with listener:
+            await listener.serve_forever()
+
+    loop.create_task(serve())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    started.wait(5)
+    yield server
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture
+def local_fallback(monkeypatch):
+    calls = []
+    monkeypatch.setattr(inference_client, "INFERENCE_FALLBACK", True)
+    monkeypatch.setattr(image_recognition, "recognize_food_batch", lambda datas: calls.append(datas) or [[1.0]] * len(datas))
+    return calls
+
+
+def test_read_timeout_does_not_fall_back(monkeypatch, stalled_server, local_fallback):
+    monkeypatch.setattr(inference_client, "inference_client", InferenceClient(stalled_server, timeout=0.2))
+    with pytest.raises(InferenceTimeout):
+        inference_client.recognize_food_batch([b"image"])
+    assert local_fallback == []
+
+
+def test_refused_connection_falls_back(monkeypatch, tmp_path, local_fallback):
+    monkeypatch.setattr(inference_client, "inference_client", InferenceClient(str(tmp_path / "missing.sock"), timeout=0.2))
+    assert inference_client.recognize_food_batch([b"image"]) == [[1.0]]
+    assert local_fallback == [[b"image"]]
+
+
+def test_connect_error_is_unavailable(tmp_path):
+    with pytest.raises(InferenceUnavailable):
+        InferenceClient(str(tmp_path / "missing.sock")).health()
+
+
+def test_top_k_does_not_import_torch():
+    code = (
+        "import sys; sys.path.insert(0, 'core');"
+        "import inference_client;"
+        "from nutrition import NutritionTable;"
+        "table = NutritionTable.__new__(NutritionTable); table.labels = ['a', 'b', 'c'];"
+        "assert table.top_k([0.1, 0.7, 0.2], k=2, threshold=0.15) == [('b', 0.7), ('c', 0.2)], table.top_k([0.1, 0.7, 0.2]);"
+        "assert 'torch' not in sys.modules"
+    )
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONPATH"}
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+
+def test_payload_cap_fits_a_full_meal():
+    assert inference_server.MAX_PAYLOAD >= image_recognition.MAX_MEAL_IMAGES * image_recognition.MAX_IMAGE_BYTES
+
+
+def test_oversized_request_gets_an_error_reply(monkeypatch, running_server):
+    monkeypatch.setattr(inference_server, "MAX_PAYLOAD", 1024)
+    client = InferenceClient(running_server.path, timeout=5)
+    with pytest.raises(Exception, match="請求過大") as error:
+        client.recognize(b"x" * 4096)
+    assert not isinstance(error.value, InferenceUnavailable)
+    # 連線仍保持同步，可以繼續使用
+    assert client.health()["errors"] == 1
+    assert running_server.connections == 1
+
+
+def test_large_batches_are_split_per_meal(monkeypatch, running_server):
+    batches = []
+
+    def recognize_food_batch(datas):
+        batches.append(len(datas))
+        return [[float(len(data))] for data in datas]
+
+    monkeypatch.setattr(inference_server, "recognize_food_batch", recognize_food_batch)
+    datas = [b"x" * (i + 1) for i in range(image_recognition.MAX_MEAL_IMAGES + 2)]
+    results = InferenceClient(running_server.path, timeout=5).recognize_batch(datas)
+    assert results == [[float(i + 1)] for i in range(len(datas))]
+    assert batches == [image_recognition.MAX_MEAL_IMAGES, 2]
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import llm_gemini
+from conftest import FakeGeminiModel
+
+SQLITE_SECONDS = 0.2  # 假的慢速 SQLite 讀寫
+
+
+def test_cache_reads_and_writes_run_off_the_event_loop(fake_gemini, monkeypatch):
+    fake_gemini(FakeGeminiModel(delay=0.01))
+    threads = []
+    cache = llm_gemini.llm_cache
+    original_get, original_set = cache.get, cache.set
+
+    def slow(fn):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.current_thread())
+            time.sleep(SQLITE_SECONDS)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(cache, "get", slow(original_get))
+    monkeypatch.setattr(cache, "set", slow(original_set))
+    summary = [{"food": f"food_{uuid.uuid4().hex}", "calories": 100, "carbs": 10, "protein": 5, "fat": 2}]
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await llm_gemini.generate_diet_recommendation(summary, "healthy")  # 未命中：get + set
+        await llm_gemini.generate_diet_recommendation(summary, "healthy")  # 命中：get
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        return ticks, elapsed
+
+    ticks, elapsed = asyncio.run(run())
+    assert len(threads) == 3
+    assert all(thread is not threading.main_thread() for thread in threads)
+    # 事件迴圈在 SQLite 呼叫期間仍持續運作（在迴圈上執行時 ticker 幾乎不會前進）
+    assert ticks >= elapsed / 0.01 * 0.5
@@ -0,0 +1,88 @@
+import asyncio
+import uuid
+
+import llm_gemini
+from conftest import FakeGeminiModel
+from llm_client import LLMError
+
+CONCURRENCY = 10
+
+
+def unique_question():
+    return f"串流測試 {uuid.uuid4().hex}"
+
+
+async def collect(stream):
+    texts = []
+    async for text in stream:
+        texts.append(text)
+    return texts
+
+
+def test_concurrent_identical_streams_make_one_upstream_call(fake_gemini, monkeypatch):
+    model = FakeGeminiModel()
+    fake_gemini(model)
+    writes = []
+    original_set = llm_gemini.llm_cache.set
+    monkeypatch.setattr(llm_gemini.llm_cache, "set", lambda *args, **kwargs: (writes.append(args[1]), original_set(*args, **kwargs)))
+    question = unique_question()
+
+    async def run():
+        return await asyncio.gather(*(collect(llm_gemini.stream_answer(question)) for _ in range(CONCURRENCY)))
+
+    results = asyncio.run(run())
+    assert model.calls == 1
+    assert all(texts and texts[-1] == model.reply for texts in results)
+    # 跟隨者也會收到逐步累積的文字，而不是只有最後一次
+    assert max(len(texts) for texts in results) > 1
+    assert writes == [llm_gemini.question_cache_key(question)[1]]
+    assert llm_gemini.inflight_requests.inflight() == 0
+
+
+def test_stream_and_non_stream_callers_share_one_call(fake_gemini):
+    model = FakeGeminiModel()
+    fake_gemini(model)
+    question = unique_question()
+
+    async def run():
+        streamed = asyncio.ensure_future(collect(llm_gemini.stream_answer(question)))
+        await asyncio.sleep(0)
+        answer = await llm_gemini.answer_question(question)
+        return (await streamed)[-1], answer
+
+    assert asyncio.run(run()) == (model.reply, model.reply)
+    assert model.calls == 1
+
+
+def test_stream_error_reaches_every_subscriber_and_is_not_cached(fake_gemini):
+    model = FakeGeminiModel(error=ValueError("boom"))
+    fake_gemini(model)
+    question = unique_question()
+
+    async def run():
+        return await asyncio.gather(*(collect(llm_gemini.stream_answer(question)) for _ in range(CONCURRENCY)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, LLMError) for result in results)
+    assert model.calls == 1
+    assert llm_gemini.llm_cache.get(*llm_gemini.question_cache_key(question)[:2]) is None
+
+
+def test_subscriber_leaving_early_does_not_stop_others(fake_gemini):
+    model = FakeGeminiModel()
+    fake_gemini(model)
+    question = unique_question()
+
+    async def first_chunk_only():
+        stream = llm_gemini.stream_answer(question)
+        text = await stream.__anext__()
+        await stream.aclose()
+        return text
+
+    async def run():
+        return await asyncio.gather(first_chunk_only(), collect(llm_gemini.stream_answer(question)))
+
+    first, texts = asyncio.run(run())
+    assert model.reply.startswith(first)
+    assert texts[-1] == model.reply
+    assert model.calls == 1
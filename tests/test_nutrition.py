@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import nutrition
+from conftest import ROOT
+from nutrition import _compile, _load
+
+
+def write_csv(path, rows):
+    path.write_text("label,calories,carbs,protein,fat\n" + "".join(f"{label},{values}\n" for label, values in rows), encoding="utf-8")
+
+
+@pytest.fixture
+def files(tmp_path):
+    data = tmp_path / "nutrition.csv"
+    write_csv(data, [("pizza", "285,36,12,10"), ("sushi", "200,38,7,1")])
+    return str(data), str(tmp_path / "nutrition.npy"), str(tmp_path / "nutrition.labels.json")
+
+
+def test_compile_and_load(files):
+    labels, matrix = _load(*files)
+    assert labels == ["pizza", "sushi"]
+    assert matrix.tolist() == [[285, 36, 12, 10], [200, 38, 7, 1]]
+    assert not [name for name in os.listdir(os.path.dirname(files[0])) if name.endswith(".tmp")]
+
+
+def test_interrupted_compile_keeps_the_previous_files(files, monkeypatch):
+    data_file, matrix_file, labels_file = files
+    _compile(*files)
+    write_csv(Path(data_file), [("ramen", "450,60,18,15")])
+    save = np.save
+
+    def interrupted_save(file, array):
+        save(file, array[:0])  # 只寫了一部分就中斷
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(nutrition.np, "save", interrupted_save)
+    with pytest.raises(KeyboardInterrupt):
+        _compile(*files)
+    monkeypatch.undo()
+    assert np.load(matrix_file).tolist() == [[285, 36, 12, 10], [200, 38, 7, 1]]
+    # 矩陣比資料檔舊，下次載入時重新編譯
+    os.utime(data_file, (os.path.getmtime(matrix_file) + 1,) * 2)
+    assert _load(*files)[0] == ["ramen"]
+
+
+def test_prewarm_does_not_import_the_discord_handler():
+    code = "import sys; sys.path.insert(0, 'core'); import prewarm_recommendations; assert 'discord_handler' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
@@ -0,0 +1,54 @@
+import json
+from types import SimpleNamespace
+
+import transformers
+
+import image_recognition
+from recognition_cache import RecognitionCache, content_digest
+
+EAGER = {"model": "nateraw/food", "backend": "eager", "decode_size": 224, "cascade": False}
+INT8 = {**EAGER, "backend": "int8"}
+
+
+def saved_cache(path, fingerprint):
+    cache = RecognitionCache(path=path, fingerprint=fingerprint)
+    cache.put("digest", 0b1010, [0.9, 0.1])
+    cache.save()
+    return cache
+
+
+def test_cache_is_reused_with_the_same_settings(tmp_path):
+    path = str(tmp_path / "recognition_cache.json")
+    saved_cache(path, EAGER)
+    assert RecognitionCache(path=path, fingerprint=dict(EAGER)).get("digest") == [0.9, 0.1]
+
+
+def test_cache_is_discarded_when_settings_change(tmp_path):
+    path = str(tmp_path / "recognition_cache.json")
+    saved_cache(path, EAGER)
+    assert RecognitionCache(path=path, fingerprint=INT8).get("digest") is None
+    assert RecognitionCache(path=path, fingerprint={**EAGER, "cascade": True, "cascade_threshold": 0.8}).get("digest") is None
+
+
+def test_legacy_file_without_fingerprint_is_discarded(tmp_path):
+    path = tmp_path / "recognition_cache.json"
+    path.write_text(json.dumps({"entries": [["digest", "a", [0.9, 0.1]]]}), encoding="utf-8")
+    cache = RecognitionCache(path=str(path), fingerprint=EAGER)
+    assert cache.get("digest") is None
+    cache.put("other", 1, [0.5, 0.5])
+    cache.save()
+    assert json.loads(path.read_text(encoding="utf-8"))["fingerprint"] == EAGER
+
+
+def test_cache_hit_does_not_load_the_model(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("命中快取時不應載入模型")
+
+    cache = RecognitionCache(fingerprint=EAGER)
+    cache.put(content_digest(b"image"), 0b1010, [0.9, 0.1])
+    monkeypatch.setattr(image_recognition, "recognition_cache", cache)
+    monkeypatch.setattr(image_recognition, "class_labels", None)
+    monkeypatch.setattr(image_recognition, "get_model", fail)
+    monkeypatch.setattr(image_recognition.batcher, "predict_fn", fail)
+    monkeypatch.setattr(transformers.AutoConfig, "from_pretrained", lambda name: SimpleNamespace(id2label={0: "pizza", 1: "sushi"}))
+    assert image_recognition.analyze_food_bytes(b"image") == {"pizza": 0.9, "sushi": 0.1}
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+import llm_gemini
+from conftest import FakeGeminiModel
+from semantic_cache import QuestionIndex
+
+CACHED = ["糖尿病可以吃香蕉嗎", "牛奶有多少蛋白質", "牛奶可以每天喝嗎", "地瓜適合減肥嗎", "一天要喝多少水", "雞胸肉的蛋白質有多少"]
+
+
+@pytest.fixture
+def index():
+    index = QuestionIndex()
+    for question in CACHED:
+        index.add(question, question)
+    return index
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("糖尿病能吃香蕉嗎", "糖尿病可以吃香蕉嗎"),
+    ("每天喝牛奶可以嗎", "牛奶可以每天喝嗎"),
+    ("地瓜適合減重嗎", "地瓜適合減肥嗎"),
+    ("雞胸肉蛋白質有多少", "雞胸肉的蛋白質有多少"),
+])
+def test_paraphrases_match(index, query, expected):
+    assert index.search(query)[0] == expected
+
+
+@pytest.mark.parametrize("query", [
+    "糖尿病不可以吃香蕉嗎",
+    "牛奶沒有多少蛋白質嗎",
+    "牛奶不可以每天喝嗎",
+    "地瓜不適合減肥嗎",
+    "一天要喝多少咖啡",
+    "雞腿肉蛋白質多少",
+])
+def test_negated_or_different_subjects_do_not_match(index, query):
+    assert index.search(query) is None
+
+
+def test_question_index_is_built_in_the_background(monkeypatch, fake_gemini):
+    model = FakeGeminiModel(delay=0.01)
+    fake_gemini(model)
+    monkeypatch.setattr(llm_gemini, "question_index", None)
+    monkeypatch.setattr(llm_gemini, "_question_index_task", None)
+    monkeypatch.setattr(llm_gemini, "_pending_questions", [])
+    food = f"測試食物{uuid.uuid4().hex[:6]}"
+    build_threads = []
+    build = llm_gemini.build_question_index
+
+    def recording_build():
+        build_threads.append(threading.current_thread())
+        return build()
+
+    monkeypatch.setattr(llm_gemini, "build_question_index", recording_build)
+
+    async def run():
+        # 索引還沒建立：第一次提問直接呼叫模型，並在背景開始建立索引
+        await llm_gemini.answer_question(f"{food}的熱量是多少")
+        await llm_gemini.start_question_index()
+        # 索引建立後，換句話說的問題命中快取
+        return await llm_gemini.answer_question(f"請問{food}熱量多少？")
+
+    assert asyncio.run(run()) == model.reply
+    assert model.calls == 1
+    assert build_threads and build_threads[0] is not threading.main_thread()
@@ -0,0 +1,138 @@
+import asyncio
+import random
+import threading
+
+import pytest
+
+from session_store import SessionStore
+
+
+TTL = 60
+SWEEP_INTERVAL = 30
+RATE = 20  # 每個模擬秒開始引導流程的使用者數
+
+
+class SimulatedClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingStore(SessionStore):
+    """記錄每次實際寫檔時所在的執行緒。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.save_threads = []
+
+    def save(self):
+        if self._dirty:
+            self.save_threads.append(threading.current_thread())
+        super().save()
+
+
+def test_writes_are_debounced_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "sessions.json")
+    store = RecordingStore(path=path, save_delay=0.05)
+
+    async def run():
+        for i in range(100):
+            store.set(str(i), {"step": "height", "user_name": f"user{i}"})
+        store.pop("0")
+        assert store.save_threads == []  # set / pop 不在事件迴圈上寫檔
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    assert len(store.save_threads) == 1
+    assert store.save_threads[0] is not threading.main_thread()
+    restarted = SessionStore(path=path)
+    assert len(restarted) == 99
+    assert restarted.get("1") == {"step": "height", "user_name": "user1"}
+
+
+def test_flush_writes_pending_changes(tmp_path):
+    path = str(tmp_path / "sessions.json")
+    store = SessionStore(path=path, save_delay=60)
+
+    async def run():
+        store.set("a", {"step": "height", "user_name": "a"})
+        store.flush()
+
+    asyncio.run(run())
+    assert SessionStore(path=path).get("a") == {"step": "height", "user_name": "a"}
+
+
+def test_sessions_expire_after_ttl():
+    clock = SimulatedClock()
+    store = SessionStore(ttl=TTL, clock=clock)
+    store.set("old", {"step": "height"})
+    clock.now += TTL / 2
+    store.set("new", {"step": "weight"})
+    clock.now += TTL / 2
+    assert store.get("old") is None
+    assert store.get("new") == {"step": "weight"}
+    clock.now += TTL / 2
+    assert store.sweep() == 1
+    assert len(store) == 0
+
+
+def test_cap_evicts_the_session_closest_to_expiry():
+    clock = SimulatedClock()
+    store = SessionStore(ttl=TTL, max_entries=3, clock=clock)
+    for i in range(5):
+        store.set(str(i), {"step": "height"})
+        clock.now += 1
+    assert len(store) == 3
+    assert store.get("0") is None and store.get("1") is None
+    assert store.get("4") == {"step": "height"}
+
+
+def churn(store, clock, seconds=600, complete=0.3, seed=0):
+    """
+    每秒 RATE 位使用者開始填寫身高，complete 比例在期限內完成，其餘中途放棄。
+
+    回傳 (SessionStore 的最大項目數, 舊做法 dict 最後留下的項目數)。
+    """
+    rng = random.Random(seed)
+    legacy, finishing, peak = {}, [], 0
+    for second in range(seconds):
+        clock.now += 1
+        for i in range(RATE):
+            user_id = f"{second}-{i}"
+            store.set(user_id, {"step": "height"})
+            legacy[user_id] = True
+            if rng.random() < complete:
+                finishing.append((clock.now + rng.uniform(1, TTL * 0.9), user_id))
+        for done_at, user_id in [item for item in finishing if item[0] <= clock.now]:
+            legacy.pop(user_id)
+            store.pop(user_id)
+        finishing = [item for item in finishing if item[0] > clock.now]
+        if second % SWEEP_INTERVAL == 0:
+            store.sweep()
+        peak = max(peak, len(store))
+    return peak, len(legacy)
+
+
+@pytest.mark.parametrize("max_entries", [10_000, 500])
+def test_abandoned_sessions_stay_bounded(max_entries):
+    clock = SimulatedClock()
+    peak, legacy = churn(SessionStore(ttl=TTL, max_entries=max_entries, clock=clock), clock)
+    bound = min(max_entries, RATE * (TTL + SWEEP_INTERVAL))
+    assert peak <= bound
+    assert legacy > bound  # 只在完成時刪除的 dict 會一直累積
+
+
+def test_restart_keeps_only_unexpired_sessions(tmp_path):
+    clock = SimulatedClock()
+    path = str(tmp_path / "sessions.json")
+    store = SessionStore(ttl=TTL, path=path, clock=clock)
+    store.set("old", {"step": "height", "user_name": "old"})
+    clock.now += TTL / 2
+    store.set("new", {"step": "weight", "user_name": "new", "height": 170})
+    store.flush()
+    clock.now += TTL / 2 + 1
+    restarted = SessionStore(ttl=TTL, path=path, clock=clock)
+    assert restarted.get("old") is None
+    assert restarted.get("new") == {"step": "weight", "user_name": "new", "height": 170}
@@ -0,0 +1,114 @@
+import asyncio
+import uuid
+
+import pytest
+
+import llm_gemini
+from conftest import FakeGeminiModel
+from llm_client import LLMError
+from singleflight import SingleFlight
+
+CONCURRENCY = 10
+
+
+def unique_question():
+    # 每個測試使用不同的問題，避免命中前一個測試寫入的快取或相似問題
+    return f"測試問題 {uuid.uuid4().hex}"
+
+
+def test_concurrent_identical_questions_make_one_upstream_call(fake_gemini):
+    model = FakeGeminiModel()
+    client = fake_gemini(model)
+    question = unique_question()
+
+    async def run():
+        return await asyncio.gather(*(llm_gemini.answer_question(question) for _ in range(CONCURRENCY)))
+
+    answers = asyncio.run(run())
+    assert answers == [model.reply] * CONCURRENCY
+    assert model.calls == 1
+    assert client.requests == 1
+    assert llm_gemini.llm_cache.get(*llm_gemini.question_cache_key(question)[:2]) == model.reply
+
+
+def test_concurrent_identical_recommendations_make_one_upstream_call(fake_gemini):
+    model = FakeGeminiModel()
+    fake_gemini(model)
+    summary = [{"food": f"food_{uuid.uuid4().hex}", "calories": 100, "carbs": 10, "protein": 5, "fat": 2}]
+
+    async def run():
+        return await asyncio.gather(*(llm_gemini.generate_diet_recommendation(summary, "healthy") for _ in range(CONCURRENCY)))
+
+    assert asyncio.run(run()) == [model.reply] * CONCURRENCY
+    assert model.calls == 1
+
+
+def test_error_propagates_to_all_callers_and_is_not_cached(fake_gemini):
+    failing = FakeGeminiModel(error=ValueError("boom"))
+    fake_gemini(failing)
+    question = unique_question()
+
+    async def run():
+        return await asyncio.gather(*(llm_gemini.answer_question(question) for _ in range(CONCURRENCY)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, LLMError) for result in results)
+    assert failing.calls == 1
+    assert llm_gemini.llm_cache.get(*llm_gemini.question_cache_key(question)[:2]) is None
+    assert llm_gemini.inflight_requests.inflight() == 0
+
+    # 下一次呼叫重新送出請求，不會拿到失敗結果
+    model = FakeGeminiModel()
+    fake_gemini(model)
+    assert asyncio.run(llm_gemini.answer_question(question)) == model.reply
+    assert model.calls == 1
+
+
+def test_cancelled_waiter_does_not_affect_others():
+    flight = SingleFlight()
+    calls = 0
+
+    async def slow():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", slow))
+        other = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader, await other
+
+    assert asyncio.run(run()) == ("ok", "ok")
+    assert calls == 1
+
+
+def test_cancelled_leader_does_not_affect_waiters():
+    flight = SingleFlight()
+    calls = 0
+
+    async def slow():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flight.do("key", slow)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert calls == 1
+    assert flight.inflight() == 0